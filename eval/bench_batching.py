@@ -0,0 +1,76 @@
+"""Throughput of the in-process batching scheduler versus max batch size.
+
+Uses a small randomly initialized GPT-2 so it runs offline on CPU:
+
+    python eval/bench_batching.py --requests 32 --batch-sizes 1,2,4,8
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from concurrent.futures import wait
+from typing import Dict, List
+
+from serving.batching import BatchScheduler, GreedyBatchGenerator
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Dynamic batching throughput benchmark")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--batch-sizes", type=str, default="1,2,4,8,16")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--prompt-tokens", type=int, default=128)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def build_model(layers: int, hidden: int, positions: int):
+    from transformers import GPT2Config, GPT2LMHeadModel  # type: ignore
+
+    config = GPT2Config(
+        n_layer=layers, n_head=4, n_embd=hidden, vocab_size=2048, n_positions=positions
+    )
+    return GPT2LMHeadModel(config).eval()
+
+
+def run(args: argparse.Namespace, model, batch_size: int) -> Dict[str, float]:
+    rng = random.Random(args.seed)
+    scheduler = BatchScheduler(
+        GreedyBatchGenerator(model, eos_token_id=None, pad_token_id=0),
+        max_batch_size=batch_size,
+        max_wait_ms=args.max_wait_ms,
+    )
+    prompts: List[List[int]] = [
+        [rng.randrange(1, 2048) for _ in range(rng.randint(args.prompt_tokens // 2, args.prompt_tokens))]
+        for _ in range(args.requests)
+    ]
+    # Mixed budgets exercise early exit of finished rows.
+    budgets = [rng.randint(args.max_new_tokens // 4, args.max_new_tokens) for _ in prompts]
+    start = time.perf_counter()
+    futures = [scheduler.submit(p, n) for p, n in zip(prompts, budgets)]
+    wait(futures)
+    elapsed = time.perf_counter() - start
+    scheduler.close()
+    tokens = sum(len(f.result().token_ids) for f in futures)
+    return {
+        "batch_size": batch_size,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(args.requests / elapsed, 2),
+        "tokens_per_s": round(tokens / elapsed, 1),
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    model = build_model(args.layers, args.hidden, args.prompt_tokens + args.max_new_tokens)
+    rows = [run(args, model, int(size)) for size in args.batch_sizes.split(",")]
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
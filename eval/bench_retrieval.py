@@ -0,0 +1,132 @@
+"""Retrieval scaling benchmark on a synthetic runbook corpus.
+
+    python eval/bench_retrieval.py --chunks 1000,10000,100000 --embedders mock,hashing
+
+For each corpus size, embedder and index type it records: chunking
+throughput, index build time, load time, the RSS added by the loaded index,
+query latency percentiles and recall@k against each synthetic incident's
+source chunk. Results are written as JSON under
+``<artifact-dir>/bench/``.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import resource
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from incident_copilot import DEFAULT_ARTIFACT_DIR
+from rag.chunking import load_markdown_chunks
+from rag.retriever import INDEX_TYPES, Retriever, get_embedder, persist_index
+from rag.synthetic import SyntheticCorpus, SyntheticCorpusConfig
+from eval.metrics import latency_summary
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Retrieval scaling benchmark")
+    parser.add_argument("--chunks", type=str, default="1000,10000", help="Target corpus sizes in chunks")
+    parser.add_argument("--embedders", type=str, default="mock,hashing")
+    parser.add_argument("--index-types", type=str, default=",".join(INDEX_TYPES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--artifact-dir", type=Path, default=Path(DEFAULT_ARTIFACT_DIR))
+    return parser.parse_args()
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:  # pragma: no cover - non-Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def bench_index(
+    chunks, incidents: List[Dict], embedder_name: str, index_type: str, k: int, work_dir: Path
+) -> Dict[str, object]:
+    embedder = get_embedder(embedder_name)
+    index_dir = work_dir / f"{embedder_name}-{index_type}"
+
+    start = time.perf_counter()
+    persist_index(chunks, embedder, artifact_dir=index_dir, index_type=index_type)
+    build_s = time.perf_counter() - start
+
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    retriever = Retriever.load(index_dir)
+    load_s = time.perf_counter() - start
+    rss_after = rss_bytes()
+
+    latencies: List[float] = []
+    hits = 0
+    for incident in incidents:
+        query = f"{incident['alert_text']}\n{incident['logs_text']}"
+        start = time.perf_counter()
+        results = retriever.retrieve(query, k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids = {chunk.id for chunk, _ in results}
+        hits += bool(ids & set(incident["expected_chunk_ids"]))
+
+    return {
+        "embedder": embedder_name,
+        "index_type": index_type,
+        "build_s": round(build_s, 4),
+        "build_chunks_per_s": round(len(chunks) / build_s, 1) if build_s else None,
+        "load_s": round(load_s, 4),
+        "rss_delta_mb": round((rss_after - rss_before) / 2**20, 2),
+        "query_latency_ms": latency_summary(latencies),
+        f"recall_at_{k}": hits / len(incidents) if incidents else 0.0,
+    }
+
+
+def bench_size(target_chunks: int, args: argparse.Namespace, work_dir: Path) -> Dict[str, object]:
+    corpus = SyntheticCorpus(SyntheticCorpusConfig(seed=args.seed))
+    # Probe a few runbooks to estimate chunks per runbook for the target size.
+    probe_dir = work_dir / "probe"
+    corpus.write_runbooks(probe_dir, 20)
+    per_runbook = max(len(load_markdown_chunks(probe_dir)) / 20, 1.0)
+    runbook_dir = work_dir / "runbooks"
+    corpus.write_runbooks(runbook_dir, max(math.ceil(target_chunks / per_runbook), 1))
+
+    start = time.perf_counter()
+    chunks = load_markdown_chunks(runbook_dir)
+    chunk_s = time.perf_counter() - start
+    incidents = corpus.incidents(chunks, args.queries)
+
+    runs = [
+        bench_index(chunks, incidents, embedder, index_type, args.k, work_dir)
+        for embedder in args.embedders.split(",")
+        for index_type in args.index_types.split(",")
+    ]
+    return {
+        "target_chunks": target_chunks,
+        "chunks": len(chunks),
+        "chunking_s": round(chunk_s, 4),
+        "chunking_chunks_per_s": round(len(chunks) / chunk_s, 1) if chunk_s else None,
+        "runs": runs,
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    results = []
+    for size in args.chunks.split(","):
+        with tempfile.TemporaryDirectory(prefix="bench-retrieval-") as tmp:
+            results.append(bench_size(int(size), args, Path(tmp)))
+            print(json.dumps(results[-1], indent=2))
+
+    out_dir = args.artifact_dir / "bench"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = out_dir / f"retrieval-{int(time.time())}.json"
+    out_path.write_text(json.dumps({"seed": args.seed, "k": args.k, "results": results}, indent=2))
+    print(f"Wrote retrieval benchmark to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Diff two eval reports and fail on latency or quality regressions.
+
+    python eval/compare_reports.py baseline.json candidate.json --latency-tolerance 0.1
+
+Exits 1 when any gated metric regresses beyond its tolerance, so it can
+gate a rollout in CI.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+# Quality metrics where a lower value is better; every other rate is higher-is-better.
+LOWER_IS_BETTER = {"hallucination_flag_rate", "failed_sample_rate"}
+DEFAULT_GATED_PERCENTILES = ("p50", "p99")
+
+
+@dataclass
+class Delta:
+    name: str
+    baseline: float
+    candidate: float
+    regressed: bool
+
+    @property
+    def change(self) -> float:
+        return self.candidate - self.baseline
+
+
+def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare two offline eval reports")
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument(
+        "--latency-tolerance",
+        type=float,
+        default=0.10,
+        help="Allowed relative latency increase (0.1 = 10%%)",
+    )
+    parser.add_argument(
+        "--min-latency-delta-ms",
+        type=float,
+        default=1.0,
+        help="Ignore latency increases smaller than this many milliseconds",
+    )
+    parser.add_argument(
+        "--quality-tolerance",
+        type=float,
+        default=0.02,
+        help="Allowed absolute drop in quality rates",
+    )
+    parser.add_argument(
+        "--percentiles",
+        type=str,
+        default=",".join(DEFAULT_GATED_PERCENTILES),
+        help="Latency statistics to gate on, e.g. p50,p90,p99,max",
+    )
+    return parser.parse_args(argv)
+
+
+def compare_reports(
+    baseline: Dict,
+    candidate: Dict,
+    latency_tolerance: float = 0.10,
+    min_latency_delta_ms: float = 1.0,
+    quality_tolerance: float = 0.02,
+    percentiles: Sequence[str] = DEFAULT_GATED_PERCENTILES,
+) -> List[Delta]:
+    deltas: List[Delta] = []
+    for name, base in baseline.get("metrics", {}).items():
+        if name not in candidate.get("metrics", {}) or not name.endswith("_rate"):
+            continue
+        cand = candidate["metrics"][name]
+        drop = cand - base if name in LOWER_IS_BETTER else base - cand
+        deltas.append(Delta(name, base, cand, drop > quality_tolerance))
+
+    base_latency = baseline.get("latency_ms", {})
+    cand_latency = candidate.get("latency_ms", {})
+    for stage in sorted(set(base_latency) & set(cand_latency)):
+        for stat in percentiles:
+            if stat not in base_latency[stage] or stat not in cand_latency[stage]:
+                continue
+            base, cand = base_latency[stage][stat], cand_latency[stage][stat]
+            increase = cand - base
+            regressed = increase > min_latency_delta_ms and increase > base * latency_tolerance
+            deltas.append(Delta(f"latency.{stage}.{stat}", base, cand, regressed))
+    return deltas
+
+
+def format_deltas(deltas: Sequence[Delta]) -> str:
+    width = max((len(d.name) for d in deltas), default=10)
+    lines = [f"{'metric'.ljust(width)}  {'baseline':>12}  {'candidate':>12}  {'change':>10}"]
+    for d in deltas:
+        flag = "  REGRESSION" if d.regressed else ""
+        lines.append(
+            f"{d.name.ljust(width)}  {d.baseline:12.4f}  {d.candidate:12.4f}  {d.change:+10.4f}{flag}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = parse_args(argv)
+    deltas = compare_reports(
+        json.loads(args.baseline.read_text()),
+        json.loads(args.candidate.read_text()),
+        latency_tolerance=args.latency_tolerance,
+        min_latency_delta_ms=args.min_latency_delta_ms,
+        quality_tolerance=args.quality_tolerance,
+        percentiles=[p.strip() for p in args.percentiles.split(",") if p.strip()],
+    )
+    print(format_deltas(deltas))
+    regressions = [d.name for d in deltas if d.regressed]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from typing import Dict, List, Set
+from typing import Dict, List, Sequence, Set
+
+import numpy as np
 
 from serving.schemas import TriageResponse
 from tools.validators import ensure_valid_tool_call
@@ -65,3 +67,17 @@ def aggregate_metrics(
         "hallucination_flag_rate": hallucination_flag_rate(responses),
         "groundedness_rate": groundedness_rate(responses),
     }
+
+
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+def latency_summary(values_ms: Sequence[float]) -> Dict[str, float]:
+    """p50/p90/p99, max and mean of a latency sample, in milliseconds."""
+    if not len(values_ms):
+        return {**{f"p{p}": 0.0 for p in LATENCY_PERCENTILES}, "max": 0.0, "avg": 0.0}
+    values = np.asarray(values_ms, dtype=np.float64)
+    summary = {f"p{p}": float(v) for p, v in zip(LATENCY_PERCENTILES, np.percentile(values, LATENCY_PERCENTILES))}
+    summary["max"] = float(values.max())
+    summary["avg"] = float(values.mean())
+    return summary
@@ -3,18 +3,23 @@ from __future__ import annotations
 import argparse
 import json
 import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 from pathlib import Path
 from statistics import mean
-from typing import List, Tuple
+from typing import Dict, Iterator, List, Sequence, Set, Tuple
 
 from incident_copilot import DEFAULT_ARTIFACT_DIR
-from rag.chunking import load_markdown_chunks
+from rag.chunking import Chunk, load_markdown_chunks
 from rag.retriever import Retriever, get_embedder, persist_index
-from serving.model_client import get_model_client
+from serving.model_client import BaseModelClient, get_model_client
 from serving.schemas import IncidentRequest, TriageResponse
+from tools.log_templates import compact_incident_logs
 from tools.promql_tool import PromQLTool
-from eval.metrics import aggregate_metrics
+from tools.validators import ensure_valid_tool_call
+from eval.metrics import aggregate_metrics, latency_summary
+
+STAGES = ("generation", "tool_validation")
 
 
 def parse_args() -> argparse.Namespace:
@@ -28,6 +33,17 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--artifact-dir", type=Path, default=Path(DEFAULT_ARTIFACT_DIR))
     parser.add_argument("--limit", type=int, default=0, help="Limit number of samples")
     parser.add_argument("--model-mode", type=str, default="mock")
+    parser.add_argument("--concurrency", type=int, default=8, help="Samples generated in parallel")
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per retrieval batch")
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        default=None,
+        help="Per-sample JSONL results (default: <artifact-dir>/eval_reports/checkpoint-<data>.jsonl)",
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="Skip samples already present in the checkpoint"
+    )
     return parser.parse_args()
 
 
@@ -41,61 +57,209 @@ def ensure_retriever(artifact_dir: Path) -> Retriever:
         return Retriever.load(artifact_dir)
 
 
+def iter_incidents(path: Path, limit: int = 0) -> Iterator[IncidentRequest]:
+    with path.open() as f:
+        for idx, line in enumerate(f):
+            if limit and idx >= limit:
+                break
+            if line.strip():
+                yield compact_incident_logs(IncidentRequest(**json.loads(line)))
+
+
+def load_checkpoint(path: Path) -> List[dict]:
+    """Completed sample records; a torn last line from a crash is ignored."""
+    records: List[dict] = []
+    if not path.exists():
+        return records
+    with path.open() as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def _truncate_torn_tail(path: Path) -> None:
+    """Cut a partially written last line so appended records start cleanly."""
+    if not path.exists():
+        return
+    data = path.read_bytes()
+    if data and not data.endswith(b"\n"):
+        with path.open("r+b") as f:
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def _batched(items: Iterator[IncidentRequest], size: int) -> Iterator[List[IncidentRequest]]:
+    batch: List[IncidentRequest] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def run_sample(
     incident: IncidentRequest,
+    retrieved: Sequence[Tuple[Chunk, float]],
+    model_client: BaseModelClient,
+    tool: PromQLTool,
+) -> Tuple[TriageResponse, float, Dict[str, float]]:
+    """Generate one response; returns it with its measured latency and per-stage times."""
+    start = time.perf_counter()
+    response = model_client.generate(incident, retrieved, tool)
+    generated = time.perf_counter()
+    for call in response.tool_calls:
+        try:
+            ensure_valid_tool_call(call.arguments)
+        except Exception:
+            continue
+    validated = time.perf_counter()
+    return response, (validated - start) * 1000, {
+        "generation_ms": (generated - start) * 1000,
+        "tool_validation_ms": (validated - generated) * 1000,
+    }
+
+
+def run_eval(
+    data: Path,
     retriever: Retriever,
     model_mode: str,
-) -> Tuple[TriageResponse, float]:
+    checkpoint: Path,
+    concurrency: int = 8,
+    batch_size: int = 32,
+    resume: bool = False,
+    limit: int = 0,
+) -> Dict[str, object]:
+    """Evaluate ``data`` with bounded concurrency, streaming results to ``checkpoint``.
+
+    Retrieval runs one embedding + index search per batch of incidents, so
+    its cost is only known per batch: each record carries its batch's id and
+    time (reported as the ``retrieval`` latency distribution) and its
+    amortized share. Generation fans out over a thread pool. Each
+    finished sample is appended to the checkpoint immediately, so an
+    interrupted run loses at most the samples in flight and ``resume`` picks up
+    where it stopped. A sample that raises is recorded with its error and
+    retried on resume.
+    """
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    if resume:
+        _truncate_torn_tail(checkpoint)
+    done_ids: Set[str] = (
+        {r["incident_id"] for r in load_checkpoint(checkpoint) if "error" not in r} if resume else set()
+    )
     model_client = get_model_client(model_mode)
     tool = PromQLTool(mode="mock")
-    start = time.perf_counter()
-    retrieved = retriever.retrieve(f"{incident.alert_text}\n{incident.logs_text}", k=3)
-    response = model_client.generate(incident, retrieved, tool)
-    latency_ms = (time.perf_counter() - start) * 1000
-    return response, latency_ms
+    todo = (i for i in iter_incidents(data, limit) if i.incident_id not in done_ids)
 
+    with checkpoint.open("a" if resume else "w") as out, ThreadPoolExecutor(
+        max_workers=concurrency
+    ) as pool:
+        pending: Dict[Future, Tuple[IncidentRequest, Dict[str, object], float]] = {}
+        # Batch ids stay unique across resumed runs appending to one checkpoint.
+        run_id = time.time_ns()
 
-def main() -> None:
-    args = parse_args()
-    retriever = ensure_retriever(args.artifact_dir)
-    responses: List[TriageResponse] = []
-    latencies: List[float] = []
-    per_sample: List[dict] = []
+        def drain(block_until: int) -> None:
+            while len(pending) > block_until:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    incident, retrieval, amortized_ms = pending.pop(future)
+                    record: Dict[str, object] = {
+                        "incident_id": incident.incident_id,
+                        "retrieval_batch": retrieval,
+                        "retrieval_amortized_ms": amortized_ms,
+                    }
+                    try:
+                        response, latency_ms, stages = future.result()
+                    except Exception as exc:
+                        record["error"] = f"{type(exc).__name__}: {exc}"
+                    else:
+                        record.update(
+                            latency_ms=latency_ms, stages=stages, response=response.model_dump(mode="json")
+                        )
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
 
-    with args.data.open() as f:
-        for idx, line in enumerate(f):
-            if args.limit and idx >= args.limit:
-                break
-            sample = json.loads(line)
-            incident = IncidentRequest(**sample)
-            resp, latency_ms = run_sample(incident, retriever, args.model_mode)
-            responses.append(resp)
-            latencies.append(latency_ms)
-            per_sample.append(
-                {
-                    "incident_id": incident.incident_id,
-                    "tool_calls": len(resp.tool_calls),
-                    "citations": resp.citations,
-                    "latency_ms": latency_ms,
-                }
+        for index, batch in enumerate(_batched(todo, batch_size)):
+            start = time.perf_counter()
+            retrieved = retriever.retrieve_batch(
+                [f"{incident.alert_text}\n{incident.logs_text}" for incident in batch], k=3
             )
+            retrieval_ms = (time.perf_counter() - start) * 1000
+            retrieval: Dict[str, object] = {"id": f"{run_id}-{index}", "ms": retrieval_ms, "size": len(batch)}
+            for incident, chunks in zip(batch, retrieved):
+                # Keep a bounded queue ahead of the workers instead of the whole set.
+                drain(block_until=2 * concurrency)
+                future = pool.submit(run_sample, incident, chunks, model_client, tool)
+                pending[future] = (incident, retrieval, retrieval_ms / len(batch))
+        drain(block_until=0)
 
+    return build_report(load_checkpoint(checkpoint), model_mode)
+
+
+def build_report(records: List[dict], model_mode: str) -> Dict[str, object]:
+    # A sample retried on resume appears twice; its latest record wins.
+    latest = list({r["incident_id"]: r for r in records}.values())
+    failed = [r for r in latest if "error" in r]
+    records = [r for r in latest if "error" not in r]
+    responses = [TriageResponse.model_validate(r["response"]) for r in records]
+    latencies = [r["latency_ms"] for r in records]
+    amortized = [r["retrieval_amortized_ms"] for r in latest if "retrieval_amortized_ms" in r]
     metrics = aggregate_metrics(responses)
     metrics["response_latency_ms_avg"] = mean(latencies) if latencies else 0.0
-
-    report = {
+    metrics["retrieval_amortized_ms_avg"] = mean(amortized) if amortized else 0.0
+    metrics["failed_sample_rate"] = len(failed) / len(latest) if latest else 0.0
+    # "total" is each sample's own generation + validation time; retrieval is
+    # batched, so it is a separate distribution over whole batches.
+    latency = {"total": latency_summary(latencies)}
+    for stage in STAGES:
+        values = [r["stages"][f"{stage}_ms"] for r in records if f"{stage}_ms" in r.get("stages", {})]
+        latency[stage] = latency_summary(values)
+    batches = {r["retrieval_batch"]["id"]: r["retrieval_batch"]["ms"] for r in latest if "retrieval_batch" in r}
+    latency["retrieval"] = latency_summary(list(batches.values()))
+    samples = [
+        {
+            "incident_id": r["incident_id"],
+            "tool_calls": len(resp.tool_calls),
+            "citations": resp.citations,
+            "latency_ms": r["latency_ms"],
+            "stages": r.get("stages", {}),
+        }
+        for r, resp in zip(records, responses)
+    ]
+    return {
         "timestamp": datetime.now(timezone.utc).isoformat(),
-        "samples": per_sample,
+        "samples": samples,
+        "failed": [{"incident_id": r["incident_id"], "error": r["error"]} for r in failed],
         "metrics": metrics,
-        "model_mode": args.model_mode,
+        "latency_ms": latency,
+        "model_mode": model_mode,
     }
 
+
+def main() -> None:
+    args = parse_args()
+    retriever = ensure_retriever(args.artifact_dir)
     out_dir = args.artifact_dir / "eval_reports"
+    checkpoint = args.checkpoint or out_dir / f"checkpoint-{args.data.stem}.jsonl"
+    report = run_eval(
+        args.data,
+        retriever,
+        args.model_mode,
+        checkpoint,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        resume=args.resume,
+        limit=args.limit,
+    )
+
     out_dir.mkdir(parents=True, exist_ok=True)
     out_path = out_dir / f"report-{int(time.time())}.json"
     out_path.write_text(json.dumps(report, indent=2))
     print(f"Wrote eval report to {out_path}")
-    print(json.dumps(metrics, indent=2))
+    print(json.dumps({"metrics": report["metrics"], "latency_ms": report["latency_ms"]}, indent=2))
 
 
 if __name__ == "__main__":
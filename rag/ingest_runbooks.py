@@ -5,7 +5,7 @@ import logging
 from pathlib import Path
 
 from rag.chunking import load_markdown_chunks
-from rag.retriever import DEFAULT_ARTIFACT_DIR, get_embedder, persist_index
+from rag.retriever import DEFAULT_ARTIFACT_DIR, INDEX_TYPES, get_embedder, persist_index
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
@@ -30,6 +30,12 @@ def parse_args() -> argparse.Namespace:
         default="mock",
         help="SentenceTransformer model name or 'mock' for offline deterministic embeddings.",
     )
+    parser.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        default="flat",
+        help="FAISS index type: exact flat L2, IVF or HNSW.",
+    )
     parser.add_argument(
         "--max-words",
         type=int,
@@ -47,7 +53,7 @@ def main() -> None:
 
     embedder = get_embedder(args.embedding_model)
     logging.info("Using embedding model %s (dim=%s)", embedder.name, embedder.dim)
-    persist_index(chunks, embedder, artifact_dir=args.artifact_dir)
+    persist_index(chunks, embedder, artifact_dir=args.artifact_dir, index_type=args.index_type)
     logging.info("Artifacts saved to %s", args.artifact_dir)
 
 
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rag.chunking import Chunk
+from rag.retriever import (
+    CHUNKS_FILE,
+    DEFAULT_ARTIFACT_DIR,
+    INDEX_FILE,
+    META_FILE,
+    Retriever,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTION = "default"
+DEFAULT_MEMORY_BUDGET_MB = 512
+# Reciprocal-rank fusion constant (Cormack et al.); damps the weight of the very top ranks.
+RRF_K = 60
+
+
+def parse_collections(spec: str) -> Dict[str, Path]:
+    """Parse ``name=path,name=path`` into a collection mapping."""
+    collections: Dict[str, Path] = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, sep, path = entry.partition("=")
+        if not sep or not name.strip() or not path.strip():
+            raise ValueError(f"Invalid collection entry '{entry}', expected name=path")
+        collections[name.strip()] = Path(path.strip())
+    return collections
+
+
+def estimate_bundle_bytes(artifact_dir: Path) -> int:
+    """Approximate resident size of a loaded bundle from its on-disk artifacts."""
+    total = 0
+    for name in (INDEX_FILE, CHUNKS_FILE, META_FILE):
+        path = artifact_dir / name
+        if path.exists():
+            total += path.stat().st_size
+    return total
+
+
+class CollectionRegistry:
+    """Named runbook collections, loaded lazily and evicted LRU under a memory budget."""
+
+    def __init__(
+        self,
+        collections: Dict[str, Path],
+        memory_budget_bytes: int = DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024,
+        max_workers: int = 4,
+    ):
+        self.collections = dict(collections)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_workers = max_workers
+        self._loaded: "OrderedDict[str, Tuple[Retriever, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, default_dir: Path = DEFAULT_ARTIFACT_DIR) -> "CollectionRegistry":
+        collections = {DEFAULT_COLLECTION: Path(default_dir)}
+        collections.update(parse_collections(os.getenv("RAG_COLLECTIONS", "")))
+        budget_mb = int(os.getenv("RAG_MEMORY_BUDGET_MB", str(DEFAULT_MEMORY_BUDGET_MB)))
+        return cls(collections, memory_budget_bytes=budget_mb * 1024 * 1024)
+
+    @property
+    def loaded_names(self) -> List[str]:
+        with self._lock:
+            return list(self._loaded)
+
+    @property
+    def loaded_bytes(self) -> int:
+        with self._lock:
+            return sum(size for _, size in self._loaded.values())
+
+    def register(self, name: str, artifact_dir: Path) -> None:
+        with self._lock:
+            self.collections[name] = Path(artifact_dir)
+            self._loaded.pop(name, None)
+
+    def resolve(
+        self,
+        explicit: Optional[Sequence[str]] = None,
+        service: Optional[str] = None,
+    ) -> List[str]:
+        """Pick collections for a request: explicit names, else the service, else default."""
+        if explicit:
+            unknown = [name for name in explicit if name not in self.collections]
+            if unknown:
+                raise KeyError(f"Unknown collections: {', '.join(unknown)}")
+            return list(dict.fromkeys(explicit))
+        if service and service in self.collections:
+            return [service]
+        return [DEFAULT_COLLECTION]
+
+    def get(self, name: str) -> Retriever:
+        if name not in self.collections:
+            raise KeyError(f"Unknown collection: {name}")
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name][0]
+
+        artifact_dir = self.collections[name]
+        retriever = Retriever.load(artifact_dir)
+        size = estimate_bundle_bytes(artifact_dir)
+
+        with self._lock:
+            if name in self._loaded:
+                # Another thread won the race; keep its copy.
+                self._loaded.move_to_end(name)
+                return self._loaded[name][0]
+            self._loaded[name] = (retriever, size)
+            self._evict_locked(keep=name)
+        logger.info("Loaded collection %s from %s (%s bytes)", name, artifact_dir, size)
+        return retriever
+
+    def evict(self, name: str) -> None:
+        with self._lock:
+            self._loaded.pop(name, None)
+
+    def _evict_locked(self, keep: str) -> None:
+        total = sum(size for _, size in self._loaded.values())
+        for name in list(self._loaded):
+            if total <= self.memory_budget_bytes:
+                break
+            if name == keep:
+                continue
+            _, size = self._loaded.pop(name)
+            total -= size
+            logger.info("Evicted collection %s (%s bytes)", name, size)
+
+    def retrieve(self, names: Iterable[str], query: str, k: int = 3) -> List[Tuple[Chunk, float]]:
+        """Search one or more collections and merge their top-k.
+
+        Collections sharing an embedder and metric have comparable scores and are
+        merged by score. Otherwise each collection is ranked on its own and the
+        hits are merged by reciprocal-rank fusion; every hit keeps the raw score
+        from its own collection.
+        """
+        names = list(names)
+        if len(names) == 1:
+            return self.get(names[0]).retrieve(query, k=k)
+
+        retrievers = [self.get(name) for name in names]
+        # Embed once per distinct embedder rather than once per collection.
+        query_vecs: Dict[Tuple[str, int], np.ndarray] = {}
+        keys = [(retriever.embedder.name, retriever.embedder.dim) for retriever in retrievers]
+        for key, retriever in zip(keys, retrievers):
+            if key not in query_vecs:
+                query_vecs[key] = retriever.embedder.embed([query])
+
+        def _search(retriever: Retriever) -> List[Tuple[Chunk, float]]:
+            key = (retriever.embedder.name, retriever.embedder.dim)
+            return retriever.search_vector(query_vecs[key], k=k)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(retrievers))) as pool:
+            results = list(pool.map(_search, retrievers))
+
+        spaces = {(key, retriever.higher_is_better) for key, retriever in zip(keys, retrievers)}
+        if len(spaces) == 1:
+            merged = [hit for hits in results for hit in hits]
+            merged.sort(key=lambda hit: hit[1], reverse=retrievers[0].higher_is_better)
+            return merged[:k]
+        fused = [(1.0 / (RRF_K + rank), hit) for hits in results for rank, hit in enumerate(hits, start=1)]
+        # Stable sort: equal ranks keep the order in which collections were named.
+        fused.sort(key=lambda item: item[0], reverse=True)
+        return [hit for _, hit in fused[:k]]
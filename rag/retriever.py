@@ -4,6 +4,8 @@ import hashlib
 import json
 import logging
 import os
+import re
+import zlib
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, List, Optional, Sequence, Tuple
@@ -23,6 +25,8 @@ DEFAULT_ARTIFACT_DIR = Path("artifacts")
 CHUNKS_FILE = "chunks.jsonl"
 INDEX_FILE = "faiss.index"
 META_FILE = "index_meta.json"
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+TOKEN_RE = re.compile(r"\w+")
 
 
 class EmbeddingModel:
@@ -48,6 +52,27 @@ class MockEmbeddingModel(EmbeddingModel):
         return np.vstack(vectors).astype("float32")
 
 
+class HashingEmbeddingModel(EmbeddingModel):
+    """Offline bag-of-words embedder (signed feature hashing, L2-normalized).
+
+    Unlike the mock embedder, lexically similar texts land close together,
+    so retrieval quality can be measured without downloading a model.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.name = "hashing"
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for token in TOKEN_RE.findall(text.lower()):
+                h = zlib.crc32(token.encode("utf-8"))
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+
 class SentenceTransformerEmbedding(EmbeddingModel):  # pragma: no cover - thin wrapper
     def __init__(self, model_name: str):
         try:
@@ -66,6 +91,8 @@ class SentenceTransformerEmbedding(EmbeddingModel):  # pragma: no cover - thin w
 
 def get_embedder(model_name: Optional[str] = None) -> EmbeddingModel:
     model_name = model_name or os.getenv("EMBEDDING_MODEL", "mock")
+    if model_name.lower() == "hashing":
+        return HashingEmbeddingModel()
     if model_name.lower() in {"mock", "mock-embedding"} or model_name.lower().startswith(
         "mock"
     ):
@@ -102,23 +129,71 @@ class Retriever:
 
         return cls(embedder=embedder, index=index, chunks=chunks)
 
+    @property
+    def higher_is_better(self) -> bool:
+        """Inner-product indexes rank by similarity; L2 indexes rank by distance."""
+        if faiss is None:
+            return False
+        return getattr(self.index, "metric_type", faiss.METRIC_L2) == faiss.METRIC_INNER_PRODUCT
+
     def retrieve(self, query: str, k: int = 3) -> List[Tuple[Chunk, float]]:
         if faiss is None:
             raise ImportError("faiss is required for retrieval")
         query_vec = self.embedder.embed([query])
-        scores, idxs = self.index.search(query_vec, min(k, len(self.chunks)))
-        scored: List[Tuple[Chunk, float]] = []
-        for score, idx in zip(scores[0], idxs[0]):
-            if idx == -1:
-                continue
-            scored.append((self.chunks[idx], float(score)))
-        return scored
+        return self.search_vector(query_vec, k=k)
+
+    def retrieve_batch(self, queries: Sequence[str], k: int = 3) -> List[List[Tuple[Chunk, float]]]:
+        """Embed all queries in one call and search them as a single matrix."""
+        if faiss is None:
+            raise ImportError("faiss is required for retrieval")
+        if not queries:
+            return []
+        return self.search_vectors(self.embedder.embed(list(queries)), k=k)
+
+    def search_vector(self, query_vec: np.ndarray, k: int = 3) -> List[Tuple[Chunk, float]]:
+        return self.search_vectors(query_vec[:1], k=k)[0]
+
+    def search_vectors(self, query_vecs: np.ndarray, k: int = 3) -> List[List[Tuple[Chunk, float]]]:
+        if faiss is None:
+            raise ImportError("faiss is required for retrieval")
+        scores, idxs = self.index.search(query_vecs, min(k, len(self.chunks)))
+        results: List[List[Tuple[Chunk, float]]] = []
+        for row_scores, row_idxs in zip(scores, idxs):
+            results.append(
+                [(self.chunks[idx], float(score)) for score, idx in zip(row_scores, row_idxs) if idx != -1]
+            )
+        return results
+
+
+def build_index(vectors: np.ndarray, index_type: str = "flat") -> faiss.Index:
+    """Exact L2 (``flat``), inverted-file (``ivf``) or graph (``hnsw``) FAISS index."""
+    if faiss is None:
+        raise ImportError("faiss is required to build the index")
+    dim = vectors.shape[1]
+    index: faiss.Index
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "ivf":
+        nlist = max(1, int(np.sqrt(len(vectors))))
+        ivf = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        ivf.train(vectors)
+        ivf.nprobe = min(nlist, 8)
+        index = ivf
+    elif index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, 32)
+        hnsw.hnsw.efSearch = 64
+        index = hnsw
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    index.add(vectors)
+    return index
 
 
 def persist_index(
     chunks: List[Chunk],
     embedder: EmbeddingModel,
     artifact_dir: Path = DEFAULT_ARTIFACT_DIR,
+    index_type: str = "flat",
 ) -> None:
     if faiss is None:
         raise ImportError("faiss is required to build the index")
@@ -126,8 +201,7 @@ def persist_index(
     artifact_dir.mkdir(parents=True, exist_ok=True)
     texts = [chunk.text for chunk in chunks]
     vectors = embedder.embed(texts).astype("float32")
-    index = faiss.IndexFlatL2(embedder.dim)
-    index.add(vectors)
+    index = build_index(vectors, index_type)
 
     faiss.write_index(index, str(artifact_dir / INDEX_FILE))
 
@@ -135,6 +209,7 @@ def persist_index(
         "embedding_model": embedder.name,
         "dim": embedder.dim,
         "chunk_count": len(chunks),
+        "index_type": index_type,
     }
     (artifact_dir / META_FILE).write_text(json.dumps(meta, indent=2))
 
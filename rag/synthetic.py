@@ -0,0 +1,126 @@
+"""Deterministic synthetic runbooks and incidents for scaling benchmarks.
+
+Runbooks mimic the shipped ones: an H1 title, H2 sections and occasional
+H3/H4 subsections of bullet points. Section lengths are lognormal and words
+are drawn Zipf-style from an SRE vocabulary padded with synthetic terms, so
+term frequencies look like real prose. Each incident is written from one
+chunk's text plus noise and records that chunk id, which makes recall@k
+measurable.
+"""
+from __future__ import annotations
+
+import json
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from rag.chunking import Chunk
+
+SERVICES = ["api-gateway", "payments", "checkout", "search", "auth", "ledger", "cdn", "queue", "web", "cache"]
+COMPONENTS = ["database", "replica", "load balancer", "connection pool", "kafka", "redis", "dns", "ingress", "node", "pod"]
+SYMPTOMS = ["latency", "timeouts", "errors", "saturation", "lag", "restarts", "throttling", "OOM", "5xx", "packet loss"]
+ACTIONS = ["roll back", "restart", "scale out", "drain", "fail over", "rotate", "throttle", "page", "inspect", "purge"]
+FILLER = ["the", "if", "check", "verify", "and", "then", "for", "with", "on", "before", "after", "during", "metrics", "dashboard", "alert"]
+
+
+@dataclass
+class SyntheticCorpusConfig:
+    seed: int = 0
+    sections_mean: float = 6.0
+    subsection_prob: float = 0.35
+    max_depth: int = 4
+    words_mean: float = 60.0
+    words_sigma: float = 0.6
+    vocab_size: int = 5000
+    zipf_a: float = 1.2
+
+
+class SyntheticCorpus:
+    """Seeded generator; the same config always yields identical bytes."""
+
+    def __init__(self, config: Optional[SyntheticCorpusConfig] = None):
+        self.config = config or SyntheticCorpusConfig()
+        base = SERVICES + COMPONENTS + SYMPTOMS + ACTIONS + FILLER
+        extra = [f"term{i}" for i in range(max(self.config.vocab_size - len(base), 0))]
+        self.vocab = np.array(base + extra)
+        ranks = np.arange(1, len(self.vocab) + 1, dtype=np.float64)
+        weights = ranks ** -self.config.zipf_a
+        self._cdf = np.cumsum(weights / weights.sum())
+
+    def _words(self, rng: np.random.Generator, count: int) -> List[str]:
+        idx = np.searchsorted(self._cdf, rng.random(count))
+        return [str(word) for word in self.vocab[np.minimum(idx, len(self.vocab) - 1)]]
+
+    def _section(self, rng: np.random.Generator) -> List[str]:
+        total = max(int(rng.lognormal(np.log(self.config.words_mean), self.config.words_sigma)), 4)
+        lines: List[str] = []
+        while total > 0:
+            n = min(int(rng.integers(6, 18)), total)
+            action = ACTIONS[int(rng.integers(len(ACTIONS)))]
+            lines.append(f"- {action.capitalize()} " + " ".join(self._words(rng, n)) + ".")
+            total -= n
+        return lines
+
+    def runbook(self, index: int) -> str:
+        rng = np.random.default_rng([self.config.seed, index])
+        service = SERVICES[index % len(SERVICES)]
+        lines = [f"# {service.title()} Runbook {index}", ""]
+        for s in range(max(int(rng.poisson(self.config.sections_mean)), 1)):
+            symptom = SYMPTOMS[int(rng.integers(len(SYMPTOMS)))]
+            component = COMPONENTS[int(rng.integers(len(COMPONENTS)))]
+            lines += [f"## {component.capitalize()} {symptom} {s}"] + self._section(rng) + [""]
+            depth = 2
+            while depth < self.config.max_depth and rng.random() < self.config.subsection_prob:
+                depth += 1
+                title = " ".join(self._words(rng, 3))
+                lines += [f"{'#' * depth} {title.capitalize()}"] + self._section(rng) + [""]
+        return "\n".join(lines)
+
+    def write_runbooks(self, out_dir: Path, count: int) -> List[Path]:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for index in range(count):
+            path = out_dir / f"synthetic-{index:06d}.md"
+            path.write_text(self.runbook(index), encoding="utf-8")
+            paths.append(path)
+        return paths
+
+    def incidents(self, chunks: Sequence[Chunk], count: int, noise_words: int = 6) -> List[Dict]:
+        """Incidents paraphrasing a random chunk each, with ``expected_chunk_ids`` set."""
+        rng = random.Random(self.config.seed)
+        np_rng = np.random.default_rng(self.config.seed)
+        incidents = []
+        for i in range(count):
+            chunk = chunks[rng.randrange(len(chunks))]
+            words = chunk.text.split()
+            start = rng.randrange(max(len(words) - 12, 1))
+            excerpt = words[start : start + 12]
+            service = SERVICES[i % len(SERVICES)]
+            incidents.append(
+                {
+                    "incident_id": f"SYN-{i:06d}",
+                    "title": " ".join(excerpt[:4]),
+                    "severity": rng.choice(["sev1", "sev2", "sev3"]),
+                    "timestamp": "2024-07-01T00:00:00Z",
+                    "alert_text": " ".join(excerpt),
+                    "logs_text": "WARN " + " ".join(self._words(np_rng, noise_words)),
+                    "metrics_snapshot": [],
+                    "environment": {
+                        "service": service,
+                        "cluster": "prod",
+                        "region": "us-east-1",
+                        "deploy_version": "v1",
+                    },
+                    "expected_chunk_ids": [chunk.id],
+                }
+            )
+        return incidents
+
+    def write_incidents(self, path: Path, chunks: Sequence[Chunk], count: int) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            for incident in self.incidents(chunks, count):
+                f.write(json.dumps(incident) + "\n")
@@ -0,0 +1,152 @@
+"""Online grouping of alert storms so each root cause is triaged once.
+
+Incoming incidents are embedded (title and alert text) and compared with the
+clusters seen in the last ``window_s`` seconds. An incident joins a cluster
+when it shares the configured ``environment`` fields and its cosine
+similarity to the cluster centroid is at least ``similarity_threshold``.
+Otherwise it starts a new cluster. The first member of a cluster is its
+representative: it runs full triage, and later members reuse that result.
+Members wait at most ``wait_share`` of their own deadline for it, so one
+that has to triage itself after all still has budget to do so.
+"""
+from __future__ import annotations
+
+import itertools
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rag.retriever import EmbeddingModel, get_embedder
+from serving.metrics import record_alert_group
+from serving.schemas import AlertGroup, IncidentRequest, TriageResponse
+
+DEFAULT_WINDOW_S = 300.0
+DEFAULT_SIMILARITY = 0.8
+DEFAULT_MATCH_FIELDS = ("cluster", "region")
+DEFAULT_WAIT_SHARE = 0.5
+
+
+@dataclass
+class IncidentCluster:
+    id: str
+    key: Tuple[str, ...]
+    centroid: np.ndarray
+    representative: IncidentRequest
+    last_seen: float
+    members: List[str] = field(default_factory=list)
+    result: Optional[TriageResponse] = None
+    failed: bool = False
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+class AlertGrouper:
+    def __init__(
+        self,
+        embedder: EmbeddingModel,
+        window_s: float = DEFAULT_WINDOW_S,
+        similarity_threshold: float = DEFAULT_SIMILARITY,
+        match_fields: Sequence[str] = DEFAULT_MATCH_FIELDS,
+        wait_share: float = DEFAULT_WAIT_SHARE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.embedder = embedder
+        self.window_s = window_s
+        self.similarity_threshold = similarity_threshold
+        self.match_fields = tuple(match_fields)
+        self.wait_share = wait_share
+        self._clock = clock
+        self._clusters: Dict[str, IncidentCluster] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AlertGrouper":
+        fields = os.getenv("ALERT_GROUPING_FIELDS", ",".join(DEFAULT_MATCH_FIELDS))
+        return cls(
+            get_embedder(os.getenv("ALERT_GROUPING_EMBEDDER") or None),
+            window_s=float(os.getenv("ALERT_GROUPING_WINDOW_S", str(DEFAULT_WINDOW_S))),
+            similarity_threshold=float(os.getenv("ALERT_GROUPING_SIMILARITY", str(DEFAULT_SIMILARITY))),
+            match_fields=[f.strip() for f in fields.split(",") if f.strip()],
+            wait_share=float(os.getenv("ALERT_GROUPING_WAIT_SHARE", str(DEFAULT_WAIT_SHARE))),
+        )
+
+    @property
+    def active_clusters(self) -> int:
+        return len(self._clusters)
+
+    def _vector(self, incident: IncidentRequest) -> np.ndarray:
+        vec: np.ndarray = self.embedder.embed([f"{incident.title}\n{incident.alert_text}"])[0].astype(np.float64)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def _key(self, incident: IncidentRequest) -> Tuple[str, ...]:
+        env = incident.environment
+        return tuple(str(getattr(env, name, "")) for name in self.match_fields)
+
+    def _expire(self, now: float) -> None:
+        stale = [cid for cid, c in self._clusters.items() if now - c.last_seen > self.window_s]
+        for cid in stale:
+            del self._clusters[cid]
+
+    def assign(self, incident: IncidentRequest) -> Tuple[IncidentCluster, bool]:
+        """Place ``incident`` in a cluster; True when it is the new representative."""
+        vec = self._vector(incident)
+        key = self._key(incident)
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            best: Optional[IncidentCluster] = None
+            best_sim = self.similarity_threshold
+            for cluster in self._clusters.values():
+                if cluster.key != key:
+                    continue
+                sim = float(vec @ cluster.centroid)
+                if sim >= best_sim:
+                    best, best_sim = cluster, sim
+            if best is None:
+                best = IncidentCluster(
+                    id=f"grp-{next(self._ids)}", key=key, centroid=vec, representative=incident, last_seen=now
+                )
+                best.members.append(incident.incident_id)
+                self._clusters[best.id] = best
+                record_alert_group("new", len(self._clusters))
+                return best, True
+            # Running mean keeps the centroid representative as the cluster grows.
+            n = len(best.members)
+            centroid = best.centroid * n + vec
+            best.centroid = centroid / (np.linalg.norm(centroid) or 1.0)
+            best.members.append(incident.incident_id)
+            best.last_seen = now
+            record_alert_group("joined", len(self._clusters))
+            return best, False
+
+    def complete(self, cluster: IncidentCluster, result: Optional[TriageResponse]) -> None:
+        """Publish the representative's result (None if its triage failed)."""
+        cluster.result = result
+        cluster.failed = result is None
+        cluster.done.set()
+
+    def wait(self, cluster: IncidentCluster, timeout_s: float) -> Optional[TriageResponse]:
+        if not cluster.done.wait(timeout_s) or cluster.failed:
+            return None
+        return cluster.result
+
+
+def annotate(
+    result: TriageResponse, cluster: IncidentCluster, incident: IncidentRequest, shared: bool
+) -> TriageResponse:
+    """The cluster's result, labelled with this member's own incident details."""
+    annotated = result.model_copy(deep=True)
+    annotated.alert_group = AlertGroup(
+        group_id=cluster.id,
+        representative_incident_id=cluster.representative.incident_id,
+        incident_id=incident.incident_id,
+        title=incident.title,
+        size=len(cluster.members),
+        shared=shared,
+    )
+    return annotated
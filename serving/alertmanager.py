@@ -0,0 +1,98 @@
+"""Convert Alertmanager webhook alert groups into triage requests."""
+from __future__ import annotations
+
+import hashlib
+from typing import Dict, List, Sequence
+
+from serving.schemas import (
+    AlertmanagerAlert,
+    AlertmanagerWebhook,
+    EnvironmentContext,
+    IncidentRequest,
+)
+
+MAX_ALERT_LINES = 20
+SEVERITY_MAP = {
+    "critical": "sev1",
+    "page": "sev1",
+    "error": "sev2",
+    "major": "sev2",
+    "warning": "sev2",
+    "minor": "sev3",
+    "info": "sev3",
+}
+# Label names tried in order for each environment field.
+ENVIRONMENT_LABELS = {
+    "service": ("service", "app", "job"),
+    "cluster": ("cluster", "k8s_cluster"),
+    "region": ("region", "zone"),
+    "deploy_version": ("version", "deploy_version", "image_tag"),
+}
+
+
+def incident_id_for(group_key: str) -> str:
+    """Stable incident id for an alert group, so re-fired notifications map to one incident."""
+    return f"am-{hashlib.sha1(group_key.encode('utf-8')).hexdigest()[:12]}"
+
+
+def firing_alerts(webhook: AlertmanagerWebhook) -> List[AlertmanagerAlert]:
+    return [alert for alert in webhook.alerts if alert.status == "firing"]
+
+
+def alert_signature(alerts: Sequence[AlertmanagerAlert]) -> str:
+    """Identity of the set of firing alerts; unchanged when Alertmanager re-sends a group."""
+    keys = sorted(alert.fingerprint or repr(sorted(alert.labels.items())) for alert in alerts)
+    return hashlib.sha1("\n".join(keys).encode("utf-8")).hexdigest()
+
+
+def _severity(labels: Dict[str, str]) -> str:
+    value = labels.get("severity", "").lower()
+    if value.startswith("sev"):
+        return value
+    return SEVERITY_MAP.get(value, "sev3")
+
+
+def _label(webhook: AlertmanagerWebhook, alerts: Sequence[AlertmanagerAlert], names: Sequence[str]) -> str:
+    for labels in [webhook.common_labels, webhook.group_labels, *(a.labels for a in alerts)]:
+        for name in names:
+            if labels.get(name):
+                return labels[name]
+    return "unknown"
+
+
+def _alert_line(alert: AlertmanagerAlert) -> str:
+    name = alert.labels.get("alertname", "alert")
+    text = alert.annotations.get("summary") or alert.annotations.get("description") or ""
+    instance = alert.labels.get("instance") or alert.labels.get("pod")
+    where = f" ({instance})" if instance else ""
+    return f"{name}{where}: {text}".rstrip(": ")
+
+
+def to_incident(webhook: AlertmanagerWebhook) -> IncidentRequest:
+    """One incident per alert group, built from its firing alerts (all alerts if none fire)."""
+    alerts = firing_alerts(webhook) or webhook.alerts
+    labels = {**webhook.group_labels, **webhook.common_labels}
+    title = (
+        webhook.common_annotations.get("summary")
+        or labels.get("alertname")
+        or _alert_line(alerts[0])
+    )
+    lines = [_alert_line(alert) for alert in alerts[:MAX_ALERT_LINES]]
+    hidden = len(alerts) - MAX_ALERT_LINES + webhook.truncated_alerts
+    if hidden > 0:
+        lines.append(f"... and {hidden} more alerts")
+    description = webhook.common_annotations.get("description")
+    if description:
+        lines.insert(0, description)
+    return IncidentRequest(
+        incident_id=incident_id_for(webhook.group_key),
+        title=title,
+        severity=_severity(labels),
+        timestamp=min(alert.starts_at for alert in alerts),
+        alert_text="\n".join(lines),
+        logs_text="",
+        metrics_snapshot=[],
+        environment=EnvironmentContext(
+            **{field: _label(webhook, alerts, names) for field, names in ENVIRONMENT_LABELS.items()}
+        ),
+    )
@@ -1,47 +1,94 @@
 from __future__ import annotations
 
 import logging
+import os
+import threading
 import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, List, Optional, Tuple
 
 from fastapi import FastAPI, HTTPException
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse, PlainTextResponse
-from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
-
-from rag.chunking import load_markdown_chunks
-from rag.retriever import DEFAULT_ARTIFACT_DIR, Retriever, get_embedder, persist_index
-from serving.metrics import RETRIEVAL_LATENCY, record_request, record_tool_call
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from rag.chunking import Chunk, load_markdown_chunks
+from rag.registry import DEFAULT_COLLECTION, CollectionRegistry
+from rag.retriever import DEFAULT_ARTIFACT_DIR, get_embedder, persist_index
+from serving.alert_grouping import AlertGrouper, annotate
+from serving.alertmanager import alert_signature, firing_alerts, to_incident
+from serving.deadline import Deadline
+from serving.incident_history import IncidentHistory
+from serving.metrics import (
+    RETRIEVAL_LATENCY,
+    record_collections,
+    record_pretriage_webhook,
+    record_request,
+    record_tool_call,
+    record_triage_saved,
+    render_metrics,
+)
 from serving.model_client import get_model_client
-from serving.schemas import IncidentRequest, TriageResponse
-from tools.promql_tool import PromQLTool
+from serving.pretriage import PreTriageQueue
+from serving.prompts import build_metrics_block
+from serving.schemas import AlertmanagerWebhook, IncidentRequest, TriageResponse
+from tools.log_templates import compact_incident_logs
+from tools.promql_tool import PromQLTool, incident_queries
+from tools.series_summary import summarize_results
+from tools.tool_runner import ToolRunner, ToolRunReport
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-app = FastAPI(title="Incident Copilot API", version="0.1.0")
+_registry: Optional[CollectionRegistry] = None
+_grouper: Optional[AlertGrouper] = None
+_pretriage: Optional[PreTriageQueue] = None
+_history: Optional[IncidentHistory] = None
+_history_lock = threading.Lock()
+_pretriage_lock = threading.Lock()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Open the history at startup so no request pays for it; its writer thread loads existing rows.
+    _ensure_history()
+    # Every worker reads the shared pre-triage store, whether or not it has received a webhook.
+    _ensure_pretriage()
+    yield
+    if _history is not None:
+        _history.close()
+
+
+app = FastAPI(title="Incident Copilot API", version="0.1.0", lifespan=lifespan)
 
-_retriever: Optional[Retriever] = None
 
+def _ensure_registry() -> CollectionRegistry:
+    global _registry
+    if _registry is None:
+        _registry = CollectionRegistry.from_env(DEFAULT_ARTIFACT_DIR)
+    return _registry
 
-def _ensure_retriever() -> Optional[Retriever]:
-    global _retriever
-    if _retriever:
-        return _retriever
+
+def _retrieve(request: IncidentRequest, k: int = 3) -> List[Tuple[Chunk, float]]:
+    registry = _ensure_registry()
+    names = registry.resolve(request.collections, request.environment.service)
+    query = f"{request.alert_text}\n{request.logs_text}"
     try:
-        _retriever = Retriever.load(DEFAULT_ARTIFACT_DIR)
-        return _retriever
+        return registry.retrieve(names, query, k=k)
     except FileNotFoundError:
+        if names != [DEFAULT_COLLECTION]:
+            raise
         logger.warning("Artifacts missing, building mock index from sample runbooks")
         chunks = load_markdown_chunks(Path("data/sample_runbooks"))
         embedder = get_embedder("mock")
-        persist_index(chunks, embedder, artifact_dir=DEFAULT_ARTIFACT_DIR)
-        _retriever = Retriever.load(DEFAULT_ARTIFACT_DIR)
+        persist_index(chunks, embedder, artifact_dir=registry.collections[DEFAULT_COLLECTION])
+        return registry.retrieve(names, query, k=k)
     except Exception as exc:
         logger.error("Unable to initialize retriever: %s", exc)
-        _retriever = None
-    return _retriever
+        return []
+    finally:
+        record_collections(len(registry.loaded_names), registry.loaded_bytes)
 
 
 @app.get("/healthz")
@@ -51,30 +98,148 @@ def health() -> dict:
 
 @app.get("/metrics")
 def metrics():
-    # Using default registry
-    data = generate_latest()
+    # Aggregated across workers in multiprocess mode, cached for METRICS_CACHE_TTL_S.
+    data = render_metrics()
     return PlainTextResponse(data.decode("utf-8"), media_type=CONTENT_TYPE_LATEST)
 
 
+def _ensure_grouper() -> Optional[AlertGrouper]:
+    global _grouper
+    if os.getenv("ALERT_GROUPING", "0") != "1":
+        return None
+    if _grouper is None:
+        _grouper = AlertGrouper.from_env()
+    return _grouper
+
+
+def _ensure_history() -> Optional[IncidentHistory]:
+    global _history
+    if os.getenv("INCIDENT_HISTORY", "0") != "1":
+        return None
+    with _history_lock:
+        if _history is None:
+            _history = IncidentHistory.from_env()
+    return _history
+
+
+def _run_triage(request: IncidentRequest, deadline: Deadline) -> TriageResponse:
+    with RETRIEVAL_LATENCY.time():
+        retrieved = _retrieve(request, k=3)
+
+    history = _ensure_history()
+    if history is not None:
+        similar = history.similar(
+            request,
+            k=int(os.getenv("INCIDENT_HISTORY_K", "3")),
+            min_similarity=float(os.getenv("INCIDENT_HISTORY_MIN_SIMILARITY", "0.5")),
+        )
+        request = request.model_copy(update={"similar_incidents": similar or None})
+
+    model_client = get_model_client()
+    tool = PromQLTool(mode=os.getenv("PROMQL_MODE", "mock"))
+    report: Optional[ToolRunReport] = None
+    metrics_text = ""
+    calls = incident_queries(request) if os.getenv("EXECUTE_TOOL_CALLS", "1") == "1" else []
+    if calls:
+        # Query the incident's metrics before generation so the prompt carries
+        # their summaries; the rest of the budget goes to the model.
+        report = ToolRunner(tool).run(calls, deadline.child(float(os.getenv("TOOL_BUDGET_SHARE", "0.3"))))
+        summary = summarize_results(report.completed)
+        if summary.series:
+            metrics_text = build_metrics_block(summary)
+
+    response = model_client.generate(request, retrieved, tool, deadline=deadline, metrics_text=metrics_text)
+
+    for call in response.tool_calls:
+        record_tool_call(call.tool_name)
+    if report is not None:
+        response.tool_executions = report.executions
+
+    if history is not None:
+        response.similar_incidents = request.similar_incidents
+        history.record(request, retrieved, response)
+    return response
+
+
+def _grouped_triage(grouper: AlertGrouper, request: IncidentRequest, deadline: Deadline) -> TriageResponse:
+    cluster, representative = grouper.assign(request)
+    if not representative:
+        # Bounded, so a member whose representative is stuck can still triage itself in time.
+        shared = grouper.wait(cluster, deadline.child(grouper.wait_share).remaining())
+        if shared is not None:
+            record_triage_saved()
+            return annotate(shared, cluster, request, shared=True)
+        # The representative failed or is too slow: triage this member itself.
+        return annotate(_run_triage(request, deadline), cluster, request, shared=False)
+    result: Optional[TriageResponse] = None
+    try:
+        result = _run_triage(request, deadline)
+    finally:
+        grouper.complete(cluster, result)
+    return annotate(result, cluster, request, shared=False)
+
+
+def _triage_incident(request: IncidentRequest, deadline: Deadline) -> TriageResponse:
+    # Retrieval and the prompt both see log templates rather than raw spam.
+    request = compact_incident_logs(request)
+    grouper = _ensure_grouper()
+    if grouper is not None:
+        return _grouped_triage(grouper, request, deadline)
+    return _run_triage(request, deadline)
+
+
+def _ensure_pretriage() -> PreTriageQueue:
+    global _pretriage
+    with _pretriage_lock:
+        if _pretriage is None:
+            _pretriage = PreTriageQueue.from_env(lambda incident: _triage_incident(incident, Deadline.from_env()))
+    return _pretriage
+
+
 @app.post("/v1/triage", response_model=TriageResponse)
 def triage(request: IncidentRequest) -> JSONResponse:
     start_time = time.perf_counter()
+    deadline = Deadline.from_env()
+    registry = _ensure_registry()
+    unknown = [name for name in request.collections or [] if name not in registry.collections]
+    if unknown:
+        record_request(outcome="error", duration_seconds=time.perf_counter() - start_time)
+        raise HTTPException(status_code=404, detail=f"Unknown collections: {', '.join(unknown)}")
     try:
-        retriever = _ensure_retriever()
-        retrieved = []
-        if retriever:
-            with RETRIEVAL_LATENCY.time():
-                retrieved = retriever.retrieve(f"{request.alert_text}\n{request.logs_text}", k=3)
-
-        model_client = get_model_client()
-        tool = PromQLTool(mode="mock")
-        response = model_client.generate(request, retrieved, tool)
-
-        for call in response.tool_calls:
-            record_tool_call(call.tool_name)
+        # Only a result triaged from this exact request answers it; an id alone is not enough.
+        response = _ensure_pretriage().lookup(request.incident_id, request)
+        if response is None:
+            response = _triage_incident(request, deadline)
 
         record_request(outcome="success", duration_seconds=time.perf_counter() - start_time)
         return JSONResponse(content=jsonable_encoder(response))
     except Exception as exc:
         record_request(outcome="error", duration_seconds=time.perf_counter() - start_time)
         raise HTTPException(status_code=500, detail=str(exc))
+
+
+@app.get("/v1/triage/{incident_id}", response_model=TriageResponse)
+def triage_result(incident_id: str) -> JSONResponse:
+    pretriage = _ensure_pretriage()
+    response = pretriage.lookup(incident_id)
+    if response is not None:
+        return JSONResponse(content=jsonable_encoder(response))
+    if pretriage.is_pending(incident_id):
+        return JSONResponse(status_code=202, content={"incident_id": incident_id, "status": "pending"})
+    raise HTTPException(status_code=404, detail=f"No triage result for {incident_id}")
+
+
+@app.post("/v1/alertmanager", status_code=202)
+def alertmanager_webhook(webhook: AlertmanagerWebhook) -> JSONResponse:
+    """Alertmanager webhook receiver: queue the alert group for background triage."""
+    incident = to_incident(webhook)
+    alerts = firing_alerts(webhook)
+    if not alerts:
+        record_pretriage_webhook("resolved", _ensure_pretriage().queue_depth)
+        return JSONResponse(status_code=200, content={"incident_id": incident.incident_id, "status": "resolved"})
+    outcome = _ensure_pretriage().submit(incident, alert_signature(alerts))
+    content = {"incident_id": incident.incident_id, "status": outcome}
+    if outcome == "rejected":
+        # Alertmanager retries 5xx responses, so a full queue sheds load without losing the group.
+        return JSONResponse(status_code=503, content=content, headers={"Retry-After": "30"})
+    return JSONResponse(status_code=202, content=content)
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class BackgroundLoop:
+    """An asyncio loop on a daemon thread, shared by sync and async callers.
+
+    Pooled async clients are bound to the loop that created them; running
+    them here lets sync request handlers and other event loops reuse the
+    same connections.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def ensure(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=self.name, daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Run ``coro`` on the background loop and block for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.ensure()).result()
+
+    async def arun(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Await ``coro`` on the background loop from another event loop."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.ensure()))
+
+    def stop(self, cleanup: Optional[Coroutine[Any, Any, Any]] = None) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            if cleanup is not None:
+                cleanup.close()
+            return
+        if cleanup is not None:
+            asyncio.run_coroutine_threadsafe(cleanup, loop).result()
+        asyncio.run_coroutine_threadsafe(loop.shutdown_asyncgens(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,192 @@
+"""Dynamic batching for in-process CPU generation.
+
+Concurrent requests are queued and a single worker thread drains them into
+batches of at most ``max_batch_size``, waiting up to ``max_wait_ms`` for a
+batch to fill. Each batch is decoded greedily with a shared KV cache; rows
+that hit EOS or their own ``max_new_tokens`` are dropped from the batch so
+the remaining steps only pay for sequences still generating.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Sequence
+
+from serving.metrics import record_generation_batch
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 10.0
+
+
+@dataclass
+class GenerationRequest:
+    prompt_ids: List[int]
+    max_new_tokens: int
+    future: Future[GenerationResult] = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class GenerationResult:
+    token_ids: List[int]
+    finished_by_eos: bool
+
+
+BatchFn = Callable[[Sequence[GenerationRequest]], List[GenerationResult]]
+
+
+class BatchScheduler:
+    """Collects concurrent generation requests and runs them as batches."""
+
+    def __init__(
+        self,
+        batch_fn: BatchFn,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size or int(
+            os.getenv("GEN_MAX_BATCH_SIZE", str(DEFAULT_MAX_BATCH_SIZE))
+        )
+        wait_ms = max_wait_ms if max_wait_ms is not None else float(
+            os.getenv("GEN_MAX_WAIT_MS", str(DEFAULT_MAX_WAIT_MS))
+        )
+        self.max_wait_s = wait_ms / 1000.0
+        self._queue: "queue.Queue[Optional[GenerationRequest]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+                self._worker.start()
+
+    def submit(self, prompt_ids: List[int], max_new_tokens: int) -> Future[GenerationResult]:
+        self._ensure_worker()
+        request = GenerationRequest(list(prompt_ids), max_new_tokens)
+        self._queue.put(request)
+        return request.future
+
+    def generate(self, prompt_ids: List[int], max_new_tokens: int, timeout: Optional[float] = None) -> GenerationResult:
+        return self.submit(prompt_ids, max_new_tokens).result(timeout=timeout)
+
+    def _collect(self, first: GenerationRequest) -> List[GenerationRequest]:
+        batch = [first]
+        window_ends = time.perf_counter() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = window_ends - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # let the run loop see the shutdown marker
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [r for r in self._collect(first) if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                results = self.batch_fn(batch)
+            except Exception as exc:
+                for request in batch:
+                    request.future.set_exception(exc)
+                continue
+            generated = sum(len(r.token_ids) for r in results)
+            record_generation_batch(len(batch), generated, time.perf_counter() - start)
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+
+    def close(self) -> None:
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._queue.put(None)
+            worker.join()
+
+
+def _select_rows(past: Any, index: Any) -> Any:
+    """Keep only ``index`` rows of a KV cache (legacy tuples or a Cache object)."""
+    if hasattr(past, "batch_select_indices"):
+        past.batch_select_indices(index)
+        return past
+    return tuple(tuple(t.index_select(0, index) for t in layer) for layer in past)
+
+
+class GreedyBatchGenerator:
+    """Greedy decoding of a left-padded batch with per-row stopping.
+
+    ``model`` is any causal LM taking ``input_ids``, ``attention_mask``,
+    ``position_ids`` and ``past_key_values`` (the Hugging Face convention).
+    """
+
+    def __init__(self, model: Any, eos_token_id: Optional[int], pad_token_id: int):
+        self.model = model
+        self.eos_token_id = eos_token_id
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, batch: Sequence[GenerationRequest]) -> List[GenerationResult]:
+        import torch
+
+        width = max(len(r.prompt_ids) for r in batch)
+        input_ids = torch.full((len(batch), width), self.pad_token_id, dtype=torch.long)
+        mask = torch.zeros((len(batch), width), dtype=torch.long)
+        for row, request in enumerate(batch):
+            ids = request.prompt_ids
+            input_ids[row, width - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            mask[row, width - len(ids):] = 1
+
+        outputs: List[List[int]] = [[] for _ in batch]
+        finished_by_eos = [False] * len(batch)
+        budgets = torch.tensor([r.max_new_tokens for r in batch])
+        active = torch.arange(len(batch))
+        past = None
+        step_ids = input_ids
+        with torch.inference_mode():
+            for step in range(int(budgets.max().item())):
+                positions = (mask.cumsum(-1) - 1).clamp(min=0)
+                if past is not None:
+                    positions = positions[:, -1:]
+                out = self.model(
+                    input_ids=step_ids,
+                    attention_mask=mask,
+                    position_ids=positions,
+                    past_key_values=past,
+                    use_cache=True,
+                )
+                next_ids = out.logits[:, -1, :].argmax(dim=-1)
+                past = out.past_key_values
+
+                keep: List[int] = []
+                for local, row in enumerate(active.tolist()):
+                    token = int(next_ids[local])
+                    if self.eos_token_id is not None and token == self.eos_token_id:
+                        finished_by_eos[row] = True
+                        continue
+                    outputs[row].append(token)
+                    if step + 1 < budgets[row]:
+                        keep.append(local)
+                if not keep:
+                    break
+                if len(keep) < len(active):
+                    index = torch.tensor(keep)
+                    active = active.index_select(0, index)
+                    next_ids = next_ids.index_select(0, index)
+                    mask = mask.index_select(0, index)
+                    past = _select_rows(past, index)
+                step_ids = next_ids.unsqueeze(-1)
+                mask = torch.cat([mask, torch.ones((mask.shape[0], 1), dtype=mask.dtype)], dim=-1)
+        return [GenerationResult(ids, eos) for ids, eos in zip(outputs, finished_by_eos)]
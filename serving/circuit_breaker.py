@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Optional
+
+from serving.metrics import record_circuit_state
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker around a flaky backend.
+
+    The breaker opens after ``failure_threshold`` consecutive failures, or
+    when the error rate over the last ``window`` calls reaches
+    ``error_rate_threshold`` (once ``min_calls`` have been seen). While open,
+    ``allow()`` returns False immediately so callers fall back without
+    waiting on timeouts. After ``reset_timeout_s`` the breaker goes half-open:
+    with a ``probe`` it checks the backend on a background thread and keeps
+    rejecting traffic until the probe succeeds; without one it admits a single
+    trial request.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        error_rate_threshold: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        reset_timeout_s: float = 30.0,
+        probe: Optional[Callable[[], bool]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_calls = min_calls
+        self.reset_timeout_s = reset_timeout_s
+        self.probe = probe
+        self._clock = clock
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._probe_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        record_circuit_state(name, CLOSED)
+
+    @classmethod
+    def from_env(cls, name: str, probe: Optional[Callable[[], bool]] = None) -> "CircuitBreaker":
+        return cls(
+            name,
+            failure_threshold=int(os.getenv("MODEL_BREAKER_FAILURES", "5")),
+            error_rate_threshold=float(os.getenv("MODEL_BREAKER_ERROR_RATE", "0.5")),
+            reset_timeout_s=float(os.getenv("MODEL_BREAKER_RESET_S", "30")),
+            probe=probe,
+        )
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _set_state(self, state: str) -> None:
+        # Caller holds the lock.
+        if state == self._state:
+            return
+        self._state = state
+        if state == OPEN:
+            self._opened_at = self._clock()
+        if state == CLOSED:
+            self._outcomes.clear()
+            self._consecutive_failures = 0
+        self._trial_in_flight = False
+        record_circuit_state(self.name, state)
+
+    def allow(self) -> bool:
+        """Whether a request may go to the backend right now."""
+        start_probe = False
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if self._clock() - self._opened_at < self.reset_timeout_s:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self.probe is not None:
+                start_probe = self._probe_thread is None
+                if start_probe:
+                    self._probe_thread = threading.Thread(
+                        target=self._run_probe, name=f"{self.name}-probe", daemon=True
+                    )
+                allowed = False
+            else:
+                allowed = not self._trial_in_flight
+                self._trial_in_flight = True
+        if start_probe:
+            self._probe_thread.start()
+        return allowed
+
+    def _run_probe(self) -> None:
+        try:
+            healthy = bool(self.probe())
+        except Exception:
+            healthy = False
+        with self._lock:
+            self._probe_thread = None
+            if self._state == HALF_OPEN:
+                self._set_state(CLOSED if healthy else OPEN)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._outcomes.append(True)
+            self._consecutive_failures = 0
+            if self._state == HALF_OPEN:
+                self._set_state(CLOSED)
+
+    def release(self) -> None:
+        """The call ended without a verdict on backend health (client error, caller's deadline).
+
+        Frees a half-open trial slot without moving the breaker.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._outcomes.append(False)
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN:
+                self._set_state(OPEN)
+                return
+            if self._state != CLOSED:
+                return
+            failures = self._outcomes.count(False)
+            tripped = self._consecutive_failures >= self.failure_threshold or (
+                len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.error_rate_threshold
+            )
+            if tripped:
+                self._set_state(OPEN)
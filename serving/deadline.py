@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Callable, Optional
+
+DEFAULT_REQUEST_BUDGET_S = 10.0
+
+
+class Deadline:
+    """Monotonic deadline shared by every stage of one request."""
+
+    def __init__(self, budget_s: float, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.budget_s = budget_s
+        self.expires_at = clock() + budget_s
+
+    @classmethod
+    def from_env(cls) -> "Deadline":
+        return cls(float(os.getenv("TRIAGE_REQUEST_BUDGET_S", str(DEFAULT_REQUEST_BUDGET_S))))
+
+    def remaining(self) -> float:
+        return max(self.expires_at - self._clock(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def child(self, fraction: float = 1.0, cap_s: Optional[float] = None) -> "Deadline":
+        """Sub-deadline for one stage: a fraction of what is left, optionally capped."""
+        budget = self.remaining() * fraction
+        if cap_s is not None:
+            budget = min(budget, cap_s)
+        return Deadline(budget, clock=self._clock)
@@ -0,0 +1,16 @@
+"""Gunicorn hooks for multi-worker deployments with aggregated metrics.
+
+    PROMETHEUS_MULTIPROC_DIR=/tmp/prom gunicorn serving.api:app \\
+        -k uvicorn.workers.UvicornWorker -w 4 -c serving/gunicorn_conf.py
+"""
+from __future__ import annotations
+
+from serving.metrics import mark_worker_dead, prepare_multiproc_dir
+
+
+def on_starting(server) -> None:
+    prepare_multiproc_dir()
+
+
+def child_exit(server, worker) -> None:
+    mark_worker_dead(worker.pid)
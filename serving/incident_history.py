@@ -0,0 +1,417 @@
+"""Persistent incident history with similar-past-incident lookup.
+
+Every triaged incident is stored in a local SQLite database (WAL mode) with
+its retrieved chunk ids, tool calls, response and embedding. Writes never
+block the request path: :meth:`IncidentHistory.record` enqueues and a
+writer thread commits batches. The same thread loads the existing rows
+at startup and then tails new ones (including
+rows written by other worker processes) into an in-memory FAISS
+inner-product index keyed by rowid (exact at first, IVF once large), so
+:meth:`IncidentHistory.similar` is one vector search plus a primary-key
+fetch. Retention is bounded by age and
+row count; :meth:`IncidentHistory.compact` deletes old rows, drops them from
+the index and truncates the WAL. Compactions bump a generation counter in the
+database, and every process prunes rows compacted elsewhere from its own index.
+
+Each worker process holds its own index: a flat or IVF index keeps
+``4 * dim`` bytes per row (about 1.5 GB at 1M rows of 384 dims), while
+``pq_m`` switches large indexes to IVF-PQ at ``pq_m`` bytes per row.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rag.chunking import Chunk
+from rag.retriever import DEFAULT_ARTIFACT_DIR, EmbeddingModel, faiss, get_embedder
+from serving.metrics import record_history_latency, record_history_rows, record_history_write
+from serving.schemas import IncidentRequest, PastIncident, TriageResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = DEFAULT_ARTIFACT_DIR / "history" / "incidents.db"
+DEFAULT_RETENTION_DAYS = 90.0
+DEFAULT_MAX_ROWS = 1_000_000
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_FLUSH_INTERVAL_S = 1.0
+DEFAULT_COMPACT_INTERVAL_S = 3600.0
+DEFAULT_QUEUE_SIZE = 10_000
+SYNC_PAGE_ROWS = 10_000
+DEFAULT_IVF_THRESHOLD = 50_000
+DEFAULT_NPROBE = 16
+# 0 keeps full vectors in the IVF index; otherwise bytes per vector for IVF-PQ.
+DEFAULT_PQ_M = 0
+# Retrain the IVF lists when the index has grown this much since the last training.
+IVF_RETRAIN_GROWTH = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id INTEGER PRIMARY KEY,
+    incident_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    title TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    service TEXT NOT NULL,
+    incident_time TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    chunk_ids TEXT NOT NULL,
+    tool_calls TEXT NOT NULL,
+    request TEXT NOT NULL,
+    response TEXT NOT NULL,
+    embedding BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS incidents_created_at ON incidents (created_at);
+CREATE INDEX IF NOT EXISTS incidents_incident_id ON incidents (incident_id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('compactions', 0);
+"""
+
+# The last field holds the text to embed until the writer swaps in the vector.
+Row = Tuple[str, float, str, str, str, str, str, str, str, str, str, object]
+
+
+def _decode(blobs: Sequence[bytes]) -> np.ndarray:
+    return np.frombuffer(b"".join(blobs), dtype="float32").reshape(len(blobs), -1)
+
+
+def incident_text(incident: IncidentRequest) -> str:
+    return f"{incident.title}\n{incident.alert_text}"
+
+
+def summarize_response(response: TriageResponse) -> str:
+    """One line per finding: the top hypothesis and the remediation steps taken."""
+    parts: List[str] = []
+    if response.hypotheses:
+        top = max(response.hypotheses, key=lambda h: h.confidence)
+        parts.append(f"hypothesis: {top.hypothesis} ({top.confidence:.2f})")
+    parts += [f"step: {step.step}" for step in response.remediation_steps[:3]]
+    return "\n".join(parts)
+
+
+class IncidentHistory:
+    def __init__(
+        self,
+        path: Path,
+        embedder: EmbeddingModel,
+        retention_days: float = DEFAULT_RETENTION_DAYS,
+        max_rows: int = DEFAULT_MAX_ROWS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval_s: float = DEFAULT_FLUSH_INTERVAL_S,
+        compact_interval_s: float = DEFAULT_COMPACT_INTERVAL_S,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        ivf_threshold: int = DEFAULT_IVF_THRESHOLD,
+        nprobe: int = DEFAULT_NPROBE,
+        pq_m: int = DEFAULT_PQ_M,
+        clock: Callable[[], float] = time.time,
+    ):
+        if faiss is None:
+            raise ImportError("faiss is required for incident history")
+        if pq_m and embedder.dim % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {embedder.dim}")
+        self.path = Path(path)
+        self.embedder = embedder
+        self.retention_s = retention_days * 86400
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.compact_interval_s = compact_interval_s
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self._clock = clock
+        self._queue: "queue.Queue[Optional[Row]]" = queue.Queue(queue_size)
+        # Exact search until ``ivf_threshold`` rows, then an IVF index so lookups stay sublinear.
+        self._index: faiss.Index = faiss.IndexIDMap2(faiss.IndexFlatIP(embedder.dim))
+        self._trained_rows = 0
+        self._index_lock = threading.Lock()
+        self._synced_id = 0
+        # Ids in the index, ascending; lets rows compacted by other processes be found.
+        self._ids = np.empty(0, dtype="int64")
+        self._compactions = 0
+        self._ready = threading.Event()
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self._last_compact = self._clock()
+        self._writer = threading.Thread(target=self._write_loop, name="incident-history", daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def from_env(cls) -> "IncidentHistory":
+        return cls(
+            Path(os.getenv("INCIDENT_HISTORY_PATH", str(DEFAULT_PATH))),
+            get_embedder(os.getenv("INCIDENT_HISTORY_EMBEDDER") or None),
+            retention_days=float(os.getenv("INCIDENT_HISTORY_RETENTION_DAYS", str(DEFAULT_RETENTION_DAYS))),
+            max_rows=int(os.getenv("INCIDENT_HISTORY_MAX_ROWS", str(DEFAULT_MAX_ROWS))),
+            ivf_threshold=int(os.getenv("INCIDENT_HISTORY_IVF_THRESHOLD", str(DEFAULT_IVF_THRESHOLD))),
+            pq_m=int(os.getenv("INCIDENT_HISTORY_PQ_M", str(DEFAULT_PQ_M))),
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL with NORMAL sync survives process crashes; only power loss can drop the last commits.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _vectors(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self.embedder.embed(list(texts)).astype("float32")
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    @property
+    def size(self) -> int:
+        return int(self._index.ntotal)
+
+    def record(
+        self,
+        incident: IncidentRequest,
+        retrieved: Sequence[Tuple[Chunk, float]],
+        response: TriageResponse,
+    ) -> bool:
+        """Queue a finished triage for storage; False (and counted) if the queue is full."""
+        row = (
+            incident.incident_id,
+            self._clock(),
+            incident.title,
+            incident.severity,
+            incident.environment.service,
+            incident.timestamp.isoformat(),
+            summarize_response(response),
+            json.dumps([chunk.id for chunk, _ in retrieved]),
+            json.dumps([call.model_dump(mode="json") for call in response.tool_calls]),
+            incident.model_dump_json(exclude={"similar_incidents"}),
+            response.model_dump_json(exclude={"similar_incidents"}),
+            incident_text(incident),
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            record_history_write("dropped")
+            return False
+        return True
+
+    def _write_loop(self) -> None:
+        # Loading existing rows can take a while on a large database; doing it
+        # here keeps startup fast, and lookups simply see fewer rows until then.
+        try:
+            self._sync()
+        except Exception:
+            logger.exception("Incident history initial sync failed")
+        self._ready.set()
+        while True:
+            batch: List[Row] = []
+            stop = False
+            try:
+                item = self._queue.get(timeout=self.flush_interval_s)
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self._queue.get_nowait()
+                stop = item is None
+            except queue.Empty:
+                pass
+            try:
+                if batch:
+                    self._flush(batch)
+                self._sync()
+                if self._clock() - self._last_compact >= self.compact_interval_s:
+                    self.compact()
+            except Exception:
+                logger.exception("Incident history write failed")
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _flush(self, batch: List[Row]) -> None:
+        start = time.perf_counter()
+        # Embedding happens here, off the request path, one call per batch.
+        vectors = self._vectors([str(row[-1]) for row in batch])
+        rows = [row[:-1] + (vector.tobytes(),) for row, vector in zip(batch, vectors)]
+        conn = self._reader()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO incidents (incident_id, created_at, title, severity, service, incident_time,"
+                " summary, chunk_ids, tool_calls, request, response, embedding)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        record_history_write("written", len(rows))
+        record_history_latency("flush", time.perf_counter() - start)
+
+    def _pages(self, after_id: int, until_id: Optional[int] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        conn = self._reader()
+        until_id = until_id if until_id is not None else 2**62
+        while True:
+            rows = conn.execute(
+                "SELECT id, embedding FROM incidents WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                (after_id, until_id, SYNC_PAGE_ROWS),
+            ).fetchall()
+            if not rows:
+                return
+            ids = np.array([row[0] for row in rows], dtype="int64")
+            yield ids, _decode([row[1] for row in rows])
+            after_id = int(ids[-1])
+
+    def _sync(self) -> None:
+        """Mirror the table into the vector index: add new rows and drop compacted ones (by any process)."""
+        # Read before paging: a compaction committed after this is caught by the next sync.
+        (compactions,) = self._reader().execute("SELECT value FROM meta WHERE key = 'compactions'").fetchone()
+        for ids, vectors in self._pages(self._synced_id):
+            with self._index_lock:
+                self._index.add_with_ids(vectors, ids)
+            self._ids = np.concatenate([self._ids, ids])
+            self._synced_id = int(ids[-1])
+        if compactions != self._compactions:
+            self._prune()
+            self._compactions = compactions
+        if self.size >= max(self.ivf_threshold, self._trained_rows * IVF_RETRAIN_GROWTH):
+            self._rebuild_ivf()
+        record_history_rows(self.size)
+
+    def _prune(self) -> None:
+        live = np.fromiter(
+            (row[0] for row in self._reader().execute("SELECT id FROM incidents WHERE id <= ?", (self._synced_id,))),
+            dtype="int64",
+        )
+        self._remove(np.setdiff1d(self._ids, live, assume_unique=True))
+
+    def _remove(self, ids: np.ndarray) -> None:
+        if not len(ids):
+            return
+        with self._index_lock:
+            self._index.remove_ids(faiss.IDSelectorBatch(ids.astype("int64")))
+        self._ids = np.setdiff1d(self._ids, ids, assume_unique=True)
+
+    def _rebuild_ivf(self) -> None:
+        """Swap in a freshly trained IVF index; the current one keeps serving lookups meanwhile."""
+        start = time.perf_counter()
+        rows = self.size
+        # Sample roughly 40 training points per list without loading every vector.
+        nlist = max(int(4 * np.sqrt(rows)), 1)
+        stride = max(rows // (nlist * 40), 1)
+        sample = self._reader().execute(
+            "SELECT embedding FROM incidents WHERE id % ? = 0 AND id <= ?", (stride, self._synced_id)
+        ).fetchall()
+        train = _decode([row[0] for row in sample])
+        nlist = max(min(nlist, len(train) // 39), 1)
+        quantizer = faiss.IndexFlatIP(self.embedder.dim)
+        index: faiss.Index
+        if self.pq_m:
+            # 2**nbits centroids per sub-quantizer need at least as many training points.
+            nbits = max(min(8, int(np.log2(len(train)))), 1)
+            index = faiss.IndexIVFPQ(quantizer, self.embedder.dim, nlist, self.pq_m, nbits, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, self.embedder.dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(train)
+        index.nprobe = min(self.nprobe, nlist)
+        loaded = []
+        for ids, vectors in self._pages(0, self._synced_id):
+            index.add_with_ids(vectors, ids)
+            loaded.append(ids)
+        with self._index_lock:
+            self._index = index
+            self._ids = np.concatenate(loaded) if loaded else np.empty(0, dtype="int64")
+        self._trained_rows = rows
+        record_history_latency("reindex", time.perf_counter() - start)
+
+    def similar(
+        self, incident: IncidentRequest, k: int = 3, min_similarity: float = 0.0
+    ) -> List[PastIncident]:
+        """Top ``k`` past incidents by cosine similarity, excluding earlier runs of this one."""
+        start = time.perf_counter()
+        query = self._vectors([incident_text(incident)])
+        with self._index_lock:
+            # Over-fetch so re-triages of the same incident can be skipped.
+            scores, ids = self._index.search(query, min(k * 2 + 1, max(self.size, 1)))
+        hits = [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i != -1 and s >= min_similarity]
+        found: List[PastIncident] = []
+        if hits:
+            marks = ",".join("?" * len(hits))
+            rows = {
+                row[0]: row[1:]
+                for row in self._reader().execute(
+                    f"SELECT id, incident_id, title, incident_time, summary, chunk_ids FROM incidents WHERE id IN ({marks})",
+                    [i for i, _ in hits],
+                )
+            }
+            seen = {incident.incident_id}
+            for rowid, score in hits:
+                # Rows compacted away by another process may still be in this index.
+                if rowid not in rows or rows[rowid][0] in seen:
+                    continue
+                incident_id, title, incident_time, summary, chunk_ids = rows[rowid]
+                seen.add(incident_id)
+                found.append(
+                    PastIncident(
+                        incident_id=incident_id,
+                        title=title,
+                        timestamp=datetime.fromisoformat(incident_time),
+                        similarity=round(score, 4),
+                        summary=summary,
+                        chunk_ids=json.loads(chunk_ids),
+                    )
+                )
+                if len(found) >= k:
+                    break
+        record_history_latency("lookup", time.perf_counter() - start)
+        return found
+
+    def compact(self) -> int:
+        """Delete rows past retention or beyond ``max_rows`` (oldest first); returns rows removed."""
+        start = time.perf_counter()
+        conn = self._reader()
+        cutoff = self._clock() - self.retention_s
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            doomed = [row[0] for row in conn.execute("SELECT id FROM incidents WHERE created_at < ?", (cutoff,))]
+            doomed += [
+                row[0]
+                for row in conn.execute(
+                    "SELECT id FROM incidents WHERE created_at >= ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+                    (cutoff, self.max_rows),
+                )
+            ]
+            conn.executemany("DELETE FROM incidents WHERE id = ?", [(i,) for i in doomed])
+            if doomed:
+                (before,) = conn.execute("SELECT value FROM meta WHERE key = 'compactions'").fetchone()
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'compactions'")
+                # Only our own deletes since the last sync: no need for the next sync to prune.
+                if before == self._compactions:
+                    self._compactions = before + 1
+        if doomed:
+            self._remove(np.intersect1d(self._ids, np.array(doomed, dtype="int64")))
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._last_compact = self._clock()
+        record_history_rows(self.size)
+        record_history_latency("compact", time.perf_counter() - start)
+        return len(doomed)
+
+    def flush(self) -> None:
+        """Block until existing rows are loaded and every queued record is committed and indexed."""
+        self._ready.wait()
+        self._queue.join()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._writer.join()
@@ -1,11 +1,127 @@
 from __future__ import annotations
 
-from prometheus_client import Counter, Histogram
+import glob
+import os
+import re
+import threading
+import time
+from typing import List, Optional, Set
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Under multiple workers, set PROMETHEUS_MULTIPROC_DIR before this module is
+# imported. Each worker then writes its samples to mmap files in that
+# directory, and /metrics aggregates them. Gauges declare how to combine
+# workers: "livesum" for in-flight counts, "liveall" for per-worker state
+# (the scrape adds a ``pid`` label).
 
 REQUEST_COUNTER = Counter("triage_requests_total", "Total triage requests", ["outcome"])
 REQUEST_LATENCY = Histogram("triage_request_latency_seconds", "Triage request latency seconds")
 RETRIEVAL_LATENCY = Histogram("triage_retrieval_latency_seconds", "Retrieval latency seconds")
 TOOL_CALL_COUNTER = Counter("triage_tool_calls_total", "Tool calls issued", ["tool_name"])
+TOOL_LATENCY = Histogram(
+    "triage_tool_latency_seconds", "Tool execution latency seconds", ["tool_name", "outcome"]
+)
+TOOL_TIMEOUT_COUNTER = Counter(
+    "triage_tool_timeouts_total", "Tool calls cut off by the request deadline", ["tool_name"]
+)
+TOOL_STAGE_LATENCY = Histogram(
+    "triage_tool_stage_latency_seconds", "Wall time of the concurrent tool-execution stage"
+)
+PROMQL_CACHE_REQUESTS = Counter(
+    "triage_promql_cache_requests_total", "PromQL range cache lookups", ["result"]
+)
+METRIC_SUMMARY_TOKENS = Counter(
+    "triage_metric_summary_tokens_total",
+    "Estimated prompt tokens of tool results before and after summarization",
+    ["kind"],
+)
+PROMPT_TOKENS = Histogram(
+    "triage_prompt_tokens",
+    "Prompt tokens sent to the model",
+    buckets=(256, 512, 1024, 2048, 3072, 4096, 6144, 8192, 16384),
+)
+PROMPT_PREFIX_TOKENS = Histogram(
+    "triage_prompt_prefix_cacheable_tokens",
+    "Prompt tokens in the byte-stable prefix eligible for prefix caching",
+    buckets=(128, 256, 512, 1024, 2048, 4096),
+)
+PROMPT_TRUNCATIONS = Counter(
+    "triage_prompt_truncations_total", "Prompt sections truncated to fit the budget", ["section"]
+)
+REPLICA_LATENCY = Histogram(
+    "triage_model_replica_latency_seconds", "Model request latency per replica", ["replica"]
+)
+REPLICA_OUTSTANDING = Gauge(
+    "triage_model_replica_outstanding",
+    "In-flight model requests per replica",
+    ["replica"],
+    multiprocess_mode="livesum",
+)
+MODEL_HEDGES = Counter("triage_model_hedges_total", "Hedged model requests", ["outcome"])
+MODEL_CIRCUIT_STATE = Gauge(
+    "triage_model_circuit_state",
+    "Model backend circuit state (0 closed, 1 half-open, 2 open)",
+    ["backend"],
+    multiprocess_mode="liveall",
+)
+MODEL_FALLBACKS = Counter(
+    "triage_model_fallbacks_total", "Requests answered by the mock fallback", ["backend", "reason"]
+)
+ALERT_GROUP_ASSIGNMENTS = Counter(
+    "triage_alert_group_assignments_total", "Incidents placed into alert groups", ["result"]
+)
+ALERT_GROUPS_ACTIVE = Gauge(
+    "triage_alert_groups_active", "Alert groups inside the grouping window", multiprocess_mode="liveall"
+)
+ALERT_GROUP_TRIAGES_SAVED = Counter(
+    "triage_alert_group_triages_saved_total", "Triage runs skipped by reusing a group's result"
+)
+PRETRIAGE_WEBHOOKS = Counter(
+    "triage_pretriage_webhooks_total", "Alertmanager alert groups received", ["outcome"]
+)
+PRETRIAGE_QUEUE_DEPTH = Gauge(
+    "triage_pretriage_queue_depth", "Alert groups waiting for background triage", multiprocess_mode="livesum"
+)
+PRETRIAGE_JOBS = Counter("triage_pretriage_jobs_total", "Background triage jobs", ["outcome"])
+PRETRIAGE_LATENCY = Histogram(
+    "triage_pretriage_latency_seconds",
+    "Background triage time from webhook to stored result, by stage",
+    ["stage"],
+)
+PRETRIAGE_LOOKUPS = Counter(
+    "triage_pretriage_lookups_total", "Triage requests checked against pre-triaged results", ["result"]
+)
+HISTORY_WRITES = Counter("triage_history_writes_total", "Incident history records", ["outcome"])
+HISTORY_ROWS = Gauge(
+    "triage_history_indexed_incidents", "Past incidents in the similarity index", multiprocess_mode="liveall"
+)
+HISTORY_LATENCY = Histogram(
+    "triage_history_latency_seconds", "Incident history operation latency", ["operation"]
+)
+LOG_MINING_CHARS = Counter(
+    "triage_log_mining_chars_total", "Characters of logs before and after template mining", ["kind"]
+)
+LOG_MINING_LATENCY = Histogram("triage_log_mining_latency_seconds", "Log template mining time")
+GENERATION_BATCH_SIZE = Histogram(
+    "triage_generation_batch_size",
+    "Requests per in-process generation batch",
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+GENERATION_TOKENS = Counter("triage_generation_tokens_total", "Tokens generated in-process")
+GENERATION_BATCH_LATENCY = Histogram(
+    "triage_generation_batch_latency_seconds", "Wall time to decode one in-process batch"
+)
+COLLECTIONS_LOADED = Gauge(
+    "triage_rag_collections_loaded",
+    "Runbook collections resident in memory",
+    multiprocess_mode="liveall",
+)
+COLLECTIONS_LOADED_BYTES = Gauge(
+    "triage_rag_collections_loaded_bytes",
+    "Estimated bytes held by loaded runbook collections",
+    multiprocess_mode="liveall",
+)
 
 
 def record_request(outcome: str, duration_seconds: float) -> None:
@@ -15,3 +131,197 @@ def record_request(outcome: str, duration_seconds: float) -> None:
 
 def record_tool_call(tool_name: str) -> None:
     TOOL_CALL_COUNTER.labels(tool_name=tool_name).inc()
+
+
+def record_tool_latency(tool_name: str, outcome: str, duration_seconds: float) -> None:
+    TOOL_LATENCY.labels(tool_name=tool_name, outcome=outcome).observe(duration_seconds)
+
+
+def record_tool_timeout(tool_name: str) -> None:
+    TOOL_TIMEOUT_COUNTER.labels(tool_name=tool_name).inc()
+
+
+def record_tool_stage(duration_seconds: float) -> None:
+    TOOL_STAGE_LATENCY.observe(duration_seconds)
+
+
+def record_promql_cache(result: str) -> None:
+    PROMQL_CACHE_REQUESTS.labels(result=result).inc()
+
+
+def record_metric_summary(raw_tokens: int, summary_tokens: int) -> None:
+    METRIC_SUMMARY_TOKENS.labels(kind="raw").inc(raw_tokens)
+    METRIC_SUMMARY_TOKENS.labels(kind="summary").inc(summary_tokens)
+
+
+def record_prompt(prompt_tokens: int, prefix_tokens: int, truncated_sections: List[str]) -> None:
+    PROMPT_TOKENS.observe(prompt_tokens)
+    PROMPT_PREFIX_TOKENS.observe(prefix_tokens)
+    for section in truncated_sections:
+        PROMPT_TRUNCATIONS.labels(section=section).inc()
+
+
+def record_replica_latency(replica: str, duration_seconds: float) -> None:
+    REPLICA_LATENCY.labels(replica=replica).observe(duration_seconds)
+
+
+def set_replica_outstanding(replica: str, outstanding: int) -> None:
+    REPLICA_OUTSTANDING.labels(replica=replica).set(outstanding)
+
+
+def record_hedge(outcome: str) -> None:
+    MODEL_HEDGES.labels(outcome=outcome).inc()
+
+
+CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def record_circuit_state(backend: str, state: str) -> None:
+    MODEL_CIRCUIT_STATE.labels(backend=backend).set(CIRCUIT_STATE_VALUES[state])
+
+
+def record_model_fallback(backend: str, reason: str) -> None:
+    MODEL_FALLBACKS.labels(backend=backend, reason=reason).inc()
+
+
+def record_alert_group(result: str, active_groups: int) -> None:
+    ALERT_GROUP_ASSIGNMENTS.labels(result=result).inc()
+    ALERT_GROUPS_ACTIVE.set(active_groups)
+
+
+def record_triage_saved() -> None:
+    ALERT_GROUP_TRIAGES_SAVED.inc()
+
+
+def record_pretriage_webhook(outcome: str, queue_depth: int) -> None:
+    PRETRIAGE_WEBHOOKS.labels(outcome=outcome).inc()
+    PRETRIAGE_QUEUE_DEPTH.set(queue_depth)
+
+
+def record_pretriage_job(outcome: str, wait_seconds: float, run_seconds: float, queue_depth: int) -> None:
+    PRETRIAGE_JOBS.labels(outcome=outcome).inc()
+    PRETRIAGE_LATENCY.labels(stage="queued").observe(wait_seconds)
+    PRETRIAGE_LATENCY.labels(stage="triage").observe(run_seconds)
+    PRETRIAGE_QUEUE_DEPTH.set(queue_depth)
+
+
+def record_pretriage_lookup(result: str) -> None:
+    PRETRIAGE_LOOKUPS.labels(result=result).inc()
+
+
+def record_history_write(outcome: str, count: int = 1) -> None:
+    HISTORY_WRITES.labels(outcome=outcome).inc(count)
+
+
+def record_history_rows(rows: int) -> None:
+    HISTORY_ROWS.set(rows)
+
+
+def record_history_latency(operation: str, duration_seconds: float) -> None:
+    HISTORY_LATENCY.labels(operation=operation).observe(duration_seconds)
+
+
+def record_log_mining(input_chars: int, output_chars: int, duration_seconds: float) -> None:
+    LOG_MINING_CHARS.labels(kind="input").inc(input_chars)
+    LOG_MINING_CHARS.labels(kind="output").inc(output_chars)
+    LOG_MINING_LATENCY.observe(duration_seconds)
+
+
+def record_generation_batch(batch_size: int, generated_tokens: int, duration_seconds: float) -> None:
+    GENERATION_BATCH_SIZE.observe(batch_size)
+    GENERATION_TOKENS.inc(generated_tokens)
+    GENERATION_BATCH_LATENCY.observe(duration_seconds)
+
+
+def record_collections(loaded: int, loaded_bytes: int) -> None:
+    COLLECTIONS_LOADED.set(loaded)
+    COLLECTIONS_LOADED_BYTES.set(loaded_bytes)
+
+
+PID_FILE_RE = re.compile(r"_(\d+)\.db$")
+
+
+def multiproc_dir() -> Optional[str]:
+    return os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+
+
+def prepare_multiproc_dir() -> None:
+    """Empty the multiprocess directory; call once in the master before workers fork."""
+    path = multiproc_dir()
+    if not path:
+        return
+    os.makedirs(path, exist_ok=True)
+    for name in glob.glob(os.path.join(path, "*.db")):
+        os.remove(name)
+
+
+def mark_worker_dead(pid: int) -> None:
+    """Drop a dead worker's live gauges; its counters and histograms are kept."""
+    path = multiproc_dir()
+    if path:
+        multiprocess.mark_process_dead(pid, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def sweep_dead_workers() -> Set[int]:
+    """Mark workers whose pid is gone as dead (covers servers without exit hooks)."""
+    path = multiproc_dir()
+    if not path:
+        return set()
+    pids = set()
+    for name in glob.glob(os.path.join(path, "gauge_live*.db")):
+        match = PID_FILE_RE.search(name)
+        if match:
+            pids.add(int(match.group(1)))
+    dead = {pid for pid in pids if not _pid_alive(pid)}
+    for pid in dead:
+        mark_worker_dead(pid)
+    return dead
+
+
+class ExpositionCache:
+    """Serves the rendered exposition for ``ttl_s`` seconds.
+
+    Aggregating every worker's histograms on each scrape is expensive.
+    Scrapes inside the TTL reuse the last rendering, and only one thread
+    renders at a time, so a burst of scrapers cannot pile up on the CPU that
+    triage requests need.
+    """
+
+    def __init__(self, ttl_s: float, clock=time.monotonic):
+        self.ttl_s = ttl_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._body: Optional[bytes] = None
+        self._rendered_at = 0.0
+
+    def _render(self) -> bytes:
+        if multiproc_dir():
+            sweep_dead_workers()
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            return generate_latest(registry)
+        return generate_latest(REGISTRY)
+
+    def get(self) -> bytes:
+        with self._lock:
+            if self._body is None or self._clock() - self._rendered_at >= self.ttl_s:
+                self._body = self._render()
+                self._rendered_at = self._clock()
+            return self._body
+
+
+_exposition = ExpositionCache(float(os.getenv("METRICS_CACHE_TTL_S", "1")))
+
+
+def render_metrics() -> bytes:
+    return _exposition.get()
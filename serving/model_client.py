@@ -2,13 +2,23 @@ from __future__ import annotations
 
 import json
 import os
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
-from typing import List, Sequence, Tuple
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import httpx
 
 from rag.retriever import Retriever
+from serving.batching import BatchScheduler, GreedyBatchGenerator
+from serving.circuit_breaker import CircuitBreaker
+from serving.deadline import Deadline
+from serving.metrics import record_model_fallback
+from serving.prompt_builder import PromptBuilder
+from serving.replica_pool import ReplicaPool
 from serving.schemas import Hypothesis, IncidentRequest, RemediationStep, TriageResponse
+from serving.sim_backend import LatencySimulator
 from tools.promql_tool import PromQLTool
 from tools.tool_schemas import PromQLQuery, ToolCall
 from tools.validators import ensure_valid_tool_call
@@ -22,9 +32,16 @@ class BaseModelClient:
         incident: IncidentRequest,
         retrieved_chunks: Sequence[Tuple],
         tool: PromQLTool,
+        deadline: Deadline | None = None,
+        metrics_text: str = "",
     ) -> TriageResponse:
+        """``metrics_text`` is a ``[METRIC SUMMARIES]`` block of already-executed queries."""
         raise NotImplementedError
 
+    def _fallback(self, reason: str, incident, retrieved_chunks, tool) -> TriageResponse:
+        record_model_fallback(self.mode, reason)
+        return MockModelClient().generate(incident, retrieved_chunks, tool)
+
 
 class MockModelClient(BaseModelClient):
     mode = "mock"
@@ -34,6 +51,8 @@ class MockModelClient(BaseModelClient):
         incident: IncidentRequest,
         retrieved_chunks: Sequence[Tuple],
         tool: PromQLTool,
+        deadline: Deadline | None = None,
+        metrics_text: str = "",
     ) -> TriageResponse:
         top_chunk_ids = [chunk.id for chunk, _ in retrieved_chunks][:3]
         now = incident.timestamp
@@ -96,58 +115,196 @@ class MockModelClient(BaseModelClient):
         )
 
 
-class TransformersModelClient(BaseModelClient):  # pragma: no cover - placeholder
+class SimulatedModelClient(BaseModelClient):
+    """Mock responses delivered with simulated generation latency and failures."""
+
+    mode = "sim"
+
+    def __init__(self, simulator: LatencySimulator | None = None):
+        self.simulator = simulator or _shared_simulator()
+
+    def generate(
+        self,
+        incident: IncidentRequest,
+        retrieved_chunks: Sequence[Tuple],
+        tool: PromQLTool,
+        deadline: Deadline | None = None,
+        metrics_text: str = "",
+    ) -> TriageResponse:
+        call = self.simulator.begin()
+        try:
+            wait_s = {"ok": call.duration_s, "error": call.ttft_s}.get(call.outcome, self.simulator.profile.hang_s)
+            if deadline is not None and wait_s > deadline.remaining():
+                time.sleep(deadline.remaining())
+                return self._fallback("deadline", incident, retrieved_chunks, tool)
+            time.sleep(wait_s)
+        finally:
+            self.simulator.end()
+        if call.outcome != "ok":
+            return self._fallback(call.outcome, incident, retrieved_chunks, tool)
+        return MockModelClient().generate(incident, retrieved_chunks, tool)
+
+
+@lru_cache(maxsize=1)
+def _shared_simulator() -> LatencySimulator:
+    # One simulator per process so concurrency-dependent slowdown sees all requests.
+    return LatencySimulator()
+
+
+@lru_cache(maxsize=2)
+def _load_local_model(model_name: str) -> Tuple[Any, BatchScheduler, Optional[int]]:  # pragma: no cover - needs transformers
+    from transformers import AutoModelForCausalLM, AutoTokenizer  # type: ignore
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    model.eval()
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id or 0
+    scheduler = BatchScheduler(GreedyBatchGenerator(model, tokenizer.eos_token_id, pad_id))
+    return tokenizer, scheduler, getattr(model.config, "max_position_embeddings", None)
+
+
+class TransformersModelClient(BaseModelClient):  # pragma: no cover - needs transformers
+    """CPU inference through the in-process dynamic batching scheduler.
+
+    The model and scheduler are loaded once per model name and shared, so
+    concurrent triage requests land in the same decode batches.
+    """
+
     mode = "transformers"
 
-    def __init__(self, model_name: str | None = None):
+    def __init__(
+        self,
+        model_name: str | None = None,
+        max_new_tokens: int | None = None,
+        prompt_builder: PromptBuilder | None = None,
+    ):
         self.model_name = model_name or os.getenv("TRANSFORMERS_MODEL", "sshleifer/tiny-gpt2")
+        self.max_new_tokens = max_new_tokens or int(os.getenv("TRANSFORMERS_MAX_NEW_TOKENS", "256"))
+        self.prompt_builder = prompt_builder or PromptBuilder()
+
+    def _encode(self, tokenizer: Any, messages: List[Dict[str, str]]) -> List[int]:
+        if getattr(tokenizer, "chat_template", None):
+            return list(tokenizer.apply_chat_template(messages, add_generation_prompt=True))
+        text = "\n\n".join(m["content"] for m in messages)
+        return list(tokenizer.encode(text))
 
     def generate(
         self,
         incident: IncidentRequest,
         retrieved_chunks: Sequence[Tuple],
         tool: PromQLTool,
+        deadline: Deadline | None = None,
+        metrics_text: str = "",
     ) -> TriageResponse:
-        # Placeholder: delegate to mock for now to keep CPU-friendly path.
-        return MockModelClient().generate(incident, retrieved_chunks, tool)
+        try:
+            tokenizer, scheduler, max_positions = _load_local_model(self.model_name)
+        except Exception:
+            return self._fallback("unavailable", incident, retrieved_chunks, tool)
+        prompt = self.prompt_builder.build(incident, retrieved_chunks, metrics_text=metrics_text)
+        prompt_ids = self._encode(tokenizer, prompt.messages)
+        if max_positions:
+            # Keep the tail: the incident details sit at the end of the prompt.
+            prompt_ids = prompt_ids[-max(max_positions - self.max_new_tokens, 1):]
+        future = scheduler.submit(prompt_ids, self.max_new_tokens)
+        try:
+            result = future.result(timeout=deadline.remaining() if deadline is not None else None)
+        except FutureTimeoutError:
+            future.cancel()
+            return self._fallback("deadline", incident, retrieved_chunks, tool)
+        text = tokenizer.decode(result.token_ids, skip_special_tokens=True)
+        try:
+            return TriageResponse.model_validate_json(text)
+        except ValueError:
+            return self._fallback("unparsable", incident, retrieved_chunks, tool)
+
+
+def _replica_fault(exc: Exception, deadline_bound: bool) -> bool:
+    """Whether a failed call counts against the replicas' health.
+
+    5xx answers, connection errors and the replica's own read timeout do.
+    4xx answers (a bad request) and timeouts cut short by the caller's
+    deadline (``deadline_bound``) do not, nor does an unparsable 2xx body.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    if isinstance(exc, (httpx.TimeoutException, TimeoutError)):
+        return not deadline_bound
+    return isinstance(exc, httpx.TransportError)
 
 
 class VLLMModelClient(BaseModelClient):  # pragma: no cover - network path
     mode = "vllm"
 
-    def __init__(self, endpoint: str):
-        self.endpoint = endpoint.rstrip("/")
+    def __init__(
+        self,
+        endpoints: str | Sequence[str] | ReplicaPool,
+        prompt_builder: PromptBuilder | None = None,
+        hedge: bool = False,
+        breaker: CircuitBreaker | None = None,
+        connect_timeout_s: float | None = None,
+        read_timeout_s: float | None = None,
+    ):
+        if isinstance(endpoints, ReplicaPool):
+            self.pool = endpoints
+        else:
+            urls = [endpoints] if isinstance(endpoints, str) else list(endpoints)
+            self.pool = ReplicaPool(urls, hedge=hedge)
+        self.prompt_builder = prompt_builder or PromptBuilder()
+        self.breaker = breaker or CircuitBreaker.from_env("vllm", probe=self.pool.probe)
+        self.connect_timeout_s = connect_timeout_s or float(os.getenv("VLLM_CONNECT_TIMEOUT_S", "0.5"))
+        self.read_timeout_s = read_timeout_s or float(os.getenv("VLLM_READ_TIMEOUT_S", "10"))
 
     def generate(
         self,
         incident: IncidentRequest,
         retrieved_chunks: Sequence[Tuple],
         tool: PromQLTool,
+        deadline: Deadline | None = None,
+        metrics_text: str = "",
     ) -> TriageResponse:
+        if not self.breaker.allow():
+            return self._fallback("circuit_open", incident, retrieved_chunks, tool)
+        read_s = self.read_timeout_s
+        if deadline is not None:
+            read_s = min(read_s, deadline.remaining())
+            if read_s <= 0:
+                return self._fallback("deadline", incident, retrieved_chunks, tool)
+        prompt = self.prompt_builder.build(incident, retrieved_chunks, metrics_text=metrics_text)
         payload = {
             "model": "vllm",
-            "messages": [
-                {"role": "system", "content": "You are Incident Copilot."},
-                {"role": "user", "content": incident.model_dump_json()},
-            ],
+            "messages": prompt.messages,
         }
+        timeout = httpx.Timeout(read_s, connect=min(self.connect_timeout_s, read_s))
         # If the call fails or endpoint is not reachable, fall back to mock behavior.
         try:
-            response = httpx.post(f"{self.endpoint}/v1/chat/completions", json=payload, timeout=10)
-            response.raise_for_status()
+            response = self.pool.post("/v1/chat/completions", payload, timeout=timeout, total_s=read_s)
             _ = response.json()
-        except Exception:
-            return MockModelClient().generate(incident, retrieved_chunks, tool)
+        except Exception as exc:
+            if _replica_fault(exc, deadline_bound=read_s < self.read_timeout_s):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+            return self._fallback("error", incident, retrieved_chunks, tool)
+        self.breaker.record_success()
         return MockModelClient().generate(incident, retrieved_chunks, tool)
 
 
+@lru_cache(maxsize=4)
+def _shared_vllm_client(endpoints: str, hedge: bool) -> VLLMModelClient:
+    # Routing stats and breaker state must outlive a single request.
+    urls = [url.strip() for url in endpoints.split(",") if url.strip()]
+    return VLLMModelClient(ReplicaPool(urls, hedge=hedge))
+
+
 def get_model_client(mode: str | None = None) -> BaseModelClient:
     mode = (mode or os.getenv("MODEL_MODE", "mock")).lower()
     if mode == "mock":
         return MockModelClient()
+    if mode == "sim":
+        return SimulatedModelClient()
     if mode == "transformers":
         return TransformersModelClient()
     if mode == "vllm":
-        endpoint = os.getenv("VLLM_ENDPOINT", "http://localhost:8001")
-        return VLLMModelClient(endpoint)
+        endpoints = os.getenv("VLLM_ENDPOINTS") or os.getenv("VLLM_ENDPOINT", "http://localhost:8001")
+        return _shared_vllm_client(endpoints, os.getenv("VLLM_HEDGE", "0") == "1")
     raise ValueError(f"Unsupported model mode: {mode}")
@@ -0,0 +1,224 @@
+"""Background triage of alert groups before anyone asks for them.
+
+Webhook deliveries are queued on a bounded queue drained by a small pool of
+worker threads. Pending jobs and finished responses live in a small SQLite
+database (WAL mode) shared by every worker process, so a result triaged by
+one gunicorn worker is served by all of them and a group is deduplicated
+across workers. Results are kept for ``ttl_s``. A group is not queued again
+while the same set of alerts is pending or already triaged, which absorbs
+Alertmanager's repeat notifications; a changed set of firing alerts is
+triaged afresh.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from rag.retriever import DEFAULT_ARTIFACT_DIR
+from serving.metrics import record_pretriage_job, record_pretriage_lookup, record_pretriage_webhook
+from serving.schemas import IncidentRequest, TriageResponse
+
+DEFAULT_PATH = DEFAULT_ARTIFACT_DIR / "pretriage" / "pretriage.db"
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_TTL_S = 3600.0
+DEFAULT_MAX_RESULTS = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    incident_id TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    queued_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    incident_id TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    request_hash TEXT NOT NULL,
+    response TEXT NOT NULL,
+    completed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_completed_at ON results (completed_at);
+"""
+
+logger = logging.getLogger(__name__)
+
+TriageFn = Callable[[IncidentRequest], TriageResponse]
+
+
+def request_hash(incident: IncidentRequest) -> str:
+    """Identity of a triage request's content, so a stored result only answers the same request."""
+    body = incident.model_dump_json(exclude={"similar_incidents"})
+    return hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+
+class PreTriageQueue:
+    def __init__(
+        self,
+        triage_fn: TriageFn,
+        path: Path = DEFAULT_PATH,
+        workers: int = DEFAULT_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        ttl_s: float = DEFAULT_TTL_S,
+        max_results: int = DEFAULT_MAX_RESULTS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.triage_fn = triage_fn
+        self.path = Path(path)
+        self.workers = workers
+        self.ttl_s = ttl_s
+        self.max_results = max_results
+        # Wall-clock time: timestamps are compared across worker processes.
+        self._clock = clock
+        self._queue: "queue.Queue[Optional[Tuple[IncidentRequest, str, float]]]" = queue.Queue(queue_size)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls, triage_fn: TriageFn) -> "PreTriageQueue":
+        return cls(
+            triage_fn,
+            path=Path(os.getenv("PRETRIAGE_PATH", str(DEFAULT_PATH))),
+            workers=int(os.getenv("PRETRIAGE_WORKERS", str(DEFAULT_WORKERS))),
+            queue_size=int(os.getenv("PRETRIAGE_QUEUE_SIZE", str(DEFAULT_QUEUE_SIZE))),
+            ttl_s=float(os.getenv("PRETRIAGE_TTL_S", str(DEFAULT_TTL_S))),
+            max_results=int(os.getenv("PRETRIAGE_MAX_RESULTS", str(DEFAULT_MAX_RESULTS))),
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _start(self) -> None:
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"pretriage-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, incident: IncidentRequest, signature: str) -> str:
+        """Queue ``incident``; returns "queued", "duplicate" or "rejected" (queue full)."""
+        incident_id = incident.incident_id
+        with self._lock:
+            self._start()
+            now = self._clock()
+            conn = self._conn()
+            with conn:
+                # IMMEDIATE takes the write lock up front, so two workers cannot both queue a group.
+                conn.execute("BEGIN IMMEDIATE")
+                # A pending row older than the TTL belongs to a worker that died mid-job.
+                duplicate = conn.execute(
+                    "SELECT 1 FROM pending WHERE incident_id = ? AND signature = ? AND queued_at >= ?"
+                    " UNION ALL"
+                    " SELECT 1 FROM results WHERE incident_id = ? AND signature = ? AND completed_at >= ?",
+                    (incident_id, signature, now - self.ttl_s, incident_id, signature, now - self.ttl_s),
+                ).fetchone()
+                if duplicate:
+                    outcome = "duplicate"
+                else:
+                    try:
+                        self._queue.put_nowait((incident, signature, now))
+                        conn.execute(
+                            "INSERT OR REPLACE INTO pending (incident_id, signature, queued_at) VALUES (?, ?, ?)",
+                            (incident_id, signature, now),
+                        )
+                        outcome = "queued"
+                    except queue.Full:
+                        outcome = "rejected"
+        record_pretriage_webhook(outcome, self.queue_depth)
+        return outcome
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            incident, signature, enqueued_at = item
+            started = self._clock()
+            outcome = "success"
+            try:
+                response = self.triage_fn(incident)
+            except Exception:
+                logger.exception("Background triage failed for %s", incident.incident_id)
+                outcome = "error"
+            finished = self._clock()
+            try:
+                self._complete(incident, signature, response if outcome == "success" else None, finished)
+            except Exception:
+                logger.exception("Storing background triage failed for %s", incident.incident_id)
+                outcome = "error"
+            record_pretriage_job(outcome, started - enqueued_at, finished - started, self.queue_depth)
+            self._queue.task_done()
+
+    def _complete(
+        self, incident: IncidentRequest, signature: str, response: Optional[TriageResponse], finished: float
+    ) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # A newer alert set may have been queued meanwhile; only it clears pending.
+            conn.execute(
+                "DELETE FROM pending WHERE incident_id = ? AND signature = ?", (incident.incident_id, signature)
+            )
+            if response is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO results (incident_id, signature, request_hash, response, completed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (incident.incident_id, signature, request_hash(incident), response.model_dump_json(), finished),
+            )
+            conn.execute("DELETE FROM results WHERE completed_at < ?", (finished - self.ttl_s,))
+            conn.execute(
+                "DELETE FROM results WHERE incident_id IN"
+                " (SELECT incident_id FROM results ORDER BY completed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_results,),
+            )
+
+    def lookup(self, incident_id: str, request: Optional[IncidentRequest] = None) -> Optional[TriageResponse]:
+        """Stored result for ``incident_id``; with ``request``, only if it was triaged from the same content."""
+        row = self._conn().execute(
+            "SELECT request_hash, response FROM results WHERE incident_id = ? AND completed_at >= ?",
+            (incident_id, self._clock() - self.ttl_s),
+        ).fetchone()
+        if row is not None and request is not None and row[0] != request_hash(request):
+            row = None
+        record_pretriage_lookup("hit" if row else "miss")
+        return TriageResponse.model_validate_json(row[1]) if row else None
+
+    def is_pending(self, incident_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM pending WHERE incident_id = ? AND queued_at >= ?",
+            (incident_id, self._clock() - self.ttl_s),
+        ).fetchone()
+        return row is not None
+
+    def join(self) -> None:
+        """Block until every queued job has finished."""
+        self._queue.join()
+
+    def close(self) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from rag.chunking import Chunk
+from serving.metrics import record_prompt
+from serving.prompts import METRICS_HEADER, SYSTEM_PROMPT
+from serving.schemas import IncidentRequest
+from serving.tokenizer import Tokenizer, get_tokenizer
+from tools.tool_schemas import PromQLQuery
+
+DEFAULT_PROMPT_BUDGET_TOKENS = 3072
+TRUNCATION_MARKER = "[truncated]"
+
+
+def tool_schema() -> List[Dict[str, object]]:
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": "promql_query",
+                "description": "Run a Prometheus range query.",
+                "parameters": PromQLQuery.model_json_schema(),
+            },
+        }
+    ]
+
+
+def build_system_message() -> str:
+    """System prompt plus tool schema, serialized byte-stably for prefix caching."""
+    tools = json.dumps(tool_schema(), sort_keys=True, separators=(",", ":"))
+    return f"{SYSTEM_PROMPT}\n\n[TOOLS]\n{tools}"
+
+
+def incident_header(incident: IncidentRequest) -> str:
+    """The ``[INCIDENT]`` block; training data renders incidents the same way."""
+    env = incident.environment
+    metrics = "; ".join(
+        f"{m.name}{json.dumps(m.labels, sort_keys=True)}={m.value}" for m in incident.metrics_snapshot
+    )
+    return "\n".join(
+        [
+            "[INCIDENT]",
+            f"id: {incident.incident_id}",
+            f"title: {incident.title}",
+            f"severity: {incident.severity}",
+            f"timestamp: {incident.timestamp.isoformat()}",
+            f"environment: service={env.service} cluster={env.cluster} region={env.region} deploy={env.deploy_version}",
+            f"alert: {incident.alert_text}",
+            f"metrics_snapshot: {metrics}",
+        ]
+    )
+
+
+@dataclass
+class Section:
+    """A prompt block that can be shrunk to a token budget.
+
+    Sections are filled in ``priority`` order (lower first) after each has
+    been granted ``min_share`` of the flexible budget, so the lowest-priority
+    block is the first to be truncated.
+    """
+
+    name: str
+    priority: int
+    min_share: float
+    render: Callable[[int], Tuple[str, bool]]
+
+
+@dataclass
+class BuiltPrompt:
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    prefix_tokens: int
+    section_tokens: Dict[str, int] = field(default_factory=dict)
+    truncated: List[str] = field(default_factory=list)
+
+
+class PromptBuilder:
+    """Assembles vLLM chat messages within a token budget.
+
+    The system message (system prompt + tool schema) is identical for every
+    request, and runbook chunks come next in id order, so vLLM's automatic
+    prefix caching can reuse as much of the KV cache as possible. Incident
+    specific content follows; logs are truncated first, then similar past
+    incidents, then metric summaries, then the lowest-scoring chunks.
+    """
+
+    def __init__(self, tokenizer: Optional[Tokenizer] = None, budget_tokens: Optional[int] = None):
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.budget_tokens = budget_tokens or int(
+            os.getenv("PROMPT_BUDGET_TOKENS", str(DEFAULT_PROMPT_BUDGET_TOKENS))
+        )
+        self.system_message = build_system_message()
+        self.prefix_tokens = self.tokenizer.count(self.system_message)
+
+    def _chunks_section(self, retrieved: Sequence[Tuple[Chunk, float]]) -> Section:
+        # Rank by retrieval order to decide what survives, render by id so the
+        # same chunk set always produces the same bytes.
+        ranked = [chunk for chunk, _ in retrieved]
+
+        def render(budget: int) -> Tuple[str, bool]:
+            kept: List[Chunk] = []
+            used = self.tokenizer.count("[RUNBOOK CHUNKS]")
+            for chunk in ranked:
+                cost = self.tokenizer.count(f"- {chunk.id}: {chunk.text}")
+                if used + cost > budget:
+                    continue
+                kept.append(chunk)
+                used += cost
+            lines = ["[RUNBOOK CHUNKS]"] + [
+                f"- {chunk.id}: {chunk.text}" for chunk in sorted(kept, key=lambda c: c.id)
+            ]
+            return "\n".join(lines), len(kept) < len(ranked)
+
+        return Section("chunks", priority=0, min_share=0.4, render=render)
+
+    def _lines_section(self, name: str, header: str, body: str, priority: int, min_share: float) -> Section:
+        lines = [line for line in body.splitlines() if line.strip()]
+
+        full = "\n".join([header] + lines)
+        full_tokens = self.tokenizer.count(full)
+
+        def render(budget: int) -> Tuple[str, bool]:
+            if full_tokens <= budget:
+                return full, False
+            out = [header]
+            used = self.tokenizer.count(header) + self.tokenizer.count(TRUNCATION_MARKER) + 4
+            for idx, line in enumerate(lines):
+                cost = self.tokenizer.count(line)
+                if used + cost > budget:
+                    remaining = budget - used
+                    if remaining > 8:
+                        out.append(self.tokenizer.truncate(line, remaining))
+                    out.append(f"{TRUNCATION_MARKER} {len(lines) - idx} more lines")
+                    return "\n".join(out), True
+                out.append(line)
+                used += cost
+            return "\n".join(out), False
+
+        return Section(name, priority=priority, min_share=min_share, render=render)
+
+    def build(
+        self,
+        incident: IncidentRequest,
+        retrieved: Sequence[Tuple[Chunk, float]],
+        metrics_text: str = "",
+        logs_text: Optional[str] = None,
+    ) -> BuiltPrompt:
+        header = incident_header(incident)
+        fixed = self.prefix_tokens + self.tokenizer.count(header)
+        flexible = max(self.budget_tokens - fixed, 0)
+
+        sections = [self._chunks_section(retrieved)]
+        # Accept build_metrics_block output as well as bare summary lines.
+        metrics_text = metrics_text.removeprefix(METRICS_HEADER)
+        if metrics_text.strip():
+            sections.append(self._lines_section("metrics", METRICS_HEADER, metrics_text, 1, 0.3))
+        if incident.similar_incidents:
+            past = "\n".join(
+                f"- {p.incident_id} ({p.timestamp.date().isoformat()}, similarity {p.similarity:.2f}): {p.title}; "
+                + "; ".join(p.summary.splitlines())
+                for p in incident.similar_incidents
+            )
+            sections.append(self._lines_section("similar", "[SIMILAR PAST INCIDENTS]", past, 2, 0.15))
+        logs = incident.logs_text if logs_text is None else logs_text
+        if logs:
+            sections.append(self._lines_section("logs", "[LOGS]", logs, 3, 0.3))
+
+        # Pass 1: natural size of each section; pass 2: grant min shares, then
+        # hand the leftover out in priority order.
+        natural = {s.name: self.tokenizer.count(s.render(flexible)[0]) for s in sections}
+        grants = {s.name: min(natural[s.name], int(flexible * s.min_share)) for s in sections}
+        leftover = flexible - sum(grants.values())
+        for section in sorted(sections, key=lambda s: s.priority):
+            extra = min(natural[section.name] - grants[section.name], max(leftover, 0))
+            grants[section.name] += extra
+            leftover -= extra
+
+        rendered: Dict[str, str] = {}
+        truncated: List[str] = []
+        for section in sections:
+            text, was_truncated = section.render(grants[section.name])
+            rendered[section.name] = text
+            if was_truncated:
+                truncated.append(section.name)
+
+        # Shared-across-incidents content first, incident-specific content last.
+        user_parts = [rendered["chunks"], header]
+        user_parts += [rendered[name] for name in ("similar", "metrics", "logs") if name in rendered]
+        user_message = "\n\n".join(user_parts)
+
+        section_tokens = {name: self.tokenizer.count(text) for name, text in rendered.items()}
+        section_tokens["incident"] = self.tokenizer.count(header)
+        prompt_tokens = self.prefix_tokens + self.tokenizer.count(user_message)
+        record_prompt(prompt_tokens, self.prefix_tokens, truncated)
+        return BuiltPrompt(
+            messages=[
+                {"role": "system", "content": self.system_message},
+                {"role": "user", "content": user_message},
+            ],
+            prompt_tokens=prompt_tokens,
+            prefix_tokens=self.prefix_tokens,
+            section_tokens=section_tokens,
+            truncated=truncated,
+        )
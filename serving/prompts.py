@@ -1,3 +1,7 @@
+import json
+
+METRICS_HEADER = "[METRIC SUMMARIES]"
+
 SYSTEM_PROMPT = """You are Incident Copilot, an expert SRE assistant.
 - Always produce a 5-minute triage checklist.
 - Rank root-cause hypotheses with confidence 0-1 and short rationale.
@@ -11,3 +15,12 @@ def build_context_block(retrieved_chunks):
     for chunk, score in retrieved_chunks:
         lines.append(f"- {chunk.id}: {chunk.text}")
     return "\n".join(lines)
+
+
+def build_metrics_block(summary):
+    lines = [METRICS_HEADER]
+    for series in summary.series:
+        labels = ",".join(f"{k}={v}" for k, v in sorted(series["labels"].items()))
+        features = {k: v for k, v in series.items() if k not in {"query", "labels"}}
+        lines.append(f"- {series['query']} {{{labels}}}: {json.dumps(features, separators=(',', ':'))}")
+    return "\n".join(lines)
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+import httpx
+import numpy as np
+
+from serving.async_utils import BackgroundLoop
+from serving.metrics import record_hedge, record_replica_latency, set_replica_outstanding
+
+DEFAULT_EWMA_ALPHA = 0.2
+DEFAULT_LATENCY_WINDOW = 256
+# Hedging needs a stable tail estimate before it starts firing duplicates.
+MIN_HEDGE_SAMPLES = 20
+
+
+class Replica:
+    def __init__(self, url: str, window: int = DEFAULT_LATENCY_WINDOW):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.ewma_s: Optional[float] = None
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def observe(self, latency_s: float, alpha: float) -> None:
+        self.latencies.append(latency_s)
+        self.ewma_s = latency_s if self.ewma_s is None else alpha * latency_s + (1 - alpha) * self.ewma_s
+
+    def __repr__(self) -> str:
+        return f"Replica({self.url!r}, outstanding={self.outstanding}, ewma_s={self.ewma_s})"
+
+
+class ReplicaPool:
+    """Routes requests across model replicas by least outstanding requests.
+
+    Ties on outstanding count are broken by EWMA latency. With ``hedge``
+    enabled, a request still running after the pool's observed p95 is
+    duplicated to the next-best replica; the first success wins and the
+    other request is cancelled. All bookkeeping happens on one background
+    loop, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        endpoints: Sequence[str],
+        hedge: bool = False,
+        alpha: float = DEFAULT_EWMA_ALPHA,
+        hedge_quantile: float = 95.0,
+        window: int = DEFAULT_LATENCY_WINDOW,
+        max_connections: int = 64,
+    ):
+        if not endpoints:
+            raise ValueError("ReplicaPool needs at least one endpoint")
+        self.replicas = [Replica(url, window) for url in endpoints]
+        self.hedge = hedge
+        self.alpha = alpha
+        self.hedge_quantile = hedge_quantile
+        self.recent: Deque[float] = deque(maxlen=window)
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = BackgroundLoop("replica-pool")
+
+    def pick(self, exclude: Optional[Replica] = None) -> Optional[Replica]:
+        candidates = [r for r in self.replicas if r is not exclude]
+        if not candidates:
+            return None
+        # Unmeasured replicas sort first so every replica gets probed.
+        return min(candidates, key=lambda r: (r.outstanding, r.ewma_s if r.ewma_s is not None else -1.0))
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.replicas) < 2 or len(self.recent) < MIN_HEDGE_SAMPLES:
+            return None
+        return float(np.percentile(np.fromiter(self.recent, dtype=np.float64), self.hedge_quantile))
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            )
+            self._client = httpx.AsyncClient(limits=limits)
+        return self._client
+
+    async def _send(
+        self, replica: Replica, path: str, payload: Dict[str, Any], timeout: httpx.Timeout
+    ) -> httpx.Response:
+        replica.outstanding += 1
+        set_replica_outstanding(replica.url, replica.outstanding)
+        start = time.perf_counter()
+        try:
+            response = await self._get_client().post(f"{replica.url}{path}", json=payload, timeout=timeout)
+            response.raise_for_status()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Failures count as slow so routing steers away from the replica.
+            replica.observe(max(time.perf_counter() - start, replica.ewma_s or 0.0) * 2, self.alpha)
+            raise
+        else:
+            latency = time.perf_counter() - start
+            replica.observe(latency, self.alpha)
+            self.recent.append(latency)
+            record_replica_latency(replica.url, latency)
+            return response
+        finally:
+            replica.outstanding -= 1
+            set_replica_outstanding(replica.url, replica.outstanding)
+
+    async def _post(self, path: str, payload: Dict[str, Any], timeout: httpx.Timeout) -> httpx.Response:
+        primary = self.pick()
+        first = asyncio.ensure_future(self._send(primary, path, payload, timeout))
+        delay = self.hedge_delay()
+        if delay is None:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        secondary = self.pick(exclude=primary)
+        if secondary is None:
+            return await first
+        record_hedge("fired")
+        second = asyncio.ensure_future(self._send(secondary, path, payload, timeout))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        record_hedge("hedge_won" if task is second else "primary_won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _bounded(
+        self, path: str, payload: Dict[str, Any], timeout: httpx.Timeout, total_s: Optional[float]
+    ) -> httpx.Response:
+        if total_s is None:
+            return await self._post(path, payload, timeout)
+        return await asyncio.wait_for(self._post(path, payload, timeout), total_s)
+
+    def post(
+        self,
+        path: str,
+        payload: Dict[str, Any],
+        timeout: httpx.Timeout,
+        total_s: Optional[float] = None,
+    ) -> httpx.Response:
+        """POST to the best replica; ``total_s`` caps the whole exchange, hedges included."""
+        return self._loop.run(self._bounded(path, payload, timeout, total_s))
+
+    async def apost(
+        self,
+        path: str,
+        payload: Dict[str, Any],
+        timeout: httpx.Timeout,
+        total_s: Optional[float] = None,
+    ) -> httpx.Response:
+        return await self._loop.arun(self._bounded(path, payload, timeout, total_s))
+
+    async def _probe(self, path: str, timeout_s: float) -> bool:
+        async def check(replica: Replica) -> bool:
+            try:
+                response = await self._get_client().get(f"{replica.url}{path}", timeout=timeout_s)
+            except httpx.HTTPError:
+                return False
+            return response.status_code < 500
+
+        results = await asyncio.gather(*(check(r) for r in self.replicas))
+        return any(results)
+
+    def probe(self, path: str = "/health", timeout_s: float = 1.0) -> bool:
+        """True if any replica answers its health endpoint."""
+        return self._loop.run(self._probe(path, timeout_s))
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {"url": r.url, "outstanding": r.outstanding, "ewma_s": r.ewma_s} for r in self.replicas
+        ]
+
+    def close(self) -> None:
+        client, self._client = self._client, None
+        self._loop.stop(client.aclose() if client is not None else None)
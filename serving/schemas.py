@@ -3,9 +3,9 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Dict, List, Optional
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
-from tools.tool_schemas import ToolCall
+from tools.tool_schemas import ToolCall, ToolExecution
 
 
 class MetricSnapshot(BaseModel):
@@ -22,6 +22,15 @@ class EnvironmentContext(BaseModel):
     deploy_version: str
 
 
+class PastIncident(BaseModel):
+    incident_id: str
+    title: str
+    timestamp: datetime
+    similarity: float
+    summary: str
+    chunk_ids: List[str] = Field(default_factory=list)
+
+
 class IncidentRequest(BaseModel):
     incident_id: str
     title: str
@@ -31,6 +40,8 @@ class IncidentRequest(BaseModel):
     logs_text: str
     metrics_snapshot: List[MetricSnapshot]
     environment: EnvironmentContext
+    collections: Optional[List[str]] = None
+    similar_incidents: Optional[List[PastIncident]] = None
 
     @field_validator("severity")
     @classmethod
@@ -49,6 +60,15 @@ class RemediationStep(BaseModel):
     citation_ids: List[str] = Field(default_factory=list)
 
 
+class AlertGroup(BaseModel):
+    group_id: str
+    representative_incident_id: str
+    incident_id: str
+    title: str
+    size: int
+    shared: bool
+
+
 class TriageResponse(BaseModel):
     checklist: List[str]
     hypotheses: List[Hypothesis]
@@ -57,3 +77,36 @@ class TriageResponse(BaseModel):
     citations: List[str]
     postmortem: str
     grounded_runbook_ids: Optional[List[str]] = None
+    tool_executions: Optional[List[ToolExecution]] = None
+    alert_group: Optional[AlertGroup] = None
+    similar_incidents: Optional[List[PastIncident]] = None
+
+
+class AlertmanagerAlert(BaseModel):
+    """One alert of an Alertmanager webhook (payload version 4)."""
+
+    model_config = ConfigDict(populate_by_name=True)
+
+    status: str
+    labels: Dict[str, str] = Field(default_factory=dict)
+    annotations: Dict[str, str] = Field(default_factory=dict)
+    starts_at: datetime = Field(alias="startsAt")
+    ends_at: Optional[datetime] = Field(default=None, alias="endsAt")
+    generator_url: str = Field(default="", alias="generatorURL")
+    fingerprint: str = ""
+
+
+class AlertmanagerWebhook(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    version: str = "4"
+    group_key: str = Field(alias="groupKey")
+    status: str
+    receiver: str = ""
+    group_labels: Dict[str, str] = Field(default_factory=dict, alias="groupLabels")
+    common_labels: Dict[str, str] = Field(default_factory=dict, alias="commonLabels")
+    common_annotations: Dict[str, str] = Field(default_factory=dict, alias="commonAnnotations")
+    external_url: str = Field(default="", alias="externalURL")
+    # Alertmanager never sends an empty group; reject one with 422 instead of failing to map it.
+    alerts: List[AlertmanagerAlert] = Field(min_length=1)
+    truncated_alerts: int = Field(default=0, alias="truncatedAlerts")
@@ -0,0 +1,104 @@
+"""Latency model for a simulated generation backend.
+
+Used by ``MODEL_MODE=sim`` in-process and by the OpenAI-compatible stand-in
+server in ``serving.sim_server``. It gives load tests realistic timing
+without a GPU.
+"""
+from __future__ import annotations
+
+import os
+import random
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class LatencyProfile:
+    """Timing knobs for the simulated backend.
+
+    Decode speed is drawn from a lognormal around ``tokens_per_s``. Once more
+    than ``concurrency_knee`` requests are in flight, every extra request
+    slows TTFT and decoding by ``slowdown_per_request``, the way a saturated
+    GPU batch behaves.
+    """
+
+    ttft_ms: float = 250.0
+    ttft_jitter: float = 0.3
+    tokens_per_s: float = 40.0
+    tokens_per_s_sigma: float = 0.25
+    output_tokens: int = 200
+    output_tokens_jitter: float = 0.3
+    concurrency_knee: int = 8
+    slowdown_per_request: float = 0.1
+    error_rate: float = 0.0
+    timeout_rate: float = 0.0
+    hang_s: float = 30.0
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "LatencyProfile":
+        seed = os.getenv("SIM_SEED")
+        return cls(
+            ttft_ms=float(os.getenv("SIM_TTFT_MS", str(cls.ttft_ms))),
+            tokens_per_s=float(os.getenv("SIM_TOKENS_PER_S", str(cls.tokens_per_s))),
+            output_tokens=int(os.getenv("SIM_OUTPUT_TOKENS", str(cls.output_tokens))),
+            concurrency_knee=int(os.getenv("SIM_CONCURRENCY_KNEE", str(cls.concurrency_knee))),
+            slowdown_per_request=float(os.getenv("SIM_SLOWDOWN", str(cls.slowdown_per_request))),
+            error_rate=float(os.getenv("SIM_ERROR_RATE", "0")),
+            timeout_rate=float(os.getenv("SIM_TIMEOUT_RATE", "0")),
+            hang_s=float(os.getenv("SIM_HANG_S", str(cls.hang_s))),
+            seed=int(seed) if seed else None,
+        )
+
+
+@dataclass
+class SimulatedCall:
+    """One sampled request: how long to wait before each emitted token."""
+
+    ttft_s: float
+    per_token_s: float
+    output_tokens: int
+    outcome: str  # "ok", "error" or "timeout"
+
+    @property
+    def duration_s(self) -> float:
+        return self.ttft_s + self.per_token_s * max(self.output_tokens - 1, 0)
+
+
+class LatencySimulator:
+    """Samples :class:`SimulatedCall` plans and tracks in-flight load."""
+
+    def __init__(self, profile: Optional[LatencyProfile] = None):
+        self.profile = profile or LatencyProfile.from_env()
+        self._rng = random.Random(self.profile.seed)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def slowdown(self, in_flight: int) -> float:
+        excess = max(in_flight - self.profile.concurrency_knee, 0)
+        return 1.0 + excess * self.profile.slowdown_per_request
+
+    def begin(self, max_tokens: Optional[int] = None) -> SimulatedCall:
+        """Register a new in-flight request and sample its timing."""
+        p = self.profile
+        with self._lock:
+            self.in_flight += 1
+            factor = self.slowdown(self.in_flight)
+            roll = self._rng.random()
+            ttft = p.ttft_ms / 1000.0 * max(self._rng.gauss(1.0, p.ttft_jitter), 0.1)
+            tps = p.tokens_per_s * self._rng.lognormvariate(0.0, p.tokens_per_s_sigma)
+            tokens = max(int(round(p.output_tokens * max(self._rng.gauss(1.0, p.output_tokens_jitter), 0.1))), 1)
+        if max_tokens is not None:
+            tokens = min(tokens, max_tokens)
+        if roll < p.error_rate:
+            outcome = "error"
+        elif roll < p.error_rate + p.timeout_rate:
+            outcome = "timeout"
+        else:
+            outcome = "ok"
+        return SimulatedCall(ttft * factor, factor / max(tps, 1e-6), tokens, outcome)
+
+    def end(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
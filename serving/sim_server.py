@@ -0,0 +1,105 @@
+"""OpenAI-compatible stand-in for vLLM with simulated latency.
+
+    SIM_TTFT_MS=300 SIM_TOKENS_PER_S=30 uvicorn serving.sim_server:app --port 8001
+
+Point ``VLLM_ENDPOINTS`` at one or more instances to load-test routing,
+hedging, the circuit breaker and caching on a laptop.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+from serving.sim_backend import LatencySimulator, SimulatedCall
+
+FILLER_WORDS = ["check", "latency", "rollback", "deploy", "pool", "saturation", "error", "rate"]
+
+app = FastAPI(title="Simulated model backend")
+simulator = LatencySimulator()
+
+
+class ChatCompletionRequest(BaseModel):
+    model: str = "sim"
+    messages: List[Dict[str, Any]] = []
+    max_tokens: Optional[int] = None
+    stream: bool = False
+
+
+def _token(index: int) -> str:
+    return FILLER_WORDS[index % len(FILLER_WORDS)] + " "
+
+
+def _completion(request: ChatCompletionRequest, call: SimulatedCall, text: str) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-sim-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.model,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+        ],
+        "usage": {"completion_tokens": call.output_tokens},
+    }
+
+
+async def _stream(request: ChatCompletionRequest) -> AsyncIterator[str]:
+    # The call is registered here rather than in the handler so that a stream
+    # the server never starts (client gone before the first byte) is never counted.
+    call = simulator.begin(request.max_tokens)
+    try:
+        await asyncio.sleep(call.ttft_s)
+        if call.outcome == "error":
+            yield f"data: {json.dumps({'error': {'message': 'simulated backend error'}})}\n\n"
+            return
+        if call.outcome == "timeout":
+            await asyncio.sleep(simulator.profile.hang_s)
+            return
+        for index in range(call.output_tokens):
+            if index:
+                await asyncio.sleep(call.per_token_s)
+            chunk = {
+                "object": "chat.completion.chunk",
+                "model": request.model,
+                "choices": [{"index": 0, "delta": {"content": _token(index)}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        done = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(done)}\n\n"
+        yield "data: [DONE]\n\n"
+    finally:
+        simulator.end()
+
+
+@app.get("/health")
+def health() -> dict:
+    return {"status": "ok", "in_flight": simulator.in_flight}
+
+
+@app.get("/v1/models")
+def models() -> dict:
+    return {"object": "list", "data": [{"id": "sim", "object": "model"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest):
+    if request.stream:
+        return StreamingResponse(_stream(request), media_type="text/event-stream")
+    call = simulator.begin(request.max_tokens)
+    try:
+        if call.outcome == "error":
+            await asyncio.sleep(call.ttft_s)
+            return JSONResponse(status_code=500, content={"error": {"message": "simulated backend error"}})
+        if call.outcome == "timeout":
+            await asyncio.sleep(simulator.profile.hang_s)
+            return JSONResponse(status_code=504, content={"error": {"message": "simulated timeout"}})
+        await asyncio.sleep(call.duration_s)
+        text = "".join(_token(i) for i in range(call.output_tokens))
+        return _completion(request, call, text)
+    finally:
+        simulator.end()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+import re
+import zlib
+from functools import lru_cache
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+|[^\w\s]")
+# Typical BPE vocabularies cover about four characters of English per token.
+CHARS_PER_TOKEN = 4
+APPROX_VOCAB_SIZE = 32000
+
+
+class Tokenizer:
+    name: str
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+    def encode(self, text: str) -> List[int]:
+        raise NotImplementedError
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        raise NotImplementedError
+
+
+class ApproxTokenizer(Tokenizer):
+    """Dependency-free BPE approximation: one token per short word or symbol."""
+
+    def __init__(self) -> None:
+        self.name = "approx"
+
+    @staticmethod
+    def _cost(piece: str) -> int:
+        return max(1, math.ceil(len(piece) / CHARS_PER_TOKEN))
+
+    def count(self, text: str) -> int:
+        return sum(self._cost(m.group()) for m in WORD_RE.finditer(text))
+
+    def encode(self, text: str) -> List[int]:
+        """Stable pseudo token ids, one per ``count`` unit (not decodable)."""
+        ids: List[int] = []
+        for match in WORD_RE.finditer(text):
+            piece = match.group()
+            for start in range(0, len(piece), CHARS_PER_TOKEN):
+                ids.append(zlib.crc32(piece[start : start + CHARS_PER_TOKEN].encode("utf-8")) % APPROX_VOCAB_SIZE)
+        return ids
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        used = 0
+        for match in WORD_RE.finditer(text):
+            used += self._cost(match.group())
+            if used > max_tokens:
+                return text[: match.start()].rstrip()
+        return text
+
+
+class HFTokenizer(Tokenizer):  # pragma: no cover - needs a local tokenizer checkout
+    def __init__(self, path: str):
+        from transformers import AutoTokenizer  # type: ignore
+
+        self.name = path
+        self.tokenizer = AutoTokenizer.from_pretrained(path, local_files_only=True)
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text))
+
+    def encode(self, text: str) -> List[int]:
+        return list(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        ids = self.tokenizer.encode(text, add_special_tokens=False)
+        if len(ids) <= max_tokens:
+            return text
+        return str(self.tokenizer.decode(ids[:max_tokens]))
+
+
+@lru_cache(maxsize=4)
+def get_tokenizer(path: Optional[str] = None) -> Tokenizer:
+    """Local tokenizer from ``PROMPT_TOKENIZER`` (a directory), else the approximation."""
+    path = path or os.getenv("PROMPT_TOKENIZER")
+    if path:
+        try:
+            return HFTokenizer(path)
+        except Exception as exc:
+            logger.warning("Falling back to approximate tokenizer, could not load %s: %s", path, exc)
+    return ApproxTokenizer()
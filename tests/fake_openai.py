@@ -0,0 +1,85 @@
+"""Local stand-in for an OpenAI-compatible chat completions server."""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+
+class FakeOpenAI:
+    """Serves ``/v1/chat/completions`` with a canned reply.
+
+    ``delay_s`` adds latency before the body is written and ``status`` forces
+    an error response; every request body is recorded.
+    """
+
+    def __init__(self, delay_s: float = 0.0, content: str = "{}"):
+        self.delay_s = delay_s
+        self.content = content
+        self.status = 200
+        self.requests: List[Dict] = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):  # noqa: D401 - silence test output
+                return
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                fake.requests.append(body)
+                if fake.delay_s:
+                    time.sleep(fake.delay_s)
+                if self.path != "/v1/chat/completions":
+                    self._write(404, {"error": {"message": "no route"}})
+                    return
+                if fake.status != 200:
+                    self._write(fake.status, {"error": {"message": "injected failure"}})
+                    return
+                self._write(200, fake.completion(body))
+
+            def _write(self, status, body):
+                payload = json.dumps(body).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled (e.g. a losing hedged request).
+                    pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def completion(self, body: Dict) -> Dict:
+        return {
+            "id": f"chatcmpl-{len(self.requests)}",
+            "object": "chat.completion",
+            "model": body.get("model", "fake"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.content},
+                    "finish_reason": "stop",
+                }
+            ],
+        }
+
+    def __enter__(self) -> "FakeOpenAI":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
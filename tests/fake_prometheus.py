@@ -0,0 +1,86 @@
+"""Local stand-in for the Prometheus HTTP API used by tool tests."""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+
+class FakePrometheus:
+    """Serves ``/api/v1/query_range`` with deterministic matrices.
+
+    ``series`` controls how many series each response holds, ``delay_s`` adds
+    latency before the body is written, and every request is recorded.
+    """
+
+    def __init__(self, series: int = 1, delay_s: float = 0.0):
+        self.series = series
+        self.delay_s = delay_s
+        self.requests: List[Dict[str, str]] = []
+        self.status = 200
+        self.error_body: Dict[str, str] = {}
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):  # noqa: D401 - silence test output
+                return
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                fake.requests.append(params)
+                if fake.delay_s:
+                    time.sleep(fake.delay_s)
+                if parsed.path != "/api/v1/query_range":
+                    self._write(404, {"status": "error", "errorType": "not_found", "error": "no route"})
+                    return
+                if fake.status != 200:
+                    self._write(fake.status, fake.error_body)
+                    return
+                self._write(200, fake.matrix(params))
+
+            def _write(self, status, body):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def matrix(self, params: Dict[str, str]) -> Dict:
+        start = float(params["start"])
+        end = float(params["end"])
+        step = float(params["step"].rstrip("s"))
+        timestamps = []
+        ts = start
+        while ts <= end:
+            timestamps.append(ts)
+            ts += step
+        result = [
+            {
+                "metric": {"__name__": "up", "instance": f"node-{i}"},
+                "values": [[t, str(i + idx * 0.5)] for idx, t in enumerate(timestamps)],
+            }
+            for i in range(self.series)
+        ]
+        return {"status": "success", "data": {"resultType": "matrix", "result": result}}
+
+    def __enter__(self) -> "FakePrometheus":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
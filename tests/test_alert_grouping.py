@@ -0,0 +1,123 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+import serving.api as api
+from rag.retriever import get_embedder
+from serving.alert_grouping import AlertGrouper
+from serving.schemas import IncidentRequest
+from tests.test_api_mock import _sample_request
+
+
+def _incident(incident_id, alert_text, region="us-east-1"):
+    data = _sample_request()
+    data.update(incident_id=incident_id, alert_text=alert_text)
+    data["environment"]["region"] = region
+    return IncidentRequest(**data)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _grouper(clock=None):
+    return AlertGrouper(get_embedder("hashing"), window_s=60, similarity_threshold=0.7, clock=clock or _Clock())
+
+
+def test_similar_alerts_in_same_environment_share_a_group():
+    grouper = _grouper()
+    first, leader = grouper.assign(_incident("A", "p99 latency above threshold on checkout pods"))
+    second, follower = grouper.assign(_incident("B", "p99 latency above threshold on checkout pod"))
+    other, other_leader = grouper.assign(_incident("C", "disk full on kafka broker volume"))
+    assert leader and not follower and other_leader
+    assert first is second and other is not first
+    assert first.members == ["A", "B"]
+
+
+def test_environment_mismatch_and_window_expiry_split_groups():
+    clock = _Clock()
+    grouper = _grouper(clock)
+    first, _ = grouper.assign(_incident("A", "p99 latency above threshold"))
+    elsewhere, leader = grouper.assign(_incident("B", "p99 latency above threshold", region="eu-west-1"))
+    assert leader and elsewhere is not first
+    clock.now = 120
+    later, leader = grouper.assign(_incident("C", "p99 latency above threshold"))
+    assert leader and later is not first
+    assert grouper.active_clusters == 1
+
+
+def test_api_triages_storm_once(monkeypatch):
+    monkeypatch.setenv("ALERT_GROUPING", "1")
+    monkeypatch.setattr(api, "_grouper", _grouper())
+    calls = []
+    release = threading.Event()
+    run_triage = api._run_triage
+
+    def counting_triage(request, deadline):
+        calls.append(request.incident_id)
+        release.wait(5)
+        return run_triage(request, deadline)
+
+    monkeypatch.setattr(api, "_run_triage", counting_triage)
+    client = TestClient(api.app)
+    results = {}
+
+    def post(incident_id):
+        body = _sample_request()
+        body["incident_id"] = incident_id
+        results[incident_id] = client.post("/v1/triage", json=body).json()
+
+    leader = threading.Thread(target=post, args=("STORM-0",))
+    leader.start()
+    while not calls:
+        threading.Event().wait(0.01)
+    followers = [threading.Thread(target=post, args=(f"STORM-{i}",)) for i in range(1, 4)]
+    for t in followers:
+        t.start()
+    release.set()
+    for t in [leader, *followers]:
+        t.join()
+
+    assert calls == ["STORM-0"]
+    groups = {r["alert_group"]["group_id"] for r in results.values()}
+    assert len(groups) == 1
+    assert results["STORM-3"]["alert_group"]["shared"] is True
+    assert results["STORM-3"]["alert_group"]["incident_id"] == "STORM-3"
+    assert results["STORM-3"]["alert_group"]["representative_incident_id"] == "STORM-0"
+    assert results["STORM-3"]["checklist"] == results["STORM-0"]["checklist"]
+
+
+def test_member_of_a_stuck_group_keeps_budget_to_triage_itself(monkeypatch):
+    monkeypatch.setenv("ALERT_GROUPING", "1")
+    monkeypatch.setenv("TRIAGE_REQUEST_BUDGET_S", "2.0")
+    grouper = _grouper()
+    grouper.wait_share = 0.25
+    monkeypatch.setattr(api, "_grouper", grouper)
+    budgets = {}
+    release = threading.Event()
+    run_triage = api._run_triage
+
+    def stuck_leader(request, deadline):
+        budgets[request.incident_id] = deadline.remaining()
+        if request.incident_id == "STUCK-0":
+            release.wait(5)
+            raise RuntimeError("model hung")
+        return run_triage(request, deadline)
+
+    monkeypatch.setattr(api, "_run_triage", stuck_leader)
+    client = TestClient(api.app)
+    leader = threading.Thread(target=client.post, args=("/v1/triage",), kwargs={"json": {**_sample_request(), "incident_id": "STUCK-0"}})
+    leader.start()
+    while not budgets:
+        threading.Event().wait(0.01)
+    follower = client.post("/v1/triage", json={**_sample_request(), "incident_id": "STUCK-1"}).json()
+    release.set()
+    leader.join()
+
+    # The follower gave up after ~0.5s of its 2s budget and triaged itself with the rest.
+    assert follower["alert_group"]["shared"] is False
+    assert budgets["STUCK-1"] > 1.2
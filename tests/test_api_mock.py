@@ -43,3 +43,33 @@ def test_triage_endpoint_returns_structure():
         call = data["tool_calls"][0]
         assert call["tool_name"] == "promql_query"
         assert "query" in call["arguments"]
+
+
+def test_triage_executes_tool_calls():
+    client = TestClient(app)
+    resp = client.post("/v1/triage", json=_sample_request())
+    data = resp.json()
+    assert data["tool_executions"]
+    assert data["tool_executions"][0]["status"] == "ok"
+
+
+def test_metric_summaries_reach_the_model(monkeypatch):
+    import serving.api as api
+    from serving.model_client import MockModelClient
+
+    seen = {}
+
+    class Recording(MockModelClient):
+        def generate(self, incident, retrieved_chunks, tool, deadline=None, metrics_text=""):
+            seen["metrics_text"] = metrics_text
+            return super().generate(incident, retrieved_chunks, tool)
+
+    monkeypatch.setattr(api, "get_model_client", lambda: Recording())
+    data = TestClient(app).post("/v1/triage", json=_sample_request()).json()
+    assert seen["metrics_text"].startswith("[METRIC SUMMARIES]")
+    assert 'http_request_latency_seconds_p99{region="us-east-1",service="demo"}' in seen["metrics_text"]
+    assert data["tool_executions"][0]["query"].startswith("http_request_latency_seconds_p99{")
+
+    monkeypatch.setenv("EXECUTE_TOOL_CALLS", "0")
+    data = TestClient(app).post("/v1/triage", json=_sample_request()).json()
+    assert seen["metrics_text"] == "" and data["tool_executions"] is None
@@ -0,0 +1,66 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from serving.batching import BatchScheduler, GenerationResult, GreedyBatchGenerator
+
+
+class ToyLM(torch.nn.Module):
+    """Causal LM whose next token depends on the masked sum of all prior tokens."""
+
+    def __init__(self, vocab=32, dim=16):
+        super().__init__()
+        torch.manual_seed(0)
+        self.embed = torch.nn.Embedding(vocab, dim)
+        self.pos = torch.nn.Embedding(256, dim)
+        self.head = torch.nn.Linear(dim, vocab)
+
+    def forward(self, input_ids, attention_mask, position_ids, past_key_values=None, use_cache=True):
+        mask = attention_mask[:, -input_ids.shape[1]:].unsqueeze(-1)
+        state = (self.embed(input_ids) * mask).sum(1, keepdim=True)
+        if past_key_values is not None:
+            state = state + past_key_values[0][0]
+        logits = self.head(state + self.pos(position_ids[:, -1:]))
+        return SimpleNamespace(logits=logits, past_key_values=((state,),))
+
+
+def test_scheduler_groups_concurrent_requests():
+    sizes = []
+    release = threading.Event()
+
+    def batch_fn(batch):
+        release.wait(1)
+        sizes.append(len(batch))
+        return [GenerationResult(r.prompt_ids[:1] * r.max_new_tokens, False) for r in batch]
+
+    scheduler = BatchScheduler(batch_fn, max_batch_size=4, max_wait_ms=50)
+    futures = [scheduler.submit([i], 2) for i in range(6)]
+    release.set()
+    results = [f.result(timeout=2) for f in futures]
+    scheduler.close()
+    assert [r.token_ids for r in results] == [[i, i] for i in range(6)]
+    assert max(sizes) == 4 and sum(sizes) == 6
+
+
+def test_batched_decoding_matches_single_requests():
+    generator = GreedyBatchGenerator(ToyLM(), eos_token_id=None, pad_token_id=0)
+    scheduler = BatchScheduler(generator, max_batch_size=8, max_wait_ms=50)
+    prompts = [([3, 4, 5], 6), ([7], 2), ([1, 2], 4)]
+    batched = [f.result(timeout=5) for f in [scheduler.submit(p, n) for p, n in prompts]]
+    scheduler.close()
+    single = [generator([SimpleNamespace(prompt_ids=p, max_new_tokens=n)])[0] for p, n in prompts]
+    assert [r.token_ids for r in batched] == [r.token_ids for r in single]
+    assert [len(r.token_ids) for r in batched] == [6, 2, 4]
+
+
+def test_tiny_random_hf_model_batches():
+    transformers = pytest.importorskip("transformers")
+    config = transformers.GPT2Config(n_layer=2, n_head=2, n_embd=32, vocab_size=64, n_positions=64)
+    model = transformers.GPT2LMHeadModel(config).eval()
+    generator = GreedyBatchGenerator(model, eos_token_id=None, pad_token_id=0)
+    requests = [SimpleNamespace(prompt_ids=[5, 6, 7], max_new_tokens=4), SimpleNamespace(prompt_ids=[9], max_new_tokens=2)]
+    batched = generator(requests)
+    single = [generator([r])[0] for r in requests]
+    assert [r.token_ids for r in batched] == [r.token_ids for r in single]
@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+
+from rag.chunking import Chunk
+from rag.retriever import get_embedder
+from serving.incident_history import IncidentHistory
+from serving.model_client import MockModelClient
+from serving.prompt_builder import PromptBuilder
+from serving.schemas import IncidentRequest
+from tools.promql_tool import PromQLTool
+from training.build_dataset import build_dataset, render_messages, shard_paths
+from training.dedup import Deduplicator, MinHasher, dedup_keys
+
+with open("data/eval_set.jsonl") as f:
+    EVAL = [json.loads(line) for line in f]
+
+
+def test_minhash_lsh_flags_near_duplicates_only():
+    hasher = MinHasher()
+    dedup = Deduplicator(initial_capacity=100)
+    text = " ".join(f"step{i} check the connection pool and roll back deploy" for i in range(40))
+    near = text.replace("step7 ", "step7b ")
+    other = " ".join(f"item{i} kafka consumer lag on ledger topic grows" for i in range(40))
+    verdicts = [dedup.check(*dedup_keys(t, hasher)) for t in (text, text.upper(), near, other)]
+    assert verdicts == [None, "exact", "near", None]
+    exact, bands = zip(*(dedup_keys(t, hasher) for t in (other, text, near)))
+    assert Deduplicator().check_batch(np.array(exact, dtype=np.uint64), np.stack(bands)) == [None, None, "near"]
+
+
+def test_build_writes_deduplicated_shards_and_manifest(tmp_path):
+    history = IncidentHistory(tmp_path / "history.db", get_embedder("hashing"), flush_interval_s=0.05)
+    incident = IncidentRequest(**EVAL[0])
+    history.record(incident, [], MockModelClient().generate(incident, [], PromQLTool(mode="mock")))
+    history.close()
+
+    refire = {**EVAL[1], "incident_id": "EVAL-002-refire", "timestamp": "2024-07-03T11:20:00Z"}
+    near = {**EVAL[1], "incident_id": "EVAL-002-b", "logs_text": EVAL[1]["logs_text"].replace("12s", "14s")}
+    data = tmp_path / "incidents.jsonl"
+    data.write_text("\n".join(json.dumps(r) for r in [EVAL[0], EVAL[1], refire, near]) + "\n")
+
+    out_dir = tmp_path / "training"
+    manifest = build_dataset(
+        out_dir,
+        [data],
+        history=tmp_path / "history.db",
+        artifact_dir=tmp_path / "artifacts",
+        workers=2,
+        batch_size=2,
+        shard_size=2,
+    )
+    assert manifest["sources"]["history"] == {"read": 1, "kept": 1, "exact_duplicates": 0, "near_duplicates": 0}
+    # EVAL-001 is already in the history; a re-fire differing only in id and timestamp is an
+    # exact duplicate, and one with a slightly different log line is a near duplicate.
+    assert manifest["sources"]["incidents"] == {"read": 4, "kept": 1, "exact_duplicates": 2, "near_duplicates": 1}
+    assert manifest["records"] == 2
+    paths = shard_paths(out_dir)
+    assert [s["records"] for s in manifest["shards"]] == [2]
+    assert json.loads((out_dir / "manifest.json").read_text()) == manifest
+
+    records = [json.loads(line) for path in paths for line in open(path)]
+    assert [r["id"] for r in records] == ["history:EVAL-001", "incidents:EVAL-002"]
+    text = records[1]["text"]
+    assert text.startswith("<|im_start|>system\nYou are Incident Copilot")
+    assert "[RUNBOOK CHUNKS]\n- " in text and "[INCIDENT]\nid: EVAL-002" in text
+    assert text.endswith("<|im_end|>\n") and "tool_executions" not in text
+
+
+def test_training_prompt_matches_serving():
+    incident = IncidentRequest(**EVAL[1])
+    chunks = [(Chunk(id="rbk-db", text="Check slow queries and replication lag.", metadata={}), 0.9)]
+    response = MockModelClient().generate(incident, chunks, PromQLTool(mode="mock"))
+    messages = render_messages(incident, chunks, response)
+    assert messages[:2] == PromptBuilder().build(incident, chunks).messages
+    assert "[TOOLS]" in messages[0]["content"]
+    assert messages[2]["role"] == "assistant"
@@ -0,0 +1,103 @@
+import threading
+import time
+
+from serving.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from serving.deadline import Deadline
+from serving.model_client import VLLMModelClient
+from serving.prompt_builder import PromptBuilder
+from serving.replica_pool import ReplicaPool
+from serving.schemas import IncidentRequest
+from serving.tokenizer import ApproxTokenizer
+from tests.fake_openai import FakeOpenAI
+from tests.test_prompt_builder import SAMPLE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_consecutive_failures_and_recovers_via_trial():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout_s=5, clock=clock)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    clock.now = 6
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # only one trial at a time
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_opens_on_error_rate():
+    breaker = CircuitBreaker("test", failure_threshold=100, error_rate_threshold=0.5, min_calls=4)
+    for ok in (True, False, True, False):
+        breaker.record_success() if ok else breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_background_probe_closes_circuit():
+    clock = FakeClock()
+    probed = threading.Event()
+
+    def probe():
+        probed.set()
+        return True
+
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout_s=1, probe=probe, clock=clock)
+    breaker.record_failure()
+    clock.now = 2
+    assert not breaker.allow()  # traffic keeps falling back while the probe runs
+    assert probed.wait(1)
+    for _ in range(50):
+        if breaker.state == CLOSED:
+            break
+        time.sleep(0.01)
+    assert breaker.state == CLOSED
+
+
+def test_open_circuit_falls_back_without_waiting():
+    with FakeOpenAI(delay_s=2.0) as slow:
+        pool = ReplicaPool([slow.url])
+        breaker = CircuitBreaker("vllm-test", failure_threshold=1, reset_timeout_s=60)
+        builder = PromptBuilder(tokenizer=ApproxTokenizer())
+        client = VLLMModelClient(pool, prompt_builder=builder, breaker=breaker, read_timeout_s=0.2)
+        try:
+            first = client.generate(IncidentRequest(**SAMPLE), [], tool=None)
+            assert breaker.state == OPEN
+            start = time.perf_counter()
+            second = client.generate(IncidentRequest(**SAMPLE), [], tool=None)
+            assert time.perf_counter() - start < 0.1
+        finally:
+            pool.close()
+    assert first.checklist and second.checklist
+    assert len(slow.requests) == 1
+
+
+def test_client_errors_and_caller_deadline_do_not_trip_the_breaker():
+    with FakeOpenAI(delay_s=0.3) as server:
+        pool = ReplicaPool([server.url])
+        breaker = CircuitBreaker("vllm-test", failure_threshold=1, reset_timeout_s=60)
+        builder = PromptBuilder(tokenizer=ApproxTokenizer())
+        client = VLLMModelClient(pool, prompt_builder=builder, breaker=breaker, read_timeout_s=5)
+        incident = IncidentRequest(**SAMPLE)
+        try:
+            # The request's own deadline expires before the replica answers.
+            assert client.generate(incident, [], tool=None, deadline=Deadline(0.1)).checklist
+            server.delay_s = 0.0
+            server.status = 400
+            client.generate(incident, [], tool=None)
+            assert breaker.state == CLOSED
+            server.status = 503
+            client.generate(incident, [], tool=None)
+            assert breaker.state == OPEN
+        finally:
+            pool.close()
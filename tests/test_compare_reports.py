@@ -0,0 +1,35 @@
+import json
+
+from eval.compare_reports import compare_reports, main
+from eval.metrics import latency_summary
+
+
+def _report(p99_ms, groundedness=1.0, hallucinations=0.0):
+    return {
+        "metrics": {"groundedness_rate": groundedness, "hallucination_flag_rate": hallucinations},
+        "latency_ms": {"total": {"p50": 100.0, "p99": p99_ms, "max": p99_ms}},
+    }
+
+
+def test_latency_summary_percentiles():
+    summary = latency_summary(list(range(1, 101)))
+    assert summary["p50"] == 50.5
+    assert summary["max"] == 100.0
+    assert round(summary["p99"], 2) == 99.01
+
+
+def test_tail_regression_is_flagged_within_tolerance_is_not():
+    deltas = {d.name: d for d in compare_reports(_report(200.0), _report(215.0), latency_tolerance=0.1)}
+    assert not deltas["latency.total.p99"].regressed
+    deltas = {d.name: d for d in compare_reports(_report(200.0), _report(260.0), latency_tolerance=0.1)}
+    assert deltas["latency.total.p99"].regressed
+    assert not deltas["latency.total.p50"].regressed
+
+
+def test_quality_direction_and_exit_code(tmp_path):
+    baseline, candidate = tmp_path / "a.json", tmp_path / "b.json"
+    baseline.write_text(json.dumps(_report(200.0)))
+    candidate.write_text(json.dumps(_report(200.0, groundedness=0.99, hallucinations=0.05)))
+    assert main([str(baseline), str(candidate)]) == 1
+    candidate.write_text(json.dumps(_report(200.0, groundedness=0.99)))
+    assert main([str(baseline), str(candidate)]) == 0
@@ -0,0 +1,153 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import serving.api as api
+from rag.chunking import Chunk
+from rag.retriever import faiss, get_embedder
+from serving.incident_history import IncidentHistory
+from serving.model_client import MockModelClient
+from serving.prompt_builder import PromptBuilder
+from serving.schemas import IncidentRequest
+from serving.tokenizer import ApproxTokenizer
+from tests.test_api_mock import _sample_request
+from tools.promql_tool import PromQLTool
+
+with open("data/sample_incidents.jsonl") as f:
+    SAMPLE = json.loads(f.readline())
+
+CHUNKS = [(Chunk(id="rbk-a", text="Roll back the deploy", metadata={}), 0.9)]
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _incident(incident_id, alert_text):
+    return IncidentRequest(**{**SAMPLE, "incident_id": incident_id, "alert_text": alert_text})
+
+
+def _record(history, incident):
+    response = MockModelClient().generate(incident, CHUNKS, PromQLTool(mode="mock"))
+    history.record(incident, CHUNKS, response)
+
+
+def test_similar_past_incidents_survive_restart(tmp_path):
+    path = tmp_path / "history.db"
+    history = IncidentHistory(path, get_embedder("hashing"), flush_interval_s=0.05)
+    _record(history, _incident("INC-1", "checkout p99 latency above threshold after deploy"))
+    _record(history, _incident("INC-2", "kafka consumer lag growing on ledger topic"))
+    history.flush()
+    history.close()
+
+    reopened = IncidentHistory(path, get_embedder("hashing"), flush_interval_s=0.05)
+    reopened.flush()  # existing rows load on the writer thread
+    assert reopened.size == 2
+    query = _incident("INC-3", "checkout p99 latency above threshold")
+    similar = reopened.similar(query, k=1)
+    assert [p.incident_id for p in similar] == ["INC-1"]
+    assert similar[0].chunk_ids == ["rbk-a"]
+    assert "hypothesis:" in similar[0].summary
+    # Earlier runs of the same incident are not offered as its own history.
+    assert all(p.incident_id != "INC-1" for p in reopened.similar(_incident("INC-1", query.alert_text)))
+
+    prompt = PromptBuilder(tokenizer=ApproxTokenizer(), budget_tokens=4096).build(
+        query.model_copy(update={"similar_incidents": similar}), CHUNKS
+    )
+    assert "[SIMILAR PAST INCIDENTS]\n- INC-1" in prompt.messages[1]["content"]
+    reopened.close()
+
+
+def test_compaction_bounds_age_and_rows(tmp_path):
+    clock = _Clock()
+    history = IncidentHistory(
+        tmp_path / "history.db",
+        get_embedder("hashing"),
+        retention_days=1,
+        max_rows=2,
+        flush_interval_s=0.05,
+        compact_interval_s=float("inf"),
+        clock=clock,
+    )
+    _record(history, _incident("OLD", "disk full on node"))
+    history.flush()
+    clock.now += 2 * 86400
+    for i in range(3):
+        _record(history, _incident(f"NEW-{i}", f"disk full on node {i}"))
+    history.flush()
+    assert history.size == 4
+
+    assert history.compact() == 2
+    assert history.size == 2
+    remaining = {p.incident_id for p in history.similar(_incident("Q", "disk full on node"), k=5)}
+    assert remaining == {"NEW-1", "NEW-2"}
+    history.close()
+
+
+def test_api_feeds_past_incidents_into_triage(tmp_path, monkeypatch):
+    history = IncidentHistory(tmp_path / "history.db", get_embedder("hashing"), flush_interval_s=0.05)
+    monkeypatch.setenv("INCIDENT_HISTORY", "1")
+    monkeypatch.setattr(api, "_history", history)
+    client = TestClient(api.app)
+    first = client.post("/v1/triage", json=_sample_request()).json()
+    assert first["similar_incidents"] is None
+    history.flush()
+
+    second = client.post("/v1/triage", json={**_sample_request(), "incident_id": "TEST-2"}).json()
+    assert [p["incident_id"] for p in second["similar_incidents"]] == ["TEST-1"]
+    history.close()
+
+
+def test_api_opens_history_at_startup(tmp_path, monkeypatch):
+    monkeypatch.setenv("INCIDENT_HISTORY", "1")
+    monkeypatch.setenv("INCIDENT_HISTORY_PATH", str(tmp_path / "history.db"))
+    monkeypatch.setenv("INCIDENT_HISTORY_EMBEDDER", "hashing")
+    monkeypatch.setattr(api, "_history", None)
+    with TestClient(api.app) as client:
+        history = api._history
+        assert history is not None
+        client.post("/v1/triage", json=_sample_request())
+        history.flush()
+        assert history.size == 1
+    assert not history._writer.is_alive()
+
+
+def test_rows_compacted_by_another_process_leave_this_index(tmp_path):
+    path = tmp_path / "history.db"
+    clock = _Clock()
+    reader = IncidentHistory(path, get_embedder("hashing"), flush_interval_s=0.05, compact_interval_s=float("inf"))
+    writer = IncidentHistory(
+        path, get_embedder("hashing"), max_rows=1, flush_interval_s=0.05, compact_interval_s=float("inf"), clock=clock
+    )
+    _record(writer, _incident("OLD", "disk full on node"))
+    writer.flush()
+    clock.now += 1
+    _record(writer, _incident("NEW", "disk full on node again"))
+    writer.flush()
+    reader._sync()
+    assert reader.size == 2
+
+    assert writer.compact() == 1
+    reader._sync()
+    assert reader.size == 1
+    assert [p.incident_id for p in reader.similar(_incident("Q", "disk full on node"), k=5)] == ["NEW"]
+    reader.close()
+    writer.close()
+
+
+def test_product_quantized_index_bounds_memory(tmp_path):
+    history = IncidentHistory(
+        tmp_path / "history.db", get_embedder("hashing"), ivf_threshold=200, pq_m=32, flush_interval_s=0.05
+    )
+    for i in range(300):
+        _record(history, _incident(f"INC-{i}", f"service svc{i} error budget burn alert {i}"))
+    history.flush()
+    assert history.size == 300
+    assert isinstance(history._index, faiss.IndexIVFPQ) and history._index.pq.M == 32
+    found = history.similar(_incident("Q", "service svc7 error budget burn alert 7"), k=3)
+    assert "INC-7" in [p.incident_id for p in found]
+    history.close()
@@ -0,0 +1,75 @@
+import json
+
+from serving.schemas import IncidentRequest
+from tools.log_templates import LogTemplateMiner, compact_incident_logs, summarize_logs
+
+with open("data/sample_incidents.jsonl") as f:
+    SAMPLE = json.loads(f.readline())
+
+
+def _spam(n):
+    lines = []
+    for i in range(n):
+        lines.append(f"INFO request id={i} served in {i % 90}ms from 10.0.0.{i % 250}")
+        if i % 10 == 0:
+            lines.append(f"ERROR timeout contacting payments after {i}ms attempt={i % 3}")
+        if i % 50 == 0:
+            lines.append(f"ERROR ConnectionResetError: peer reset on conn {i:08x}")
+    return "\n".join(lines)
+
+
+def test_repeated_lines_collapse_into_templates_with_samples():
+    summary = summarize_logs(_spam(2000), max_chars=2000)
+    assert summary.total_lines == 2000 + 200 + 40
+    assert len(summary.templates) == 3
+    # Everything fits, so templates stay in first-seen order.
+    lines = summary.text.splitlines()
+    assert lines[0].startswith("[x2000] INFO request id=<*>")
+    assert lines[1].startswith("[x200] ERROR timeout contacting payments after <*> attempt=<*>")
+    assert "(e.g." in lines[1]
+    assert "ConnectionResetError" in summary.error_signatures
+    assert summary.output_chars < summary.input_chars / 100
+
+
+def test_output_and_memory_are_bounded():
+    unique = "\n".join(f"event {chr(97 + i % 26)}{i} happened" for i in range(5000))
+    miner = LogTemplateMiner(max_templates=50, similarity_threshold=0.9)
+    summary = miner.feed(unique.splitlines()).summary(max_chars=300)
+    assert len(summary.templates) <= 50
+    assert summary.dropped_lines > 0
+    assert len(summary.text) < 400
+
+
+def test_short_logs_pass_through_verbatim():
+    text = "WARN upstream_timeout service=web tier=gateway\nERROR timeout contacting payments dependency"
+    summary = summarize_logs(text)
+    assert summary.text == text
+
+
+def test_first_seen_order_is_kept_when_nothing_is_dropped():
+    text = "\n".join(["INFO deploy started", "WARN pool saturated", "ERROR payments timeout", "INFO deploy done"])
+    assert summarize_logs(text).text == text
+
+
+def test_short_incident_logs_are_not_rewritten(monkeypatch):
+    monkeypatch.delenv("LOG_MINING_MIN_CHARS", raising=False)
+    short = IncidentRequest(**{**SAMPLE, "logs_text": "ERROR a\nERROR a\nERROR a"})
+    assert compact_incident_logs(short).logs_text == short.logs_text
+    long = IncidentRequest(**{**SAMPLE, "logs_text": _spam(2000)})
+    assert compact_incident_logs(long).logs_text.startswith("[x2000] INFO request id=<*>")
+
+
+def test_marker_lines_count_against_the_cap():
+    unique = "\n".join(f"event {chr(97 + i % 26)}{i} happened" for i in range(5000))
+    for max_chars in (100, 120, 300):
+        miner = LogTemplateMiner(max_templates=50, similarity_threshold=0.9)
+        summary = miner.feed(unique.splitlines()).summary(max_chars=max_chars)
+        assert "more templates omitted" in summary.text and "rare lines not templated" in summary.text
+        assert summary.output_chars <= max_chars
+
+
+def test_oversized_top_template_is_truncated_not_dropped():
+    summary = summarize_logs(_spam(2000), max_chars=40)
+    first = summary.text.splitlines()[0]
+    assert first.startswith("[x") and first.endswith("...") and len(first) < 40
+    assert "more templates omitted" in summary.text
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+from prometheus_client import CollectorRegistry, multiprocess
+
+from serving.metrics import ExpositionCache
+
+WORKER = """
+from serving.metrics import record_collections, record_request
+record_request("success", 0.1)
+record_collections(2, 1024)
+"""
+
+
+def _run_worker(env):
+    subprocess.run([sys.executable, "-c", WORKER], env=env, check=True, cwd=os.getcwd())
+
+
+def _samples(path):
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=str(path))
+    return {(s.name, tuple(sorted(s.labels.items()))): s.value for m in registry.collect() for s in m.samples}
+
+
+def test_workers_aggregate_and_dead_gauges_are_swept(tmp_path):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path), "PYTHONPATH": os.getcwd()}
+    _run_worker(env)
+    _run_worker(env)
+    samples = _samples(tmp_path)
+    assert samples[("triage_requests_total", (("outcome", "success"),))] == 2
+    per_worker = [k for k in samples if k[0] == "triage_rag_collections_loaded"]
+    worker_pids = {dict(k[1])["pid"] for k in per_worker}
+    assert len(worker_pids) == 2
+
+    sweep = "from serving.metrics import sweep_dead_workers; print(len(sweep_dead_workers()))"
+    out = subprocess.run([sys.executable, "-c", sweep], env=env, check=True, capture_output=True, text=True)
+    assert out.stdout.strip() == "2"
+    samples = _samples(tmp_path)
+    remaining = {dict(k[1])["pid"] for k in samples if k[0] == "triage_rag_collections_loaded"}
+    assert not remaining & worker_pids
+    assert samples[("triage_requests_total", (("outcome", "success"),))] == 2
+
+
+def test_exposition_is_cached_within_ttl():
+    now = {"t": 0.0}
+    cache = ExpositionCache(ttl_s=5, clock=lambda: now["t"])
+    renders = []
+    cache._render = lambda: renders.append(1) or b"body"
+    cache.get()
+    cache.get()
+    now["t"] = 6
+    cache.get()
+    assert len(renders) == 2
@@ -0,0 +1,66 @@
+import json
+
+from eval import offline_eval
+from eval.offline_eval import ensure_retriever, load_checkpoint, run_eval
+
+DATA = "data/eval_set.jsonl"
+
+
+def _incidents(tmp_path, count):
+    with open(DATA) as f:
+        base = json.loads(f.readline())
+    path = tmp_path / "eval.jsonl"
+    with path.open("w") as f:
+        for i in range(count):
+            f.write(json.dumps({**base, "incident_id": f"INC-{i}"}) + "\n")
+    return path
+
+
+def test_concurrent_run_checkpoints_every_sample(tmp_path):
+    data = _incidents(tmp_path, 12)
+    retriever = ensure_retriever(tmp_path / "artifacts")
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    report = run_eval(data, retriever, "mock", checkpoint, concurrency=4, batch_size=5)
+    records = load_checkpoint(checkpoint)
+    assert sorted(r["incident_id"] for r in records) == sorted(f"INC-{i}" for i in range(12))
+    assert len(report["samples"]) == 12
+    # 12 samples in batches of 5: one retrieval timing per batch, gated like any other stage.
+    assert len({r["retrieval_batch"]["id"] for r in records}) == 3
+    assert report["latency_ms"]["retrieval"]["max"] > 0
+    assert report["metrics"]["citation_coverage_rate"] == 1.0
+
+
+def test_resume_skips_completed_samples_and_torn_lines(tmp_path):
+    data = _incidents(tmp_path, 6)
+    retriever = ensure_retriever(tmp_path / "artifacts")
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    run_eval(data, retriever, "mock", checkpoint, limit=3)
+    with checkpoint.open("a") as f:
+        f.write('{"incident_id": "INC-3", "lat')  # crash mid-write
+    report = run_eval(data, retriever, "mock", checkpoint, resume=True)
+    ids = [r["incident_id"] for r in load_checkpoint(checkpoint)]
+    assert sorted(ids) == [f"INC-{i}" for i in range(6)]
+    assert len(report["samples"]) == 6
+
+
+def test_failed_samples_are_recorded_and_retried_on_resume(tmp_path, monkeypatch):
+    data = _incidents(tmp_path, 4)
+    retriever = ensure_retriever(tmp_path / "artifacts")
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    real_run_sample = offline_eval.run_sample
+
+    def flaky(incident, *args):
+        if incident.incident_id == "INC-2":
+            raise RuntimeError("backend unavailable")
+        return real_run_sample(incident, *args)
+
+    monkeypatch.setattr(offline_eval, "run_sample", flaky)
+    report = run_eval(data, retriever, "mock", checkpoint)
+    assert report["failed"] == [{"incident_id": "INC-2", "error": "RuntimeError: backend unavailable"}]
+    assert len(report["samples"]) == 3 and report["metrics"]["failed_sample_rate"] == 0.25
+    assert set(report["latency_ms"]) == {"total", "generation", "tool_validation", "retrieval"}
+    assert report["metrics"]["retrieval_amortized_ms_avg"] > 0
+
+    monkeypatch.setattr(offline_eval, "run_sample", real_run_sample)
+    report = run_eval(data, retriever, "mock", checkpoint, resume=True)
+    assert report["failed"] == [] and len(report["samples"]) == 4
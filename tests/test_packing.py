@@ -0,0 +1,146 @@
+import json
+from dataclasses import asdict
+
+import pytest
+import torch
+
+from serving.tokenizer import ApproxTokenizer
+from training.packing import (
+    IGNORE_INDEX,
+    Example,
+    PackedCollator,
+    length_batches,
+    pack,
+    pack_dpo_dataset,
+    pack_examples,
+    pack_sft_dataset,
+    segment_logps,
+    tokenize_messages,
+    tokenize_preference,
+)
+from training.sft_unsloth import packed_attention
+
+with open("data/eval_set.jsonl") as f:
+    EVAL = [json.loads(line) for line in f]
+
+TOKENIZER = ApproxTokenizer()
+
+
+def _record(i: int) -> dict:
+    incident = EVAL[i % len(EVAL)]
+    answer = json.dumps({"summary": incident["title"], "checklist": ["step"] * (1 + i % 7)})
+    return {
+        "messages": [
+            {"role": "system", "content": "You are Incident Copilot."},
+            {"role": "user", "content": f"{incident['alert_text']}\n{incident['logs_text'][: 40 * (i % 9)]}"},
+            {"role": "assistant", "content": answer},
+        ]
+    }
+
+
+class ToyCausalLM(torch.nn.Module):
+    """One attention layer with learned positions: enough to expose cross-example leakage."""
+
+    def __init__(self, vocab: int = 32000, dim: int = 16):
+        super().__init__()
+        torch.manual_seed(0)
+        self.embed = torch.nn.Embedding(vocab, dim)
+        self.pos = torch.nn.Embedding(512, dim)
+        self.qkv = torch.nn.Linear(dim, 3 * dim)
+        self.head = torch.nn.Linear(dim, vocab)
+
+    def forward(self, input_ids, position_ids, attention_mask):
+        h = self.embed(input_ids) + self.pos(position_ids)
+        q, k, v = self.qkv(h).unsqueeze(1).chunk(3, dim=-1)
+        out = torch.nn.functional.scaled_dot_product_attention(
+            q, k, v, attn_mask=attention_mask, is_causal=attention_mask is None
+        )
+        return self.head(h + out.squeeze(1))
+
+
+def test_approx_tokenizer_encode_matches_count():
+    text = EVAL[0]["logs_text"]
+    ids = TOKENIZER.encode(text)
+    assert len(ids) == TOKENIZER.count(text)
+    assert ids == TOKENIZER.encode(text) and len(set(ids)) > 1
+
+
+def test_labels_cover_assistant_turns_only():
+    record = _record(3)
+    example = tokenize_messages(record["messages"], TOKENIZER.encode, 4096)
+    trained = [t for t, label in zip(example.input_ids, example.labels) if label != IGNORE_INDEX]
+    assert trained == TOKENIZER.encode(record["messages"][2]["content"] + "<|im_end|>\n")
+    assert tokenize_messages(record["messages"], TOKENIZER.encode, 32).truncated
+
+
+def test_pack_fills_rows_and_reports_efficiency():
+    lengths = [700, 300, 900, 120, 80, 400, 1000, 250]
+    bins = pack(lengths, 1024)
+    assert bins == [[6], [2, 3], [0, 1], [5, 7, 4]]
+    with pytest.raises(ValueError):
+        pack([2048], 1024)
+
+    rows, stats = pack_sft_dataset([_record(i) for i in range(60)], TOKENIZER.encode, 1024)
+    assert stats.examples == 60 and stats.sequences == len(rows) < 20
+    assert stats.efficiency > 0.85 > 0.2 > stats.unpacked_efficiency
+    assert stats.as_dict()["speedup"] == round(60 / len(rows), 2)
+
+    batches = length_batches([len(r["input_ids"]) for r in rows], 4)
+    assert sorted(i for b in batches for i in b) == list(range(len(rows)))
+
+
+def test_packed_forward_matches_unpacked():
+    texts = [" ".join(f"line{j} {EVAL[i % 2]['logs_text']}" for j in range(i + 1)) for i in range(6)]
+    examples = [Example(TOKENIZER.encode(t), TOKENIZER.encode(t)) for t in texts]
+    rows, _ = pack_examples(examples, 256)
+    bins = pack([len(e) for e in examples], 256)
+    assert len(rows) < len(examples)
+    assert all(row.position_ids[0] == 0 and row.labels[0] == IGNORE_INDEX for row in rows)
+
+    batch = PackedCollator(four_d_mask=True, return_segment_ids=True)([asdict(row) for row in rows])
+    model = ToyCausalLM().eval()
+    with torch.no_grad():
+        logits = model(batch["input_ids"], batch["position_ids"], batch["attention_mask"])
+        packed = segment_logps(logits, batch["labels"], batch["segment_ids"], len(examples))
+        for r, bin_ in enumerate(bins):
+            for segment, index in enumerate(bin_):
+                ids = torch.tensor([examples[index].input_ids])
+                alone = model(ids, torch.arange(ids.shape[1])[None], None)
+                labels = torch.tensor([[IGNORE_INDEX] + examples[index].labels[1:]])
+                expected = segment_logps(alone, labels, torch.ones_like(ids), 1)[0, 0]
+                assert torch.isclose(packed[r, segment], expected, rtol=1e-4)
+        # Causal attention alone lets tokens attend across examples and the result changes.
+        leaky = segment_logps(
+            model(batch["input_ids"], batch["position_ids"], None), batch["labels"], batch["segment_ids"], len(examples)
+        )
+        assert not torch.allclose(leaky, packed)
+
+
+def test_dpo_pairs_share_a_row():
+    records = [
+        {"prompt": f"<|im_start|>user\n{e['alert_text']}<|im_end|>\n", "chosen": e["title"], "rejected": "restart it"}
+        for e in EVAL
+    ]
+    rows, stats = pack_dpo_dataset(records, TOKENIZER.encode, 512)
+    assert stats.examples == 2 * len(records)
+    for row in rows:
+        segments = max(row["segment_ids"])
+        assert segments % 2 == 0
+        assert all(label == IGNORE_INDEX for label, pos in zip(row["labels"], row["position_ids"]) if pos == 0)
+
+
+def test_packing_falls_back_to_a_4d_mask_without_flash_attention(monkeypatch):
+    assert packed_attention(four_d_mask=True) == ("sdpa", True)
+    monkeypatch.setattr("importlib.util.find_spec", lambda name: None)
+    assert packed_attention(four_d_mask=False) == ("sdpa", True)
+    monkeypatch.setattr("importlib.util.find_spec", lambda name: object())
+    assert packed_attention(four_d_mask=False) == ("flash_attention_2", False)
+
+
+def test_each_packed_example_starts_with_bos():
+    rows, _ = pack_sft_dataset([_record(i) for i in range(10)], TOKENIZER.encode, 1024, bos_token_id=1)
+    for row in rows:
+        starts = [i for i, pos in enumerate(row["position_ids"]) if pos == 0]
+        assert all(row["input_ids"][i] == 1 and row["labels"][i] == IGNORE_INDEX for i in starts)
+    chosen, rejected = tokenize_preference({"prompt": "p", "chosen": "a", "rejected": "b"}, TOKENIZER.encode, 64, 1)
+    assert chosen.input_ids[0] == rejected.input_ids[0] == 1
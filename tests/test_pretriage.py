@@ -0,0 +1,121 @@
+import json
+import threading
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+import serving.api as api
+from serving.alertmanager import alert_signature, to_incident
+from serving.pretriage import PreTriageQueue
+from serving.schemas import AlertmanagerWebhook
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def _payload(name="alertmanager_firing.json"):
+    return json.loads((FIXTURES / name).read_text())
+
+
+def test_webhook_maps_alert_group_to_incident():
+    webhook = AlertmanagerWebhook(**_payload())
+    incident = to_incident(webhook)
+    assert incident.incident_id.startswith("am-")
+    assert incident.severity == "sev1"
+    assert incident.environment.service == "checkout"
+    assert incident.environment.deploy_version == "v2.14.0"
+    assert incident.timestamp.isoformat().startswith("2024-07-01T10:01:30")
+    assert "checkout-7d9f8-fghij" in incident.alert_text
+    reordered = AlertmanagerWebhook(**{**_payload(), "alerts": _payload()["alerts"][::-1]})
+    assert alert_signature(reordered.alerts) == alert_signature(webhook.alerts)
+
+
+def test_queue_dedups_refires_and_sheds_load(tmp_path):
+    release = threading.Event()
+    calls = []
+
+    def slow_triage(incident):
+        calls.append(incident.incident_id)
+        release.wait(5)
+        raise RuntimeError("model down")
+
+    pretriage = PreTriageQueue(slow_triage, tmp_path / "pretriage.db", workers=1, queue_size=1)
+    incident = to_incident(AlertmanagerWebhook(**_payload()))
+    assert pretriage.submit(incident, "a") == "queued"
+    assert pretriage.submit(incident, "a") == "duplicate"
+    while not calls:
+        threading.Event().wait(0.01)
+    other = incident.model_copy(update={"incident_id": "other"})
+    assert pretriage.submit(other, "b") == "queued"
+    assert pretriage.submit(incident.model_copy(update={"incident_id": "third"}), "c") == "rejected"
+    release.set()
+    pretriage.join()
+    # A failed job is retried when the group fires again.
+    assert pretriage.lookup(incident.incident_id) is None
+    assert pretriage.submit(incident, "a") == "queued"
+    pretriage.join()
+    pretriage.close()
+
+
+def test_webhook_pretriage_serves_later_lookups(monkeypatch, tmp_path):
+    monkeypatch.setenv("PRETRIAGE_PATH", str(tmp_path / "pretriage.db"))
+    monkeypatch.setattr(api, "_pretriage", None)
+    calls = []
+    triage_incident = api._triage_incident
+
+    def counting(request, deadline):
+        calls.append(request.incident_id)
+        return triage_incident(request, deadline)
+
+    monkeypatch.setattr(api, "_triage_incident", counting)
+    client = TestClient(api.app)
+
+    resp = client.post("/v1/alertmanager", json=_payload())
+    assert resp.status_code == 202
+    incident_id = resp.json()["incident_id"]
+    assert client.post("/v1/alertmanager", json=_payload()).json()["status"] == "duplicate"
+    api._pretriage.join()
+
+    stored = client.get(f"/v1/triage/{incident_id}")
+    assert stored.status_code == 200
+    assert stored.json()["checklist"]
+
+    incident = to_incident(AlertmanagerWebhook(**_payload()))
+    resp = client.post("/v1/triage", json=json.loads(incident.model_dump_json()))
+    assert resp.json() == stored.json()
+    assert calls == [incident_id]
+    # Same id, different content: triaged afresh rather than served the stored result.
+    edited = incident.model_copy(update={"alert_text": "a different alert"})
+    assert client.post("/v1/triage", json=json.loads(edited.model_dump_json())).status_code == 200
+    assert calls == [incident_id, incident_id]
+
+    assert client.post("/v1/alertmanager", json=_payload("alertmanager_resolved.json")).json()["status"] == "resolved"
+    assert client.get("/v1/triage/unknown").status_code == 404
+    api._pretriage.close()
+
+    # A worker that never received a webhook (or just restarted) serves the stored result too.
+    monkeypatch.setattr(api, "_pretriage", None)
+    with TestClient(api.app) as fresh:
+        assert api._pretriage is not None
+        assert fresh.get(f"/v1/triage/{incident_id}").json() == stored.json()
+        assert fresh.post("/v1/triage", json=json.loads(incident.model_dump_json())).json() == stored.json()
+    assert calls == [incident_id, incident_id]
+
+
+def test_webhook_without_alerts_is_rejected():
+    resp = TestClient(api.app).post("/v1/alertmanager", json={**_payload(), "alerts": []})
+    assert resp.status_code == 422
+
+
+def test_results_and_dedup_are_shared_between_processes(tmp_path):
+    incident = to_incident(AlertmanagerWebhook(**_payload()))
+    response = api._triage_incident(incident, api.Deadline.from_env())
+    # Two queues on one database stand in for two gunicorn workers.
+    first = PreTriageQueue(lambda _: response, tmp_path / "pretriage.db", workers=1)
+    second = PreTriageQueue(lambda _: response, tmp_path / "pretriage.db", workers=1)
+    assert first.submit(incident, "a") == "queued"
+    assert second.submit(incident, "a") == "duplicate"
+    first.join()
+    assert second.lookup(incident.incident_id, incident) == response
+    assert not second.is_pending(incident.incident_id)
+    first.close()
+    second.close()
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from tests.fake_prometheus import FakePrometheus
+from tools.prometheus_executor import (
+    MatrixStreamDecoder,
+    PrometheusExecutor,
+    PrometheusQueryError,
+    PrometheusTimeoutError,
+)
+from tools.promql_tool import PromQLTool
+from tools.tool_schemas import PromQLQuery
+
+
+def _call():
+    return PromQLQuery(
+        query="rate(http_requests_total[5m])",
+        start="2024-01-01T00:00:00Z",
+        end="2024-01-01T00:05:00Z",
+        step_seconds=60,
+    )
+
+
+def test_matrix_decoder_handles_split_chunks():
+    body = json.dumps(
+        {
+            "status": "success",
+            "data": {
+                "resultType": "matrix",
+                "result": [
+                    {"metric": {"job": "a"}, "values": [[1, "1"], [2, "2"]]},
+                    {"metric": {"job": "b"}, "values": [[1, "3"]]},
+                ],
+            },
+        }
+    ).encode("utf-8")
+    decoder = MatrixStreamDecoder()
+    series = []
+    for i in range(0, len(body), 7):
+        series.extend(decoder.feed(body[i : i + 7]))
+    decoder.finish()
+    assert [s["metric"]["job"] for s in series] == ["a", "b"]
+
+
+def test_matrix_decoder_reparses_only_on_closing_braces():
+    labels = {"job": 'a"}]{[\\', "instance": "x\\"}
+    values = [[i, str(i)] for i in range(5000)]
+    body = json.dumps(
+        {"status": "success", "data": {"resultType": "matrix", "result": [{"metric": labels, "values": values}]}}
+    ).encode("utf-8")
+    decoder = MatrixStreamDecoder()
+    calls = []
+    raw_decode = decoder._decoder.raw_decode
+    decoder._decoder.raw_decode = lambda text, pos: calls.append(pos) or raw_decode(text, pos)
+    series = []
+    for i in range(0, len(body), 3):
+        series.extend(decoder.feed(body[i : i + 3]))
+    decoder.finish()
+    assert series == [{"metric": labels, "values": values}]
+    # Once for each '}' that arrives: in the label value, after the labels, after the values.
+    assert len(calls) == 3
+
+
+def test_matrix_decoder_surfaces_prometheus_errors():
+    decoder = MatrixStreamDecoder()
+    list(decoder.feed(b'{"status":"error","errorType":"bad_data","error":"parse error"}'))
+    with pytest.raises(PrometheusQueryError, match="bad_data"):
+        decoder.finish()
+
+
+def test_promql_tool_queries_prometheus():
+    with FakePrometheus(series=2) as server:
+        tool = PromQLTool(mode="prometheus", endpoint=server.url)
+        result = tool.run(_call())
+        assert len(result.series) == 12
+        assert {p.labels["instance"] for p in result.series} == {"node-0", "node-1"}
+        assert server.requests[0]["step"] == "60s"
+
+
+def test_executor_enforces_limits():
+    with FakePrometheus(series=50, delay_s=0.3) as server:
+        executor = PrometheusExecutor(server.url, timeout_s=0.05)
+        with pytest.raises(PrometheusTimeoutError):
+            executor.query_range(_call())
+        executor.timeout_s = 5.0
+        # An explicit zero is an exhausted deadline, not "use the default".
+        with pytest.raises(PrometheusTimeoutError):
+            executor.query_range(_call(), timeout_s=0)
+        executor.max_response_bytes = 512
+        with pytest.raises(PrometheusQueryError, match="exceeded"):
+            executor.query_range(_call())
+        executor.close()
@@ -0,0 +1,44 @@
+import json
+
+from rag.chunking import Chunk
+from serving.prompt_builder import PromptBuilder
+from serving.schemas import IncidentRequest
+from serving.tokenizer import ApproxTokenizer
+
+with open("data/sample_incidents.jsonl") as f:
+    SAMPLE = json.loads(f.readline())
+
+
+def _chunks():
+    return [
+        (Chunk(id="rbk-b", text="Roll back the deploy " * 20, metadata={}), 0.1),
+        (Chunk(id="rbk-a", text="Recycle database connections " * 20, metadata={}), 0.2),
+        (Chunk(id="rbk-c", text="Drain the region " * 20, metadata={}), 0.3),
+    ]
+
+
+def test_prefix_is_byte_stable_and_chunks_sorted():
+    builder = PromptBuilder(tokenizer=ApproxTokenizer(), budget_tokens=4096)
+    incident = IncidentRequest(**SAMPLE)
+    other = IncidentRequest(**{**SAMPLE, "incident_id": "INC-999", "alert_text": "different"})
+    first = builder.build(incident, _chunks())
+    second = builder.build(other, list(reversed(_chunks())))
+    assert first.messages[0] == second.messages[0]
+    assert first.prefix_tokens == ApproxTokenizer().count(first.messages[0]["content"])
+    user = first.messages[1]["content"]
+    assert user.index("rbk-a") < user.index("rbk-b") < user.index("rbk-c")
+    assert second.messages[1]["content"].startswith(user.split("[INCIDENT]")[0])
+
+
+def test_budget_truncates_logs_before_chunks():
+    tokenizer = ApproxTokenizer()
+    builder = PromptBuilder(tokenizer=tokenizer, budget_tokens=1)
+    budget = builder.prefix_tokens + 400
+    builder.budget_tokens = budget
+    logs = "\n".join(f"ERROR request {i} failed upstream=database" for i in range(500))
+    incident = IncidentRequest(**{**SAMPLE, "logs_text": logs})
+    prompt = builder.build(incident, _chunks())
+    assert prompt.prompt_tokens <= budget
+    assert "logs" in prompt.truncated
+    assert "[truncated]" in prompt.messages[1]["content"]
+    assert prompt.section_tokens["chunks"] > prompt.section_tokens["logs"]
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from tools.promql_cache import RangeQueryCache, align_range
+from tools.tool_schemas import ColumnarSeries, PromQLQuery
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _call(start_min, end_min, step=60):
+    return PromQLQuery(
+        query="rate(http_requests_total[5m])",
+        start=T0 + timedelta(minutes=start_min, seconds=7),
+        end=T0 + timedelta(minutes=end_min, seconds=7),
+        step_seconds=step,
+    )
+
+
+class RecordingFetcher:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, call):
+        self.calls.append((call.start, call.end))
+        start, end = call.start.timestamp(), call.end.timestamp()
+        timestamps = np.arange(start, end + 1, call.step_seconds)
+        return [ColumnarSeries({"job": "api"}, timestamps, timestamps % 3600 / 60)]
+
+
+def test_align_range_floors_to_step():
+    start, end = align_range(T0 + timedelta(seconds=61), T0 + timedelta(seconds=179), 60)
+    assert start == int(T0.timestamp()) + 60
+    assert end == int(T0.timestamp()) + 120
+
+
+def test_cache_fetches_only_missing_extents():
+    now = (T0 + timedelta(hours=2)).timestamp()
+    cache = RangeQueryCache(clock=lambda: now)
+    fetch = RecordingFetcher()
+
+    first = cache.get_or_fetch(_call(0, 15), fetch)
+    assert len(first[0]) == 16
+    second = cache.get_or_fetch(_call(5, 20), fetch)
+    assert len(second[0]) == 16
+    assert fetch.calls[1] == (T0 + timedelta(minutes=16), T0 + timedelta(minutes=20))
+
+    third = cache.get_or_fetch(_call(2, 18), fetch)
+    assert len(fetch.calls) == 2
+    expected = [T0.timestamp() + m * 60 for m in range(2, 19)]
+    assert third[0].timestamps.tolist() == expected
+    assert third[0].values.tolist() == list(range(2, 19))
+
+
+def test_recent_samples_expire_quickly():
+    clock = {"now": (T0 + timedelta(minutes=16)).timestamp()}
+    cache = RangeQueryCache(max_freshness_s=300, recent_ttl_s=10, clock=lambda: clock["now"])
+    fetch = RecordingFetcher()
+
+    cache.get_or_fetch(_call(0, 15), fetch)
+    cache.get_or_fetch(_call(0, 15), fetch)
+    assert len(fetch.calls) == 1
+
+    clock["now"] += 11
+    cache.get_or_fetch(_call(0, 15), fetch)
+    assert fetch.calls[-1] == (T0 + timedelta(minutes=11), T0 + timedelta(minutes=15))
+
+
+def test_sliding_window_keeps_at_most_max_points():
+    now = (T0 + timedelta(days=1)).timestamp()
+    cache = RangeQueryCache(max_points=100, clock=lambda: now)
+    fetch = RecordingFetcher()
+
+    for minute in range(0, 600, 10):
+        latest = cache.get_or_fetch(_call(minute, minute + 30), fetch)
+        assert len(latest[0]) == 31
+    (entry,) = cache._entries.values()
+    assert sum(extent.points for extent in entry.extents) <= 100
+    # The oldest samples were trimmed; the newest window is still served from cache.
+    assert entry.extents[0].start > int(T0.timestamp()) + 400 * 60
+    calls = len(fetch.calls)
+    cache.get_or_fetch(_call(580, 620), fetch)
+    assert len(fetch.calls) == calls
@@ -2,7 +2,14 @@ import pytest
 
 from tools.promql_tool import PromQLTool
 from tools.tool_schemas import PromQLQuery
-from tools.validators import PromQLValidationError, validate_promql_syntax
+from tools.validators import (
+    PromQLCostError,
+    PromQLValidationError,
+    QueryBudget,
+    enforce_query_budget,
+    estimate_query_cost,
+    validate_promql_syntax,
+)
 
 
 def test_promql_validation_passes():
@@ -25,3 +32,69 @@ def test_promql_tool_mock_returns_series():
     result = tool.run(call)
     assert result.series
     assert result.tool_name == "promql_query"
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        'sum by (job) (rate(http_requests_total{job="api",code=~"5.."}[5m]))',
+        "histogram_quantile(0.99, sum(rate(http_request_duration_seconds_bucket[5m])) by (le))",
+        "max_over_time(rate(http_requests_total[1m])[1h:5m])",
+        "up offset 5m == bool 1",
+    ],
+)
+def test_promql_parser_accepts_common_queries(query):
+    assert validate_promql_syntax(query)
+
+
+@pytest.mark.parametrize("query", ["rate(http_requests_total)", "unknown_fn(up)", "up[5m][5m]", '{job=""}'])
+def test_promql_parser_rejects_semantic_errors(query):
+    with pytest.raises(PromQLValidationError):
+        validate_promql_syntax(query)
+
+
+def test_query_cost_scales_with_range_and_window():
+    budget = QueryBudget(cardinality_hints={"http_requests_total": 1000})
+    call = PromQLQuery(
+        query='rate(http_requests_total{service="api"}[5m])',
+        start="2024-01-01T00:00:00Z",
+        end="2024-01-01T01:00:00Z",
+        step_seconds=60,
+    )
+    cost = estimate_query_cost(call, budget)
+    assert cost.steps == 61
+    assert cost.series == 100
+    assert cost.samples == 61 * 100 * 20
+
+
+def test_query_budget_rewrites_step_or_rejects():
+    call = PromQLQuery(
+        query="rate(http_requests_total[5m])",
+        start="2024-01-01T00:00:00Z",
+        end="2024-01-01T12:00:00Z",
+        step_seconds=15,
+    )
+    budget = QueryBudget(max_samples=200_000, default_series=100)
+    rewritten = enforce_query_budget(call, budget)
+    assert rewritten.step_seconds > call.step_seconds
+    assert estimate_query_cost(rewritten, budget).samples <= budget.max_samples
+    with pytest.raises(PromQLCostError):
+        enforce_query_budget(call, budget, rewrite=False)
+
+
+def test_tool_result_is_columnar_and_serializes_lazily():
+    result = PromQLTool(mode="mock").run(
+        PromQLQuery(
+            query="rate(http_requests_total[5m])",
+            start="2024-01-01T00:00:00Z",
+            end="2024-01-01T01:00:00Z",
+            step_seconds=60,
+        )
+    )
+    assert len(result.matrix) == 1
+    assert result.point_count == 61
+    assert result.matrix[0].timestamps.dtype == "float64"
+    dumped = result.model_dump(mode="json")
+    assert dumped["matrix"][0]["values"][:2] == result.matrix[0].values[:2].tolist()
+    assert "series" not in dumped
+    assert result.series[0].labels == result.matrix[0].labels
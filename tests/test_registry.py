@@ -0,0 +1,69 @@
+import pytest
+
+from rag.chunking import chunk_markdown
+from rag.registry import CollectionRegistry, estimate_bundle_bytes, parse_collections
+from rag.retriever import MockEmbeddingModel, get_embedder, persist_index
+
+
+def _build(tmp_path, name, text, embedder=None):
+    artifact_dir = tmp_path / name
+    chunks = chunk_markdown(text, f"{name}.md", max_words=20)
+    persist_index(chunks, embedder or MockEmbeddingModel(), artifact_dir=artifact_dir)
+    return artifact_dir
+
+
+def test_parse_collections():
+    parsed = parse_collections("payments=artifacts/payments, db=artifacts/db")
+    assert set(parsed) == {"payments", "db"}
+    with pytest.raises(ValueError):
+        parse_collections("broken")
+
+
+def test_registry_resolves_and_evicts_lru(tmp_path):
+    dirs = {
+        "default": _build(tmp_path, "default", "# Web\n## Latency\nRoll back the deploy."),
+        "payments": _build(tmp_path, "payments", "# Payments\n## Errors\nCheck the card gateway."),
+        "db": _build(tmp_path, "db", "# Database\n## Pool\nRecycle stuck connections."),
+    }
+    budget = max(estimate_bundle_bytes(path) for path in dirs.values()) * 2
+    registry = CollectionRegistry(dirs, memory_budget_bytes=budget)
+
+    assert registry.resolve(service="payments") == ["payments"]
+    assert registry.resolve(service="unknown") == ["default"]
+    assert registry.resolve(explicit=["db", "db"]) == ["db"]
+    with pytest.raises(KeyError):
+        registry.resolve(explicit=["missing"])
+
+    assert registry.loaded_names == []
+    registry.get("default")
+    registry.get("payments")
+    registry.get("default")
+    registry.get("db")
+    assert registry.loaded_names == ["default", "db"]
+    assert registry.loaded_bytes <= budget
+
+
+def test_registry_fan_out_merges_top_k(tmp_path):
+    dirs = {
+        "payments": _build(tmp_path, "payments", "# Payments\n## Errors\nCheck the card gateway."),
+        "db": _build(tmp_path, "db", "# Database\n## Pool\nRecycle stuck connections."),
+    }
+    registry = CollectionRegistry(dirs)
+    hits = registry.retrieve(["payments", "db"], "database pool", k=2)
+    assert len(hits) == 2
+    sources = {chunk.metadata["source"] for chunk, _ in hits}
+    assert sources == {"payments.md", "db.md"}
+    assert hits[0][1] <= hits[1][1]
+
+
+def test_fan_out_across_embedders_fuses_ranks_not_scores(tmp_path):
+    text = "# {0}\n## One\nFirst {0} step.\n## Two\nSecond {0} step.\n## Three\nThird {0} step."
+    dirs = {
+        "payments": _build(tmp_path, "payments", text.format("Payments")),
+        "db": _build(tmp_path, "db", text.format("Database"), embedder=get_embedder("hashing")),
+    }
+    registry = CollectionRegistry(dirs)
+    own = {name: registry.get(name).retrieve("database step", k=2) for name in dirs}
+    hits = registry.retrieve(["payments", "db"], "database step", k=4)
+    # Each collection's ranking is kept and the two are interleaved by rank.
+    assert hits == [own["payments"][0], own["db"][0], own["payments"][1], own["db"][1]]
@@ -0,0 +1,48 @@
+import time
+
+import httpx
+
+from serving.replica_pool import MIN_HEDGE_SAMPLES, ReplicaPool
+from tests.fake_openai import FakeOpenAI
+
+PAYLOAD = {"model": "vllm", "messages": [{"role": "user", "content": "hi"}]}
+TIMEOUT = httpx.Timeout(5)
+
+
+def test_pick_prefers_least_outstanding_then_fastest():
+    pool = ReplicaPool(["http://a", "http://b", "http://c"])
+    a, b, c = pool.replicas
+    a.outstanding, b.outstanding, c.outstanding = 2, 1, 1
+    b.ewma_s, c.ewma_s = 0.5, 0.1
+    assert pool.pick() is c
+    assert pool.pick(exclude=c) is b
+
+
+def test_requests_spread_across_replicas():
+    with FakeOpenAI() as first, FakeOpenAI() as second:
+        pool = ReplicaPool([first.url, second.url])
+        try:
+            for _ in range(6):
+                assert pool.post("/v1/chat/completions", PAYLOAD, TIMEOUT).status_code == 200
+        finally:
+            pool.close()
+    assert first.requests and second.requests
+    assert all(r.ewma_s is not None for r in pool.replicas)
+
+
+def test_hedge_fires_past_p95_and_fast_replica_wins():
+    with FakeOpenAI(delay_s=1.0) as slow, FakeOpenAI() as fast:
+        pool = ReplicaPool([slow.url, fast.url], hedge=True)
+        pool.recent.extend([0.05] * MIN_HEDGE_SAMPLES)
+        # Make the slow replica look best so it is chosen as primary.
+        pool.replicas[0].ewma_s, pool.replicas[1].ewma_s = 0.01, 0.05
+        try:
+            start = time.perf_counter()
+            response = pool.post("/v1/chat/completions", PAYLOAD, TIMEOUT)
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.close()
+    assert response.status_code == 200
+    assert elapsed < 0.8
+    assert len(slow.requests) == 1 and len(fast.requests) == 1
+    assert all(r.outstanding == 0 for r in pool.replicas)
@@ -0,0 +1,68 @@
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+
+from serving.prompt_builder import PromptBuilder
+from serving.prompts import build_metrics_block
+from serving.schemas import IncidentRequest
+from serving.tokenizer import ApproxTokenizer
+from tools.series_summary import change_points, lttb_indices, summarize_results
+from tools.tool_schemas import ColumnarSeries, PromQLQuery, ToolResult
+
+
+def _result(values_by_instance):
+    query = PromQLQuery(
+        query="rate(http_requests_total[5m])",
+        start="2024-01-01T00:00:00Z",
+        end="2024-01-01T06:00:00Z",
+        step_seconds=15,
+    )
+    matrix = []
+    for instance, values in values_by_instance.items():
+        timestamps = query.start.timestamp() + np.arange(len(values)) * 15.0
+        matrix.append(ColumnarSeries({"instance": instance}, timestamps, values))
+    return ToolResult(tool_name="promql_query", query=query, matrix=matrix)
+
+
+def test_lttb_keeps_endpoints_and_extremes():
+    values = np.zeros((2, 100))
+    values[0, 37] = 10.0
+    values[1, 80] = -5.0
+    timestamps = np.tile(np.arange(100, dtype=float), (2, 1))
+    idx = lttb_indices(timestamps, values, 10)
+    assert idx.shape == (2, 10)
+    assert (idx[:, 0] == 0).all() and (idx[:, -1] == 99).all()
+    assert 37 in idx[0] and 80 in idx[1]
+
+
+def test_change_point_finds_level_shift():
+    values = np.concatenate([np.full(60, 1.0), np.full(40, 5.0)])[None, :]
+    cps = change_points(values)
+    assert cps["index"][0] == 60
+    assert cps["after"][0] - cps["before"][0] == 4.0
+
+
+def test_summarize_results_flags_spikes_and_saves_tokens():
+    rng = np.random.default_rng(0)
+    n = 1441
+    noisy = 1.0 + rng.normal(0, 0.01, n)
+    noisy[700] = 9.0
+    shifted = np.where(np.arange(n) < 1000, 2.0, 4.0) + rng.normal(0, 0.01, n)
+    result = _result({"a": noisy, "b": shifted})
+    pivot = datetime.fromtimestamp(result.matrix[1].timestamps[1000], tz=timezone.utc)
+
+    summary = summarize_results([result], representative_points=6, pivot=pivot)
+    a, b = summary.series
+    assert [s["value"] for s in a["spikes"]] == [9.0]
+    assert "change_point" in b and b["deploy_delta"]["pct"] > 90
+    assert len(a["representative"]) == 6
+    assert summary.summary_tokens < summary.raw_tokens / 10
+    block = build_metrics_block(summary)
+    assert block.startswith("[METRIC SUMMARIES]")
+
+    with open("data/sample_incidents.jsonl") as f:
+        incident = IncidentRequest(**json.loads(f.readline()))
+    prompt = PromptBuilder(tokenizer=ApproxTokenizer(), budget_tokens=4096).build(incident, [], metrics_text=block)
+    user = prompt.messages[1]["content"]
+    assert user.count("[METRIC SUMMARIES]") == 1 and "instance=b" in user
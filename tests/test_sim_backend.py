@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from serving import sim_server
+from serving.sim_backend import LatencyProfile, LatencySimulator
+
+FAST = dict(ttft_ms=5.0, tokens_per_s=2000.0, output_tokens=6, seed=7)
+
+
+def test_slowdown_grows_past_concurrency_knee():
+    sim = LatencySimulator(LatencyProfile(concurrency_knee=2, slowdown_per_request=0.5, ttft_jitter=0.0, seed=1))
+    first = sim.begin()
+    sim.begin()
+    crowded = sim.begin()
+    assert sim.in_flight == 3
+    assert crowded.ttft_s == first.ttft_s * 1.5
+
+
+def test_failure_injection_rates():
+    sim = LatencySimulator(LatencyProfile(error_rate=0.2, timeout_rate=0.1, seed=3))
+    outcomes = [sim.begin().outcome for _ in range(2000)]
+    assert 0.15 < outcomes.count("error") / 2000 < 0.25
+    assert 0.06 < outcomes.count("timeout") / 2000 < 0.14
+
+
+def test_stand_in_server_completes_and_streams(monkeypatch):
+    monkeypatch.setattr(sim_server, "simulator", LatencySimulator(LatencyProfile(**FAST)))
+    client = TestClient(sim_server.app)
+    body = {"model": "sim", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 4}
+    resp = client.post("/v1/chat/completions", json=body)
+    assert resp.status_code == 200
+    assert len(resp.json()["choices"][0]["message"]["content"].split()) == 4
+
+    with client.stream("POST", "/v1/chat/completions", json={**body, "stream": True}) as stream:
+        events = [line[len("data: "):] for line in stream.iter_lines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    deltas = [json.loads(e)["choices"][0]["delta"].get("content") for e in events[:-1]]
+    assert len([d for d in deltas if d]) == 4
+    assert sim_server.simulator.in_flight == 0
+
+
+def test_stand_in_server_injects_errors(monkeypatch):
+    monkeypatch.setattr(sim_server, "simulator", LatencySimulator(LatencyProfile(**FAST, error_rate=1.0)))
+    resp = TestClient(sim_server.app).post("/v1/chat/completions", json={"messages": []})
+    assert resp.status_code == 500
+
+
+def test_streams_count_in_flight_only_while_running(monkeypatch):
+    monkeypatch.setattr(sim_server, "simulator", LatencySimulator(LatencyProfile(**FAST)))
+    request = sim_server.ChatCompletionRequest(stream=True, max_tokens=4)
+
+    async def scenario():
+        never_started = sim_server._stream(request)
+        assert sim_server.simulator.in_flight == 0
+        await never_started.aclose()
+
+        abandoned = sim_server._stream(request)
+        await abandoned.__anext__()
+        assert sim_server.simulator.in_flight == 1
+        await abandoned.aclose()
+        assert sim_server.simulator.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_streamed_errors_are_reported_in_band(monkeypatch):
+    monkeypatch.setattr(sim_server, "simulator", LatencySimulator(LatencyProfile(**FAST, error_rate=1.0)))
+    body = {"messages": [], "stream": True}
+    with TestClient(sim_server.app).stream("POST", "/v1/chat/completions", json=body) as stream:
+        events = [json.loads(line[len("data: "):]) for line in stream.iter_lines() if line.startswith("data: ")]
+    assert events == [{"error": {"message": "simulated backend error"}}]
+    assert sim_server.simulator.in_flight == 0
@@ -0,0 +1,31 @@
+from rag.chunking import load_markdown_chunks
+from rag.retriever import build_index, get_embedder
+from rag.synthetic import SyntheticCorpus, SyntheticCorpusConfig
+
+
+def test_corpus_is_deterministic_with_nested_headings(tmp_path):
+    first = SyntheticCorpus(SyntheticCorpusConfig(seed=3)).runbook(7)
+    assert first == SyntheticCorpus(SyntheticCorpusConfig(seed=3)).runbook(7)
+    assert first != SyntheticCorpus(SyntheticCorpusConfig(seed=4)).runbook(7)
+    corpus = SyntheticCorpus(SyntheticCorpusConfig(seed=3, subsection_prob=0.9))
+    corpus.write_runbooks(tmp_path, 10)
+    depths = {len(c.metadata["heading_path"]) for c in load_markdown_chunks(tmp_path)}
+    assert {2, 3} <= depths
+
+
+def test_incidents_point_at_real_chunks_and_lexical_embedder_finds_them(tmp_path):
+    corpus = SyntheticCorpus()
+    corpus.write_runbooks(tmp_path, 20)
+    chunks = load_markdown_chunks(tmp_path)
+    incidents = corpus.incidents(chunks, 30)
+    ids = {c.id for c in chunks}
+    assert all(set(i["expected_chunk_ids"]) <= ids for i in incidents)
+
+    embedder = get_embedder("hashing")
+    index = build_index(embedder.embed([c.text for c in chunks]), "flat")
+    _, found = index.search(embedder.embed([i["alert_text"] for i in incidents]), 5)
+    hits = sum(
+        any(chunks[j].id in incident["expected_chunk_ids"] for j in row)
+        for row, incident in zip(found, incidents)
+    )
+    assert hits / len(incidents) > 0.3
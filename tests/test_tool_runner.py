@@ -0,0 +1,53 @@
+import time
+
+from serving.deadline import Deadline
+from tools.promql_tool import PromQLTool
+from tools.tool_runner import ToolRunner
+from tools.tool_schemas import PromQLQuery, ToolCall
+
+
+class SlowTool(PromQLTool):
+    def __init__(self, delays):
+        super().__init__(mode="mock")
+        self.delays = delays
+
+    def run(self, call, timeout_s=None):
+        time.sleep(self.delays[call.query])
+        return super().run(call, timeout_s=timeout_s)
+
+
+def _call(query):
+    return ToolCall(
+        tool_name="promql_query",
+        arguments=PromQLQuery(
+            query=query,
+            start="2024-01-01T00:00:00Z",
+            end="2024-01-01T00:15:00Z",
+            step_seconds=60,
+        ),
+    )
+
+
+def test_tool_calls_run_concurrently():
+    delays = {"up{job=\"a\"}": 0.2, "up{job=\"b\"}": 0.2, "up{job=\"c\"}": 0.2}
+    runner = ToolRunner(SlowTool(delays))
+    report = runner.run([_call(q) for q in delays], Deadline(5.0))
+    assert [e.status for e in report.executions] == ["ok", "ok", "ok"]
+    assert report.elapsed_s < 0.5
+    assert all(e.points == 16 for e in report.executions)
+
+
+def test_deadline_returns_partial_results():
+    delays = {"up{job=\"fast\"}": 0.01, "up{job=\"slow\"}": 1.0}
+    runner = ToolRunner(SlowTool(delays))
+    report = runner.run([_call(q) for q in delays], Deadline(0.3))
+    assert [e.status for e in report.executions] == ["ok", "timeout"]
+    assert report.timed_out
+    assert len(report.completed) == 1
+    assert report.elapsed_s < 0.6
+
+
+def test_unsupported_tool_is_reported_as_error():
+    call = _call("up").model_copy(update={"tool_name": "shell"})
+    report = ToolRunner(PromQLTool(mode="mock")).run([call], Deadline(1.0))
+    assert report.executions[0].status == "error"
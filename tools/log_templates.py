@@ -0,0 +1,259 @@
+"""Streaming Drain-style log template mining.
+
+Pasted logs are mostly the same few lines with different ids, durations and
+hosts. :class:`LogTemplateMiner` reads lines once and routes each through a
+fixed-depth prefix tree (token count, then the first few tokens) to a small
+set of candidate templates. A line joins the most similar template, whose
+differing tokens become ``<*>``, or starts a new one. Memory is bounded by
+``max_templates``: when full, the oldest template seen only once is evicted
+and its lines are only counted.
+"""
+from __future__ import annotations
+
+import io
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from serving.metrics import record_log_mining
+from serving.schemas import IncidentRequest
+
+WILDCARD = "<*>"
+DEFAULT_MAX_CHARS = 2000
+ERROR_RE = re.compile(r"\b(ERROR|FATAL|CRITICAL|PANIC|Exception|Traceback|[A-Z]\w*(?:Error|Exception))\b")
+EXCEPTION_RE = re.compile(r"\b([A-Z]\w*(?:Error|Exception))\b")
+# Masked before tree routing so ids and numbers never split templates: UUIDs,
+# IPs, hex ids, numbers with units and timestamps. All of them contain a digit.
+VARIABLE_RE = re.compile(
+    r"(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+    r"|\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?"
+    r"|(?:0x)?[0-9a-f]{8,}"
+    r"|[+-]?\d+(?:\.\d+)?(?:ms|s|m|h|%|b|kb|mb|gb)?"
+    r"|\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}\S*)$",
+    re.I,
+)
+DIGIT_RE = re.compile(r"\d")
+MAX_ROUTE_CACHE = 10_000
+
+
+def _mask(token: str) -> str:
+    if not DIGIT_RE.search(token):
+        return token
+    value = token.split("=", 1)[1] if "=" in token else token
+    if not VARIABLE_RE.match(value):
+        return token
+    # Keep the key of key=value pairs so "user=1" and "order=1" stay distinct.
+    return f"{token.split('=', 1)[0]}={WILDCARD}" if "=" in token else WILDCARD
+
+
+@dataclass
+class LogTemplate:
+    tokens: List[str]
+    count: int = 0
+    first_line: str = ""
+    samples: Dict[int, List[str]] = field(default_factory=dict)
+    is_error: bool = False
+    leaf: Tuple = ()
+    wildcards: List[int] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.tokens)
+
+    def similarity(self, tokens: List[str]) -> float:
+        same = sum(1 for a, b in zip(self.tokens, tokens) if a == b and a != WILDCARD)
+        return same / len(tokens) if tokens else 1.0
+
+    def absorb(self, raw: List[str], masked: List[str], max_samples: int) -> None:
+        self.count += 1
+        if self.count == 1 or self.tokens != masked:
+            for pos, (current, token) in enumerate(zip(self.tokens, masked)):
+                if current != token:
+                    self.tokens[pos] = WILDCARD
+            self.wildcards = [pos for pos, token in enumerate(self.tokens) if WILDCARD in token]
+        for pos in self.wildcards:
+            values = self.samples.setdefault(pos, [])
+            if len(values) < max_samples and raw[pos] not in values:
+                values.append(raw[pos])
+
+
+@dataclass
+class LogSummary:
+    templates: List[LogTemplate]
+    total_lines: int
+    dropped_lines: int
+    input_chars: int
+    text: str
+    error_signatures: List[str]
+
+    @property
+    def output_chars(self) -> int:
+        return len(self.text)
+
+
+class LogTemplateMiner:
+    def __init__(
+        self,
+        similarity_threshold: float = 0.5,
+        depth: int = 3,
+        max_children: int = 64,
+        max_templates: int = 500,
+        max_samples: int = 3,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.depth = depth
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.max_samples = max_samples
+        self._tree: Dict[Tuple, List[LogTemplate]] = {}
+        self._children: Dict[Tuple, int] = {}
+        self._routes: Dict[Tuple, Tuple] = {}
+        self._templates: Dict[int, LogTemplate] = {}
+        # Templates seen once, oldest first: the only eviction candidates.
+        self._singletons: Dict[int, LogTemplate] = {}
+        self.total_lines = 0
+        self.dropped_lines = 0
+        self.input_chars = 0
+
+    def _leaf_key(self, masked: List[str]) -> Tuple:
+        prefix = (len(masked), *masked[: self.depth])
+        key = self._routes.get(prefix)
+        if key is None:
+            if len(self._routes) >= MAX_ROUTE_CACHE:
+                self._routes.clear()
+            key = self._routes[prefix] = self._walk(masked)
+        return key
+
+    def _walk(self, masked: List[str]) -> Tuple:
+        key: Tuple = (len(masked),)
+        for token in masked[: self.depth]:
+            # Tokens with digits are too variable to branch on.
+            step = WILDCARD if WILDCARD in token or DIGIT_RE.search(token) else token
+            child = key + (step,)
+            if child not in self._children and self._children.get(key, 0) >= self.max_children:
+                child = key + (WILDCARD,)
+            if child not in self._children:
+                self._children[key] = self._children.get(key, 0) + 1
+                self._children[child] = 0
+            key = child
+        return key
+
+    def add(self, line: str) -> None:
+        self.input_chars += len(line)
+        raw = line.split()
+        if not raw:
+            return
+        self.total_lines += 1
+        masked = [_mask(t) for t in raw]
+        key = self._leaf_key(masked)
+        leaf = self._tree.setdefault(key, [])
+        best: Optional[LogTemplate] = None
+        best_sim = -1.0
+        for template in leaf:
+            sim = template.similarity(masked)
+            if sim > best_sim:
+                best, best_sim = template, sim
+        if best is None or best_sim < self.similarity_threshold:
+            if len(self._templates) >= self.max_templates and not self._evict():
+                self.dropped_lines += 1
+                return
+            best = LogTemplate(
+                tokens=list(masked), first_line=line.strip(), is_error=bool(ERROR_RE.search(line)), leaf=key
+            )
+            leaf.append(best)
+            self._templates[id(best)] = best
+            self._singletons[id(best)] = best
+        elif best.count == 1:
+            self._singletons.pop(id(best), None)
+        best.absorb(raw, masked, self.max_samples)
+
+    def _evict(self) -> bool:
+        if not self._singletons:
+            return False
+        victim = self._singletons.pop(next(iter(self._singletons)))
+        del self._templates[id(victim)]
+        self._tree[victim.leaf].remove(victim)
+        self.dropped_lines += victim.count
+        return True
+
+    def feed(self, lines: Iterable[str]) -> "LogTemplateMiner":
+        for line in lines:
+            self.add(line)
+        return self
+
+    def summary(self, max_chars: int = DEFAULT_MAX_CHARS) -> LogSummary:
+        seen = list(self._templates.values())
+        rendered = {id(t): _render(t) for t in seen}
+        rare = f"[{self.dropped_lines} rare lines not templated]" if self.dropped_lines else ""
+        # Marker lines count against the cap like any other line.
+        budget = max_chars - (len(rare) + 1 if rare else 0)
+        if sum(len(line) + 1 for line in rendered.values()) <= budget:
+            # Nothing to drop: keep the log's own chronology.
+            ranked = seen
+            lines = [rendered[id(t)] for t in seen]
+        else:
+            ranked = sorted(seen, key=lambda t: (not t.is_error, -t.count))
+            lines = []
+            used = 0
+            for i, template in enumerate(ranked):
+                line = rendered[id(template)]
+                rest = len(ranked) - i - 1
+                reserve = len(f"[{rest} more templates omitted]") + 1 if rest else 0
+                if not lines and len(line) + 1 + reserve > budget:
+                    # Never return an empty summary: cut the top template down to fit.
+                    line = line[: max(budget - reserve - 4, 0)] + "..."
+                if lines and used + len(line) + 1 + reserve > budget:
+                    lines.append(f"[{len(ranked) - i} more templates omitted]")
+                    break
+                lines.append(line)
+                used += len(line) + 1
+        if rare:
+            lines.append(rare)
+        signatures: List[str] = []
+        for template in ranked:
+            if not template.is_error:
+                continue
+            match = EXCEPTION_RE.search(template.first_line)
+            signature = match.group(1) if match else template.text
+            if signature not in signatures:
+                signatures.append(signature)
+        return LogSummary(
+            templates=ranked,
+            total_lines=self.total_lines,
+            dropped_lines=self.dropped_lines,
+            input_chars=self.input_chars,
+            text="\n".join(lines),
+            error_signatures=signatures[:5],
+        )
+
+
+def _render(template: LogTemplate) -> str:
+    if template.count == 1:
+        return template.first_line
+    samples = "; ".join(", ".join(values) for _, values in sorted(template.samples.items()) if values)
+    suffix = f" (e.g. {samples})" if samples else ""
+    return f"[x{template.count}] {template.text}{suffix}"
+
+
+def summarize_logs(text: str, max_chars: Optional[int] = None) -> LogSummary:
+    """Mine ``text`` in one pass and return a summary capped at ``max_chars``."""
+    max_chars = max_chars or int(os.getenv("LOG_SUMMARY_MAX_CHARS", str(DEFAULT_MAX_CHARS)))
+    start = time.perf_counter()
+    summary = LogTemplateMiner().feed(io.StringIO(text)).summary(max_chars)
+    record_log_mining(summary.input_chars, summary.output_chars, time.perf_counter() - start)
+    return summary
+
+
+def compact_incident_logs(incident: IncidentRequest) -> IncidentRequest:
+    """Copy of ``incident`` whose ``logs_text`` is the mined summary (``LOG_MINING=0`` disables).
+
+    Logs no longer than ``LOG_MINING_MIN_CHARS`` (default: the summary cap) are left as pasted.
+    """
+    if not incident.logs_text or os.getenv("LOG_MINING", "1") != "1":
+        return incident
+    min_chars = int(os.getenv("LOG_MINING_MIN_CHARS", os.getenv("LOG_SUMMARY_MAX_CHARS", str(DEFAULT_MAX_CHARS))))
+    if len(incident.logs_text) <= min_chars:
+        return incident
+    return incident.model_copy(update={"logs_text": summarize_logs(incident.logs_text).text})
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import asyncio
+import codecs
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+from serving.async_utils import BackgroundLoop
+from tools.tool_schemas import ColumnarSeries, PromQLQuery
+
+DEFAULT_PROMETHEUS_URL = "http://localhost:9090"
+DEFAULT_QUERY_TIMEOUT_S = 5.0
+DEFAULT_MAX_RESPONSE_BYTES = 16 * 1024 * 1024
+DEFAULT_MAX_CONNECTIONS = 32
+
+RESULT_ARRAY_RE = re.compile(r'"result"\s*:\s*\[')
+CLOSING = {"{": "}", "[": "]"}
+
+
+class PrometheusQueryError(RuntimeError):
+    pass
+
+
+class PrometheusTimeoutError(PrometheusQueryError):
+    pass
+
+
+class MatrixStreamDecoder:
+    """Incrementally decode ``data.result`` entries of a query_range response.
+
+    Each series object is yielded as soon as it is complete, so a large matrix
+    never needs to be held as one decoded document. A partial series is only
+    re-parsed when a new closing brace arrives, so a long series split across
+    many chunks is parsed a few times, not once per chunk.
+    """
+
+    def __init__(self) -> None:
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._head = ""
+        self._in_result = False
+        self._done = False
+        # Buffer offset already searched for the pending object's closing bracket.
+        self._scanned = 0
+
+    def feed(self, data: bytes) -> Iterator[Dict]:
+        self._buffer += self._text.decode(data)
+        if not self._in_result:
+            match = RESULT_ARRAY_RE.search(self._buffer)
+            if not match:
+                return
+            self._head = self._buffer[: match.start()]
+            self._buffer = self._buffer[match.end() :]
+            self._in_result = True
+        yield from self._drain()
+
+    def _drain(self) -> Iterator[Dict]:
+        pos = 0
+        while not self._done:
+            while pos < len(self._buffer) and self._buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(self._buffer):
+                break
+            if self._buffer[pos] == "]":
+                self._done = True
+                pos += 1
+                break
+            close = CLOSING.get(self._buffer[pos])
+            # A series can only end at its closing bracket: wait for one to arrive
+            # rather than re-parsing the partial object on every chunk.
+            if close and self._buffer.find(close, max(self._scanned, pos)) < 0:
+                self._scanned = len(self._buffer)
+                break
+            try:
+                obj, end = self._decoder.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                self._scanned = len(self._buffer)
+                break
+            pos = end
+            yield obj
+        self._buffer = self._buffer[pos:]
+        self._scanned = max(self._scanned - pos, 0)
+
+    def finish(self) -> None:
+        """Validate the envelope once the body is exhausted."""
+        self._buffer += self._text.decode(b"", final=True)
+        if self._in_result:
+            if '"status":"success"' not in self._head.replace(" ", ""):
+                raise PrometheusQueryError("Prometheus response missing success status")
+            if not self._done:
+                raise PrometheusQueryError("Truncated Prometheus response")
+            return
+        try:
+            body = json.loads(self._buffer)
+        except json.JSONDecodeError as exc:
+            raise PrometheusQueryError("Malformed Prometheus response") from exc
+        if body.get("status") != "success":
+            raise PrometheusQueryError(
+                f"Prometheus error {body.get('errorType', 'unknown')}: {body.get('error', '')}"
+            )
+        raise PrometheusQueryError("Prometheus response has no result array")
+
+
+class PrometheusExecutor:
+    """Executes range queries against the Prometheus HTTP API.
+
+    The pooled ``httpx.AsyncClient`` lives on a ``BackgroundLoop`` so both
+    sync and async callers share the same connections.
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_PROMETHEUS_URL,
+        timeout_s: float = DEFAULT_QUERY_TIMEOUT_S,
+        max_response_bytes: int = DEFAULT_MAX_RESPONSE_BYTES,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout_s = timeout_s
+        self.max_response_bytes = max_response_bytes
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = BackgroundLoop("prometheus-executor")
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def _query_range(self, call: PromQLQuery, timeout_s: float) -> List[ColumnarSeries]:
+        params = {
+            "query": call.query,
+            "start": f"{call.start.timestamp():.3f}",
+            "end": f"{call.end.timestamp():.3f}",
+            "step": f"{call.step_seconds}s",
+            "timeout": f"{timeout_s:.3f}s",
+        }
+        client = self._get_client()
+        decoder = MatrixStreamDecoder()
+        matrix: List[ColumnarSeries] = []
+        received = 0
+        async with client.stream(
+            "GET", "/api/v1/query_range", params=params, timeout=timeout_s
+        ) as response:
+            if response.status_code >= 500:
+                raise PrometheusQueryError(f"Prometheus returned HTTP {response.status_code}")
+            async for data in response.aiter_bytes():
+                received += len(data)
+                if received > self.max_response_bytes:
+                    raise PrometheusQueryError(
+                        f"Response exceeded {self.max_response_bytes} bytes for query {call.query!r}"
+                    )
+                for series in decoder.feed(data):
+                    matrix.append(ColumnarSeries.from_prometheus(series))
+        decoder.finish()
+        return matrix
+
+    async def _run_with_deadline(
+        self, call: PromQLQuery, timeout_s: float
+    ) -> List[ColumnarSeries]:
+        try:
+            return await asyncio.wait_for(self._query_range(call, timeout_s), timeout_s)
+        except (TimeoutError, httpx.TimeoutException) as exc:
+            raise PrometheusTimeoutError(
+                f"Query timed out after {timeout_s:.2f}s: {call.query!r}"
+            ) from exc
+        except httpx.HTTPError as exc:
+            raise PrometheusQueryError(f"Prometheus request failed: {exc}") from exc
+
+    def query_range(
+        self, call: PromQLQuery, timeout_s: Optional[float] = None
+    ) -> List[ColumnarSeries]:
+        timeout_s = self.timeout_s if timeout_s is None else timeout_s
+        return self._loop.run(self._run_with_deadline(call, timeout_s))
+
+    async def aquery_range(
+        self, call: PromQLQuery, timeout_s: Optional[float] = None
+    ) -> List[ColumnarSeries]:
+        timeout_s = self.timeout_s if timeout_s is None else timeout_s
+        return await self._loop.arun(self._run_with_deadline(call, timeout_s))
+
+    def close(self) -> None:
+        client, self._client = self._client, None
+        self._loop.stop(client.aclose() if client is not None else None)
+
+
+_executors: Dict[str, PrometheusExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(base_url: Optional[str] = None) -> PrometheusExecutor:
+    """Return the shared executor for ``base_url`` so connections are pooled process-wide."""
+    base_url = (base_url or os.getenv("PROMETHEUS_URL", DEFAULT_PROMETHEUS_URL)).rstrip("/")
+    with _executors_lock:
+        executor = _executors.get(base_url)
+        if executor is None:
+            executor = PrometheusExecutor(
+                base_url,
+                timeout_s=float(os.getenv("PROMQL_TIMEOUT_S", str(DEFAULT_QUERY_TIMEOUT_S))),
+                max_response_bytes=int(
+                    os.getenv("PROMQL_MAX_RESPONSE_BYTES", str(DEFAULT_MAX_RESPONSE_BYTES))
+                ),
+            )
+            _executors[base_url] = executor
+        return executor
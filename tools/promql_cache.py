@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from serving.metrics import record_promql_cache
+from tools.tool_schemas import ColumnarSeries, PromQLQuery
+
+DEFAULT_MAX_QUERIES = 512
+# Samples newer than this may still change (late scrapes, rule evaluation lag).
+DEFAULT_MAX_FRESHNESS_S = 300
+DEFAULT_RECENT_TTL_S = 15
+# Samples kept per cached query; the oldest are trimmed first. At ~16 bytes a
+# sample the whole cache holds at most max_queries * 50k * 16 B (~400 MB).
+DEFAULT_MAX_POINTS = 50_000
+
+Fetcher = Callable[[PromQLQuery], List[ColumnarSeries]]
+
+
+def align_range(start: datetime, end: datetime, step_seconds: int) -> Tuple[int, int]:
+    """Floor ``start``/``end`` to the step grid; returns inclusive epoch seconds."""
+    start_ts = int(start.timestamp()) // step_seconds * step_seconds
+    end_ts = int(end.timestamp()) // step_seconds * step_seconds
+    if end_ts <= start_ts:
+        end_ts = start_ts + step_seconds
+    return start_ts, end_ts
+
+
+def merge_matrices(matrices: Iterable[List[ColumnarSeries]]) -> List[ColumnarSeries]:
+    """Concatenate series by label set; later matrices win on duplicate timestamps."""
+    parts: Dict[Tuple[Tuple[str, str], ...], List[ColumnarSeries]] = {}
+    for matrix in matrices:
+        for series in matrix:
+            parts.setdefault(series.key, []).append(series)
+    merged: List[ColumnarSeries] = []
+    for group in parts.values():
+        if len(group) == 1:
+            merged.append(group[0])
+            continue
+        timestamps = np.concatenate([s.timestamps for s in group])[::-1]
+        values = np.concatenate([s.values for s in group])[::-1]
+        # np.unique keeps the first occurrence, i.e. the newest after reversal.
+        unique_ts, index = np.unique(timestamps, return_index=True)
+        merged.append(ColumnarSeries(group[0].labels, unique_ts, values[index]))
+    return merged
+
+
+def slice_matrix(matrix: List[ColumnarSeries], start: float, end: float) -> List[ColumnarSeries]:
+    sliced = [series.slice(start, end) for series in matrix]
+    return [series for series in sliced if len(series)]
+
+
+@dataclass
+class Extent:
+    """Cached samples for the half-open grid interval ``[start, end)``."""
+
+    start: int
+    end: int
+    matrix: List[ColumnarSeries]
+    expires_at: Optional[float] = None
+
+    def expired(self, now: float) -> bool:
+        return self.expires_at is not None and now >= self.expires_at
+
+    @property
+    def points(self) -> int:
+        return sum(len(series) for series in self.matrix)
+
+
+@dataclass
+class _Entry:
+    extents: List[Extent] = field(default_factory=list)
+
+
+class RangeQueryCache:
+    """Per-query extent cache for Prometheus range queries.
+
+    Requests are aligned to ``step_seconds`` so overlapping windows share grid
+    points; only the sub-ranges not covered by cached extents are fetched.
+    Each query keeps at most ``max_points`` samples, so a window sliding
+    forward for hours drops its oldest extents instead of growing forever.
+    """
+
+    def __init__(
+        self,
+        max_queries: int = DEFAULT_MAX_QUERIES,
+        max_freshness_s: int = DEFAULT_MAX_FRESHNESS_S,
+        recent_ttl_s: int = DEFAULT_RECENT_TTL_S,
+        max_points: int = DEFAULT_MAX_POINTS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_queries = max_queries
+        self.max_points = max_points
+        self.max_freshness_s = max_freshness_s
+        self.recent_ttl_s = recent_ttl_s
+        self.clock = clock
+        self._entries: "OrderedDict[Tuple[str, str, int], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _missing(self, extents: List[Extent], start: int, end: int) -> List[Tuple[int, int]]:
+        gaps: List[Tuple[int, int]] = []
+        cursor = start
+        for extent in extents:
+            if extent.end <= cursor:
+                continue
+            if extent.start >= end:
+                break
+            if extent.start > cursor:
+                gaps.append((cursor, extent.start))
+            cursor = max(cursor, extent.end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def _split_mutable(self, extent: Extent, step: int) -> List[Extent]:
+        now = self.clock()
+        boundary = int(now - self.max_freshness_s) // step * step
+        if extent.end <= boundary:
+            return [extent]
+        expires_at = now + self.recent_ttl_s
+        if extent.start >= boundary:
+            extent.expires_at = expires_at
+            return [extent]
+        return [
+            Extent(extent.start, boundary, slice_matrix(extent.matrix, extent.start, boundary)),
+            Extent(
+                boundary,
+                extent.end,
+                slice_matrix(extent.matrix, boundary, extent.end),
+                expires_at=expires_at,
+            ),
+        ]
+
+    def _insert(self, entry: _Entry, new: List[Extent]) -> None:
+        extents = sorted(entry.extents + new, key=lambda e: e.start)
+        merged: List[Extent] = []
+        for extent in extents:
+            last = merged[-1] if merged else None
+            # Only coalesce extents with identical lifetimes so short-TTL
+            # samples never inherit a permanent slot.
+            if last and extent.start <= last.end and last.expires_at == extent.expires_at:
+                last.matrix = merge_matrices([last.matrix, extent.matrix])
+                last.end = max(last.end, extent.end)
+            else:
+                merged.append(extent)
+        entry.extents = merged
+
+    def _trim(self, entry: _Entry, step: int) -> None:
+        total = sum(extent.points for extent in entry.extents)
+        while total > self.max_points and entry.extents:
+            oldest = entry.extents[0]
+            excess = total - self.max_points
+            if oldest.points <= excess:
+                entry.extents.pop(0)
+                total -= oldest.points
+                continue
+            # Cut whole steps off the front; every series has at most one sample per step.
+            cut_steps = -(-excess // max(len(oldest.matrix), 1))
+            oldest.start = min(oldest.start + cut_steps * step, oldest.end)
+            before = oldest.points
+            oldest.matrix = slice_matrix(oldest.matrix, oldest.start, oldest.end)
+            total -= before - oldest.points
+
+    def get_or_fetch(
+        self, call: PromQLQuery, fetch: Fetcher, namespace: str = ""
+    ) -> List[ColumnarSeries]:
+        step = call.step_seconds
+        start, end_inclusive = align_range(call.start, call.end, step)
+        end = end_inclusive + step
+        key = (namespace, call.query, step)
+
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry()
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            entry.extents = [e for e in entry.extents if not e.expired(now)]
+            gaps = self._missing(entry.extents, start, end)
+            while len(self._entries) > self.max_queries:
+                self._entries.popitem(last=False)
+
+        if not gaps:
+            record_promql_cache("hit")
+        else:
+            record_promql_cache("partial" if gaps != [(start, end)] else "miss")
+
+        fetched: List[Extent] = []
+        for gap_start, gap_end in gaps:
+            # PromQLQuery requires end > start, so single-point gaps fetch one extra step.
+            fetch_end = max(gap_end - step, gap_start + step)
+            sub_call = call.model_copy(
+                update={
+                    "start": datetime.fromtimestamp(gap_start, tz=timezone.utc),
+                    "end": datetime.fromtimestamp(fetch_end, tz=timezone.utc),
+                }
+            )
+            extent = Extent(gap_start, fetch_end + step, fetch(sub_call))
+            fetched.extend(self._split_mutable(extent, step))
+
+        with self._lock:
+            if fetched:
+                self._insert(entry, fetched)
+            overlapping = [
+                extent.matrix
+                for extent in entry.extents
+                if extent.end > start and extent.start < end
+            ]
+            self._trim(entry, step)
+        return slice_matrix(merge_matrices(overlapping), start, end)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_default_cache: Optional[RangeQueryCache] = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[RangeQueryCache]:
+    """Process-wide cache sized by ``PROMQL_CACHE_MAX_QUERIES`` (0 disables caching)."""
+    global _default_cache
+    max_queries = int(os.getenv("PROMQL_CACHE_MAX_QUERIES", str(DEFAULT_MAX_QUERIES)))
+    if max_queries <= 0:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = RangeQueryCache(
+                max_queries=max_queries,
+                max_freshness_s=int(
+                    os.getenv("PROMQL_CACHE_MAX_FRESHNESS_S", str(DEFAULT_MAX_FRESHNESS_S))
+                ),
+                recent_ttl_s=int(os.getenv("PROMQL_CACHE_RECENT_TTL_S", str(DEFAULT_RECENT_TTL_S))),
+                max_points=int(os.getenv("PROMQL_CACHE_MAX_POINTS", str(DEFAULT_MAX_POINTS))),
+            )
+        return _default_cache
+
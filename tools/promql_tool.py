@@ -1,44 +1,122 @@
 from __future__ import annotations
 
 import hashlib
+import json
+import time
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 
-from tools.tool_schemas import PromQLQuery, TimeSeriesPoint, ToolResult
-from tools.validators import ensure_valid_tool_call
+import numpy as np
+
+from serving.metrics import record_tool_latency
+from serving.schemas import IncidentRequest
+from tools.prometheus_executor import PrometheusTimeoutError, get_executor
+from tools.promql_cache import RangeQueryCache, get_default_cache
+from tools.tool_schemas import ColumnarSeries, PromQLQuery, ToolCall, ToolResult
+from tools.validators import (
+    PromQLValidationError,
+    QueryBudget,
+    enforce_query_budget,
+    ensure_valid_tool_call,
+)
+
+DEFAULT_CONTEXT_WINDOW_MINUTES = 30
+DEFAULT_CONTEXT_QUERIES = 4
+# Cumulative metrics are only meaningful as a rate.
+COUNTER_SUFFIXES = ("_total", "_count", "_sum")
 
 
 class PromQLTool:
-    """PromQL tool interface with mock local execution."""
+    """PromQL tool interface with mock local execution or a real Prometheus backend."""
 
-    def __init__(self, mode: str = "mock"):
+    def __init__(
+        self,
+        mode: str = "mock",
+        endpoint: Optional[str] = None,
+        cache: Optional[RangeQueryCache] = None,
+        budget: Optional[QueryBudget] = None,
+    ):
         self.mode = mode.lower()
+        self.endpoint = endpoint
+        self.budget = budget or QueryBudget.from_env()
+        # Mock series are derived from the requested start, so only real backends are cached.
+        self.cache = cache if cache is not None or self.mode == "mock" else get_default_cache()
 
-    def _mock_query(self, call: PromQLQuery) -> List[TimeSeriesPoint]:
-        series: List[TimeSeriesPoint] = []
+    def _mock_query(self, call: PromQLQuery) -> List[ColumnarSeries]:
         total_seconds = int((call.end - call.start).total_seconds())
         steps = max(total_seconds // call.step_seconds, 1)
         seed = int(hashlib.sha1(call.query.encode("utf-8")).hexdigest()[:8], 16)
-        for i in range(steps + 1):
-            ts = call.start + timedelta(seconds=i * call.step_seconds)
-            magnitude = (seed % 100) / 10.0
-            value = magnitude + i * 0.1
-            series.append(
-                TimeSeriesPoint(
-                    timestamp=ts,
-                    value=float(f"{value:.3f}"),
-                    labels={"source": "mock", "query_fingerprint": str(seed % 10000)},
-                )
-            )
-        return series
+        offsets = np.arange(steps + 1, dtype=np.float64)
+        timestamps = call.start.timestamp() + offsets * call.step_seconds
+        magnitude = (seed % 100) / 10.0
+        values = np.round(magnitude + offsets * 0.1, 3)
+        labels = {"source": "mock", "query_fingerprint": str(seed % 10000)}
+        return [ColumnarSeries(labels, timestamps, values)]
 
-    def run(self, call: PromQLQuery) -> ToolResult:
+    def run(self, call: PromQLQuery, timeout_s: Optional[float] = None) -> ToolResult:
         ensure_valid_tool_call(call)
-        if self.mode != "mock":
-            # Placeholder for real Prometheus/vLLM sidecar integrations.
-            # For now we mirror mock behavior to keep the interface stable.
-            return ToolResult(tool_name="promql_query", query=call, series=self._mock_query(call))
-        return ToolResult(tool_name="promql_query", query=call, series=self._mock_query(call))
+        call = enforce_query_budget(call, self.budget)
+        start = time.perf_counter()
+        outcome = "success"
+        try:
+            if self.mode == "mock":
+                matrix = self._mock_query(call)
+            else:
+                executor = get_executor(self.endpoint)
+
+                def fetch(sub_call: PromQLQuery) -> List[ColumnarSeries]:
+                    return executor.query_range(sub_call, timeout_s=timeout_s)
+
+                if self.cache is not None:
+                    matrix = self.cache.get_or_fetch(call, fetch, namespace=executor.base_url)
+                else:
+                    matrix = fetch(call)
+        except PrometheusTimeoutError:
+            outcome = "timeout"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            record_tool_latency("promql_query", outcome, time.perf_counter() - start)
+        return ToolResult(tool_name="promql_query", query=call, matrix=matrix)
+
+
+def incident_queries(
+    incident: IncidentRequest,
+    window_minutes: int = DEFAULT_CONTEXT_WINDOW_MINUTES,
+    step_seconds: int = 60,
+    limit: int = DEFAULT_CONTEXT_QUERIES,
+) -> List[ToolCall]:
+    """Range queries for the incident's snapshot metrics over the window before it started.
+
+    Run before generation, so the model sees summarized history instead of
+    single snapshot values. Metrics that do not form valid PromQL are skipped.
+    """
+    calls: List[ToolCall] = []
+    seen = set()
+    for metric in incident.metrics_snapshot:
+        matchers = ",".join(f"{key}={json.dumps(value)}" for key, value in sorted(metric.labels.items()))
+        selector = f"{metric.name}{{{matchers}}}"
+        query = f"rate({selector}[5m])" if metric.name.endswith(COUNTER_SUFFIXES) else selector
+        if query in seen:
+            continue
+        try:
+            call = ensure_valid_tool_call(
+                PromQLQuery(
+                    query=query,
+                    start=incident.timestamp - timedelta(minutes=window_minutes),
+                    end=incident.timestamp,
+                    step_seconds=step_seconds,
+                )
+            )
+        except PromQLValidationError:
+            continue
+        seen.add(query)
+        calls.append(ToolCall(tool_name="promql_query", arguments=call))
+        if len(calls) >= limit:
+            break
+    return calls
 
 
 def promql_query(query: str, start: datetime, end: datetime, step_seconds: int) -> ToolResult:
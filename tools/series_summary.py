@@ -0,0 +1,267 @@
+"""Compact, prompt-ready summaries of PromQL tool results.
+
+All statistics are computed on whole batches of series at once: series are
+grouped by length and stacked into 2-D arrays so each step is a numpy
+reduction over the batch rather than a Python loop over points.
+"""
+from __future__ import annotations
+
+import json
+import math
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from serving.metrics import record_metric_summary
+from tools.tool_schemas import ColumnarSeries, ToolResult
+
+DEFAULT_REPRESENTATIVE_POINTS = 8
+SPIKE_Z_THRESHOLD = 5.0
+CHANGE_POINT_MIN_SHIFT = 1.0  # in standard deviations of the series
+MAX_SPIKES = 3
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used when no tokenizer is at hand."""
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def estimate_raw_tokens(series: ColumnarSeries, sample: int = 64) -> int:
+    """Tokens the series would cost verbatim, extrapolated from a sample of points.
+
+    Encoding every point just to measure it would cost more than summarizing.
+    """
+    count = len(series)
+    if not count:
+        return 0
+    points_text = json.dumps(
+        list(zip(series.timestamps[:sample].tolist(), series.values[:sample].tolist())),
+        separators=(",", ":"),
+    )
+    labels_text = json.dumps(series.labels, separators=(",", ":"))
+    per_point = len(points_text) / min(count, sample)
+    return estimate_tokens(labels_text) + int(math.ceil(per_point * count / CHARS_PER_TOKEN))
+
+
+def _fmt(value: float) -> Optional[float]:
+    if not math.isfinite(value):
+        return None
+    return float(f"{value:.4g}")
+
+
+def _ts(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _fill_nan(values: np.ndarray) -> np.ndarray:
+    """Replace NaNs with the row mean so reductions stay finite."""
+    if not np.isnan(values).any():
+        return values
+    with np.errstate(all="ignore"):
+        row_mean = np.nanmean(values, axis=1, keepdims=True)
+    row_mean = np.where(np.isnan(row_mean), 0.0, row_mean)
+    return np.where(np.isnan(values), row_mean, values)
+
+
+def lttb_indices(timestamps: np.ndarray, values: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets over a ``(series, points)`` batch.
+
+    Buckets are processed in order (each choice depends on the previous one),
+    but every bucket step is vectorized across all series in the batch.
+    """
+    n_series, n = values.shape
+    if n <= n_out:
+        return np.tile(np.arange(n), (n_series, 1))
+    if n_out < 3:
+        return np.tile(np.array([0, n - 1][: max(n_out, 1)]), (n_series, 1))
+    rows = np.arange(n_series)
+    out = np.empty((n_series, n_out), dtype=np.int64)
+    out[:, 0] = 0
+    out[:, -1] = n - 1
+    every = (n - 2) / (n_out - 2)
+    selected = np.zeros(n_series, dtype=np.int64)
+    for i in range(n_out - 2):
+        start = int(math.floor(i * every)) + 1
+        end = int(math.floor((i + 1) * every)) + 1
+        next_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        avg_t = timestamps[:, end:next_end].mean(axis=1)
+        avg_v = values[:, end:next_end].mean(axis=1)
+        at = timestamps[rows, selected]
+        av = values[rows, selected]
+        bt = timestamps[:, start:end]
+        bv = values[:, start:end]
+        area = np.abs(
+            (at - avg_t)[:, None] * (bv - av[:, None]) - (at[:, None] - bt) * (avg_v - av)[:, None]
+        )
+        selected = start + np.argmax(area, axis=1)
+        out[:, i + 1] = selected
+    return out
+
+
+def change_points(values: np.ndarray, min_segment: int = 2) -> Dict[str, np.ndarray]:
+    """Best single mean-shift split per series (binary segmentation, one level)."""
+    n_series, n = values.shape
+    if n < 2 * min_segment:
+        empty = np.full(n_series, np.nan)
+        return {"index": np.full(n_series, -1), "before": empty, "after": empty, "score": empty}
+    csum = np.cumsum(values, axis=1)
+    total = csum[:, -1:]
+    k = np.arange(min_segment, n - min_segment + 1)
+    before = csum[:, k - 1] / k
+    after = (total - csum[:, k - 1]) / (n - k)
+    weight = np.sqrt(k * (n - k) / n)
+    stat = np.abs(after - before) * weight
+    best = np.argmax(stat, axis=1)
+    rows = np.arange(n_series)
+    std = values.std(axis=1)
+    shift = after[rows, best] - before[rows, best]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = np.where(std > 0, np.abs(shift) / std, 0.0)
+    return {"index": k[best], "before": before[rows, best], "after": after[rows, best], "score": score}
+
+
+def robust_zscores(values: np.ndarray) -> np.ndarray:
+    """Median/MAD z-scores per series, falling back to std when MAD is zero."""
+    median = np.median(values, axis=1, keepdims=True)
+    deviation = values - median
+    mad = np.median(np.abs(deviation), axis=1, keepdims=True)
+    std = values.std(axis=1, keepdims=True)
+    scale = np.where(mad > 0, mad / 0.6745, std)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(scale > 0, deviation / scale, 0.0)
+
+
+def slopes(timestamps: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Least-squares slope per series, in value units per minute."""
+    t = (timestamps - timestamps[:, :1]) / 60.0
+    t_centered = t - t.mean(axis=1, keepdims=True)
+    v_centered = values - values.mean(axis=1, keepdims=True)
+    denom = (t_centered**2).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denom > 0, (t_centered * v_centered).sum(axis=1) / denom, 0.0)
+
+
+def pivot_deltas(timestamps: np.ndarray, values: np.ndarray, pivot: float) -> Dict[str, np.ndarray]:
+    """Mean before vs. at-or-after ``pivot`` (e.g. a deploy) per series."""
+    after_mask = timestamps >= pivot
+    before_mask = ~after_mask
+    with np.errstate(divide="ignore", invalid="ignore"):
+        before = np.where(before_mask, values, 0.0).sum(axis=1) / before_mask.sum(axis=1)
+        after = np.where(after_mask, values, 0.0).sum(axis=1) / after_mask.sum(axis=1)
+        pct = np.where(before != 0, (after - before) / np.abs(before) * 100.0, np.nan)
+    return {"before": before, "after": after, "pct": pct}
+
+
+@dataclass
+class BatchSummary:
+    series: List[Dict[str, Any]] = field(default_factory=list)
+    raw_tokens: int = 0
+    summary_tokens: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(self.raw_tokens - self.summary_tokens, 0)
+
+    @property
+    def saved_ratio(self) -> float:
+        return self.saved_tokens / self.raw_tokens if self.raw_tokens else 0.0
+
+    def to_json(self) -> str:
+        return json.dumps(self.series, separators=(",", ":"))
+
+
+def _summarize_group(
+    group: List[ColumnarSeries],
+    queries: List[str],
+    representative_points: int,
+    pivot: Optional[float],
+) -> List[Dict[str, Any]]:
+    timestamps = np.vstack([s.timestamps for s in group])
+    values = _fill_nan(np.vstack([s.values for s in group]))
+    n = values.shape[1]
+
+    mins, maxs, means = values.min(axis=1), values.max(axis=1), values.mean(axis=1)
+    p95 = np.percentile(values, 95, axis=1)
+    slope = slopes(timestamps, values)
+    cps = change_points(values)
+    zscores = robust_zscores(values)
+    keep = lttb_indices(timestamps, values, representative_points)
+    deltas = pivot_deltas(timestamps, values, pivot) if pivot is not None else None
+
+    summaries: List[Dict[str, Any]] = []
+    for row, series in enumerate(group):
+        spike_idx = np.flatnonzero(np.abs(zscores[row]) > SPIKE_Z_THRESHOLD)
+        spike_idx = spike_idx[np.argsort(-np.abs(zscores[row, spike_idx]))][:MAX_SPIKES]
+        summary: Dict[str, Any] = {
+            "query": queries[row],
+            "labels": series.labels,
+            "points": n,
+            "min": _fmt(mins[row]),
+            "max": _fmt(maxs[row]),
+            "mean": _fmt(means[row]),
+            "p95": _fmt(p95[row]),
+            "last": _fmt(values[row, -1]),
+            "slope_per_min": _fmt(slope[row]),
+            "spikes": [
+                {"ts": _ts(timestamps[row, i]), "value": _fmt(values[row, i])}
+                for i in sorted(spike_idx.tolist())
+            ],
+            "representative": [
+                [_ts(timestamps[row, i]), _fmt(values[row, i])] for i in keep[row].tolist()
+            ],
+        }
+        if cps["index"][row] >= 0 and cps["score"][row] >= CHANGE_POINT_MIN_SHIFT:
+            idx = int(cps["index"][row])
+            summary["change_point"] = {
+                "ts": _ts(timestamps[row, idx]),
+                "before": _fmt(cps["before"][row]),
+                "after": _fmt(cps["after"][row]),
+            }
+        if deltas is not None:
+            summary["deploy_delta"] = {
+                "before": _fmt(deltas["before"][row]),
+                "after": _fmt(deltas["after"][row]),
+                "pct": _fmt(deltas["pct"][row]),
+            }
+        summaries.append(summary)
+    return summaries
+
+
+def summarize_results(
+    results: Sequence[ToolResult],
+    representative_points: int = DEFAULT_REPRESENTATIVE_POINTS,
+    pivot: Optional[datetime] = None,
+) -> BatchSummary:
+    """Summarize every series across ``results`` and report prompt-token savings.
+
+    ``pivot`` (typically the deploy time) adds before/after mean deltas.
+    """
+    flat: List[ColumnarSeries] = []
+    queries: List[str] = []
+    for result in results:
+        for series in result.matrix:
+            if len(series):
+                flat.append(series)
+                queries.append(result.query.query)
+
+    groups: Dict[int, List[int]] = {}
+    for idx, series in enumerate(flat):
+        groups.setdefault(len(series), []).append(idx)
+
+    ordered: List[Optional[Dict[str, Any]]] = [None] * len(flat)
+    pivot_ts = pivot.timestamp() if pivot is not None else None
+    for indices in groups.values():
+        summaries = _summarize_group(
+            [flat[i] for i in indices], [queries[i] for i in indices], representative_points, pivot_ts
+        )
+        for idx, summary in zip(indices, summaries):
+            ordered[idx] = summary
+
+    batch = BatchSummary(series=[s for s in ordered if s is not None])
+    batch.raw_tokens = sum(estimate_raw_tokens(series) for series in flat)
+    batch.summary_tokens = estimate_tokens(batch.to_json())
+    record_metric_summary(batch.raw_tokens, batch.summary_tokens)
+    return batch
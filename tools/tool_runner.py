@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from serving.deadline import Deadline
+from serving.metrics import record_tool_stage, record_tool_timeout
+from tools.prometheus_executor import PrometheusTimeoutError
+from tools.promql_tool import PromQLTool
+from tools.tool_schemas import ToolCall, ToolExecution, ToolResult
+
+DEFAULT_MAX_CONCURRENCY_PER_BACKEND = 4
+DEFAULT_MAX_WORKERS = 32
+# Floor for per-call timeouts so a nearly-spent deadline still yields a bounded request.
+MIN_CALL_TIMEOUT_S = 0.001
+
+_pool: Optional[ThreadPoolExecutor] = None
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv("TOOL_MAX_WORKERS", str(DEFAULT_MAX_WORKERS))),
+                thread_name_prefix="tool-runner",
+            )
+        return _pool
+
+
+def _backend_semaphore(backend: str) -> threading.BoundedSemaphore:
+    with _lock:
+        semaphore = _semaphores.get(backend)
+        if semaphore is None:
+            limit = int(
+                os.getenv("TOOL_MAX_CONCURRENCY_PER_BACKEND", str(DEFAULT_MAX_CONCURRENCY_PER_BACKEND))
+            )
+            semaphore = threading.BoundedSemaphore(limit)
+            _semaphores[backend] = semaphore
+        return semaphore
+
+
+@dataclass
+class ToolRunReport:
+    executions: List[ToolExecution] = field(default_factory=list)
+    results: List[Optional[ToolResult]] = field(default_factory=list)
+    elapsed_s: float = 0.0
+
+    @property
+    def completed(self) -> List[ToolResult]:
+        return [result for result in self.results if result is not None]
+
+    @property
+    def timed_out(self) -> bool:
+        return any(execution.status == "timeout" for execution in self.executions)
+
+
+class ToolRunner:
+    """Runs every tool call of one triage concurrently under a shared deadline.
+
+    Calls against the same backend share a process-wide concurrency cap.
+    Calls still running at the deadline are reported as timeouts and the
+    finished ones are returned, so stage latency tracks the slowest call
+    that fits in the budget rather than the sum of all calls.
+    """
+
+    def __init__(self, tool: PromQLTool):
+        self.tool = tool
+
+    @property
+    def backend(self) -> str:
+        return self.tool.mode if self.tool.mode == "mock" else f"{self.tool.mode}:{self.tool.endpoint}"
+
+    def _execute(self, call: ToolCall, deadline: Deadline, timing: Dict[str, float]) -> ToolResult:
+        semaphore = _backend_semaphore(self.backend)
+        if not semaphore.acquire(timeout=deadline.remaining()):
+            raise TimeoutError("Deadline expired waiting for a backend slot")
+        timing["start"] = time.perf_counter()
+        try:
+            if call.tool_name != "promql_query":
+                raise ValueError(f"Unsupported tool: {call.tool_name}")
+            return self.tool.run(call.arguments, timeout_s=max(deadline.remaining(), MIN_CALL_TIMEOUT_S))
+        finally:
+            timing["end"] = time.perf_counter()
+            semaphore.release()
+
+    def run(self, calls: Sequence[ToolCall], deadline: Deadline) -> ToolRunReport:
+        stage_start = time.perf_counter()
+        report = ToolRunReport()
+        if not calls:
+            return report
+
+        pool = _get_pool()
+        timings: List[Dict[str, float]] = [{} for _ in calls]
+        futures: List[Future] = [
+            pool.submit(self._execute, call, deadline, timings[idx]) for idx, call in enumerate(calls)
+        ]
+        done, _ = wait(futures, timeout=deadline.remaining())
+
+        now = time.perf_counter()
+        for call, future, timing in zip(calls, futures, timings):
+            end = timing.get("end", now) if future in done else now
+            latency_ms = (end - timing.get("start", stage_start)) * 1000
+            execution = ToolExecution(
+                tool_name=call.tool_name,
+                query=call.arguments.query,
+                status="ok",
+                latency_ms=latency_ms,
+            )
+            result: Optional[ToolResult] = None
+            if future not in done:
+                future.cancel()
+                execution.status = "timeout"
+                execution.error = "deadline exceeded"
+            else:
+                exc = future.exception()
+                if isinstance(exc, (TimeoutError, PrometheusTimeoutError)):
+                    execution.status, execution.error = "timeout", str(exc)
+                elif exc is not None:
+                    execution.status, execution.error = "error", str(exc)
+                else:
+                    result = future.result()
+                    execution.points = result.point_count
+            if execution.status == "timeout":
+                record_tool_timeout(call.tool_name)
+            report.executions.append(execution)
+            report.results.append(result)
+
+        report.elapsed_s = time.perf_counter() - stage_start
+        record_tool_stage(report.elapsed_s)
+        return report
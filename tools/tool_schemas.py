@@ -1,9 +1,11 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Dict, List
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
 
-from pydantic import BaseModel, Field, field_validator
+import numpy as np
+from numpy.typing import ArrayLike
+from pydantic import BaseModel, ConfigDict, Field, field_serializer, field_validator
 
 
 class PromQLQuery(BaseModel):
@@ -34,12 +36,96 @@ class TimeSeriesPoint(BaseModel):
     labels: Dict[str, str]
 
 
+class ColumnarSeries:
+    """One labelled series held as parallel float64 arrays.
+
+    ``timestamps`` are epoch seconds. Arrays passed in as float64 are kept
+    as-is (no copy) and ``slice`` returns views, so building, caching and
+    trimming results never materializes per-point objects.
+    """
+
+    __slots__ = ("labels", "timestamps", "values")
+
+    def __init__(self, labels: Dict[str, str], timestamps: ArrayLike, values: ArrayLike):
+        self.labels = labels
+        self.timestamps: np.ndarray = np.asarray(timestamps, dtype=np.float64)
+        self.values: np.ndarray = np.asarray(values, dtype=np.float64)
+        if self.timestamps.shape != self.values.shape:
+            raise ValueError("timestamps and values must have the same shape")
+
+    @classmethod
+    def from_prometheus(cls, series: Dict[str, Any]) -> "ColumnarSeries":
+        """Build from one ``data.result`` entry of a Prometheus matrix response."""
+        samples = series.get("values", [])
+        count = len(samples)
+        timestamps = np.fromiter((s[0] for s in samples), dtype=np.float64, count=count)
+        # Prometheus encodes sample values as strings; numpy parses them in one pass.
+        values = np.array([s[1] for s in samples], dtype=np.float64)
+        labels = {str(k): str(v) for k, v in series.get("metric", {}).items()}
+        return cls(labels, timestamps, values)
+
+    def __len__(self) -> int:
+        return int(self.timestamps.shape[0])
+
+    def __repr__(self) -> str:
+        return f"ColumnarSeries(labels={self.labels!r}, points={len(self)})"
+
+    @property
+    def key(self) -> Tuple[Tuple[str, str], ...]:
+        return tuple(sorted(self.labels.items()))
+
+    def slice(self, start: float, end: float) -> "ColumnarSeries":
+        """Samples with ``start <= ts < end``; assumes timestamps are sorted."""
+        lo, hi = np.searchsorted(self.timestamps, [start, end], side="left")
+        return ColumnarSeries(self.labels, self.timestamps[lo:hi], self.values[lo:hi])
+
+    def points(self) -> List[TimeSeriesPoint]:
+        return [
+            TimeSeriesPoint(
+                timestamp=datetime.fromtimestamp(ts, tz=timezone.utc), value=value, labels=self.labels
+            )
+            for ts, value in zip(self.timestamps.tolist(), self.values.tolist())
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-ready form. Not cached: the lists would double the memory of cached series."""
+        return {
+            "labels": self.labels,
+            "timestamps": self.timestamps.tolist(),
+            "values": self.values.tolist(),
+        }
+
+
 class ToolCall(BaseModel):
     tool_name: str
     arguments: PromQLQuery
 
 
 class ToolResult(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     tool_name: str
     query: PromQLQuery
-    series: List[TimeSeriesPoint]
+    matrix: List[ColumnarSeries] = Field(default_factory=list)
+
+    @field_serializer("matrix")
+    def serialize_matrix(self, matrix: List[ColumnarSeries]) -> List[Dict[str, Any]]:
+        return [series.to_dict() for series in matrix]
+
+    @property
+    def series(self) -> List[TimeSeriesPoint]:
+        """Flattened per-point view, materialized only when asked for."""
+        return [point for series in self.matrix for point in series.points()]
+
+    @property
+    def point_count(self) -> int:
+        return sum(len(series) for series in self.matrix)
+
+
+class ToolExecution(BaseModel):
+    tool_name: str
+    query: str
+    status: str = Field(..., description="ok, timeout or error")
+    latency_ms: float
+    points: int = 0
+    error: Optional[str] = None
@@ -1,31 +1,633 @@
 from __future__ import annotations
 
+import math
+import os
 import re
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 from tools.tool_schemas import PromQLQuery
 
-# Best-effort tokenizer: allow common PromQL characters.
-PROMQL_ALLOWED_RE = re.compile(r"^[a-zA-Z0-9_:{}\[\](),=+\-*/\s\"'\.<>!~^%|]+$")
-
 
 class PromQLValidationError(ValueError):
     pass
 
 
-def validate_promql_syntax(query: str) -> bool:
-    """Lightweight PromQL syntax guardrail."""
+class PromQLCostError(PromQLValidationError):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Tokenizer
+# ---------------------------------------------------------------------------
+
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "y": 31536000}
+DURATION_RE = re.compile(r"(?:\d+(?:ms|s|m|h|d|w|y))+")
+DURATION_PART_RE = re.compile(r"(\d+)(ms|s|m|h|d|w|y)")
+NUMBER_RE = re.compile(r"0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+IDENT_RE = re.compile(r"[a-zA-Z_][a-zA-Z0-9_:]*")
+OPERATORS = ("==", "!=", ">=", "<=", "=~", "!~", "=", ">", "<", "+", "-", "*", "/", "%", "^")
+PUNCTUATION = "(){}[],:@"
+
+
+@dataclass(frozen=True)
+class Token:
+    kind: str  # ident, number, duration, string, op, punct, eof
+    value: str
+    pos: int
+
+
+def parse_duration(value: str) -> float:
+    if not DURATION_RE.fullmatch(value):
+        raise PromQLValidationError(f"Invalid duration '{value}'")
+    return sum(int(n) * DURATION_UNITS[unit] for n, unit in DURATION_PART_RE.findall(value))
+
+
+def tokenize(query: str) -> List[Token]:
+    tokens: List[Token] = []
+    pos = 0
+    length = len(query)
+    while pos < length:
+        ch = query[pos]
+        if ch.isspace():
+            pos += 1
+            continue
+        if ch == "#":
+            newline = query.find("\n", pos)
+            pos = length if newline == -1 else newline
+            continue
+        if ch in "\"'`":
+            end = pos + 1
+            while end < length and query[end] != ch:
+                end += 2 if query[end] == "\\" and ch != "`" else 1
+            if end >= length:
+                raise PromQLValidationError(f"Unterminated string at position {pos}")
+            tokens.append(Token("string", query[pos + 1 : end], pos))
+            pos = end + 1
+            continue
+        if ch.isdigit() or (ch == "." and pos + 1 < length and query[pos + 1].isdigit()):
+            match = DURATION_RE.match(query, pos)
+            if match and not IDENT_RE.match(query, match.end()):
+                tokens.append(Token("duration", match.group(), pos))
+                pos = match.end()
+                continue
+            match = NUMBER_RE.match(query, pos)
+            if not match or IDENT_RE.match(query, match.end()):
+                raise PromQLValidationError(f"Invalid number at position {pos}")
+            tokens.append(Token("number", match.group(), pos))
+            pos = match.end()
+            continue
+        match = IDENT_RE.match(query, pos)
+        if match:
+            tokens.append(Token("ident", match.group(), pos))
+            pos = match.end()
+            continue
+        for op in OPERATORS:
+            if query.startswith(op, pos):
+                tokens.append(Token("op", op, pos))
+                pos += len(op)
+                break
+        else:
+            if ch in PUNCTUATION:
+                tokens.append(Token("punct", ch, pos))
+                pos += 1
+                continue
+            raise PromQLValidationError(f"Query has illegal character {ch!r} at position {pos}")
+    tokens.append(Token("eof", "", length))
+    return tokens
+
+
+# ---------------------------------------------------------------------------
+# AST
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Matcher:
+    label: str
+    op: str
+    value: str
+
+
+@dataclass(frozen=True)
+class VectorSelector:
+    metric: Optional[str]
+    matchers: Tuple[Matcher, ...] = ()
+    range_seconds: Optional[float] = None
+    offset_seconds: float = 0.0
+
+
+@dataclass(frozen=True)
+class Subquery:
+    expr: "Expr"
+    range_seconds: float
+    step_seconds: Optional[float] = None
+    offset_seconds: float = 0.0
+
+
+@dataclass(frozen=True)
+class NumberLiteral:
+    value: float
+
+
+@dataclass(frozen=True)
+class StringLiteral:
+    value: str
+
+
+@dataclass(frozen=True)
+class Call:
+    func: str
+    args: Tuple["Expr", ...]
+
+
+@dataclass(frozen=True)
+class Aggregation:
+    op: str
+    args: Tuple["Expr", ...]
+    grouping: Tuple[str, ...] = ()
+    without: bool = False
+
+
+@dataclass(frozen=True)
+class Unary:
+    op: str
+    expr: "Expr"
+
+
+@dataclass(frozen=True)
+class BinaryOp:
+    op: str
+    lhs: "Expr"
+    rhs: "Expr"
+    return_bool: bool = False
+
+
+Expr = Union[VectorSelector, Subquery, NumberLiteral, StringLiteral, Call, Aggregation, Unary, BinaryOp]
+
+AGGREGATIONS = {
+    "sum", "avg", "count", "min", "max", "group", "stddev", "stdvar",
+    "topk", "bottomk", "quantile", "count_values", "limitk", "limit_ratio",
+}
+PARAM_AGGREGATIONS = {"topk", "bottomk", "quantile", "count_values", "limitk", "limit_ratio"}
+# Function name -> index of the argument that must be a range vector.
+RANGE_FUNCTIONS = {
+    "rate": 0, "irate": 0, "increase": 0, "delta": 0, "idelta": 0, "deriv": 0,
+    "changes": 0, "resets": 0, "predict_linear": 0, "holt_winters": 0,
+    "double_exponential_smoothing": 0, "avg_over_time": 0, "min_over_time": 0,
+    "max_over_time": 0, "sum_over_time": 0, "count_over_time": 0, "stddev_over_time": 0,
+    "stdvar_over_time": 0, "last_over_time": 0, "present_over_time": 0,
+    "absent_over_time": 0, "mad_over_time": 0, "quantile_over_time": 1,
+}
+INSTANT_FUNCTIONS = {
+    "abs", "absent", "acos", "acosh", "asin", "asinh", "atan", "atanh", "ceil", "clamp",
+    "clamp_max", "clamp_min", "cos", "cosh", "day_of_month", "day_of_week", "day_of_year",
+    "days_in_month", "deg", "exp", "floor", "histogram_avg", "histogram_count",
+    "histogram_fraction", "histogram_quantile", "histogram_stddev", "histogram_stdvar",
+    "histogram_sum", "hour", "label_join", "label_replace", "ln", "log10", "log2", "minute",
+    "month", "pi", "rad", "round", "scalar", "sgn", "sin", "sinh", "sort", "sort_by_label",
+    "sort_by_label_desc", "sort_desc", "sqrt", "tan", "tanh", "time", "timestamp", "vector",
+    "year",
+}
+BINARY_PRECEDENCE = {
+    "or": 1, "and": 2, "unless": 2,
+    "==": 3, "!=": 3, "<=": 3, "<": 3, ">=": 3, ">": 3,
+    "+": 4, "-": 4,
+    "*": 5, "/": 5, "%": 5, "atan2": 5,
+    "^": 6,
+}
+COMPARISON_OPS = {"==", "!=", "<=", "<", ">=", ">"}
+MATCH_OPS = {"=", "!=", "=~", "!~"}
+
+
+# ---------------------------------------------------------------------------
+# Parser
+# ---------------------------------------------------------------------------
+
+
+class _Parser:
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset: int = 0) -> Token:
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def advance(self) -> Token:
+        token = self.tokens[self.pos]
+        self.pos = min(self.pos + 1, len(self.tokens) - 1)
+        return token
+
+    def expect(self, value: str) -> Token:
+        token = self.advance()
+        if token.kind == "eof":
+            raise PromQLValidationError(f"Unexpected end of query, expected '{value}'")
+        if token.value != value or token.kind == "string":
+            raise PromQLValidationError(
+                f"Expected '{value}' at position {token.pos}, found '{token.value or 'end of query'}'"
+            )
+        return token
+
+    def at(self, value: str) -> bool:
+        token = self.peek()
+        return token.kind in {"op", "punct", "ident"} and token.value == value
+
+    def parse(self) -> Expr:
+        expr = self.parse_expr(1)
+        token = self.peek()
+        if token.kind != "eof":
+            raise PromQLValidationError(f"Unexpected '{token.value}' at position {token.pos}")
+        return expr
+
+    def _binary_op(self) -> Optional[str]:
+        token = self.peek()
+        if token.kind == "op" and token.value in BINARY_PRECEDENCE:
+            return token.value
+        if token.kind == "ident" and token.value.lower() in {"and", "or", "unless", "atan2"}:
+            return token.value.lower()
+        return None
+
+    def parse_expr(self, min_prec: int) -> Expr:
+        lhs = self.parse_unary()
+        while True:
+            op = self._binary_op()
+            if op is None or BINARY_PRECEDENCE[op] < min_prec:
+                return lhs
+            self.advance()
+            return_bool = False
+            if self.at("bool"):
+                if op not in COMPARISON_OPS:
+                    raise PromQLValidationError("bool modifier is only allowed on comparisons")
+                self.advance()
+                return_bool = True
+            self._skip_vector_matching()
+            prec = BINARY_PRECEDENCE[op]
+            rhs = self.parse_expr(prec if op == "^" else prec + 1)
+            lhs = BinaryOp(op=op, lhs=lhs, rhs=rhs, return_bool=return_bool)
+
+    def _skip_vector_matching(self) -> None:
+        if self.at("on") or self.at("ignoring"):
+            self.advance()
+            self.parse_label_list()
+        if self.at("group_left") or self.at("group_right"):
+            self.advance()
+            if self.at("("):
+                self.parse_label_list()
+
+    def parse_unary(self) -> Expr:
+        token = self.peek()
+        if token.kind == "op" and token.value in {"+", "-"}:
+            self.advance()
+            return Unary(op=token.value, expr=self.parse_expr(BINARY_PRECEDENCE["^"]))
+        return self.parse_postfix()
+
+    def parse_postfix(self) -> Expr:
+        expr = self.parse_primary()
+        while True:
+            if self.at("["):
+                expr = self.parse_range(expr)
+            elif self.at("offset"):
+                self.advance()
+                sign = -1.0 if self.peek().value == "-" else 1.0
+                if self.peek().value in {"+", "-"}:
+                    self.advance()
+                offset = sign * self.parse_duration_token()
+                if isinstance(expr, VectorSelector):
+                    expr = VectorSelector(expr.metric, expr.matchers, expr.range_seconds, offset)
+                elif isinstance(expr, Subquery):
+                    expr = Subquery(expr.expr, expr.range_seconds, expr.step_seconds, offset)
+                else:
+                    raise PromQLValidationError("offset modifier must follow a selector or subquery")
+            elif self.at("@"):
+                self.advance()
+                token = self.advance()
+                if token.kind == "ident" and token.value in {"start", "end"}:
+                    self.expect("(")
+                    self.expect(")")
+                elif token.kind != "number":
+                    raise PromQLValidationError(f"Invalid @ modifier at position {token.pos}")
+            else:
+                return expr
+
+    def parse_duration_token(self) -> float:
+        token = self.advance()
+        if token.kind != "duration":
+            raise PromQLValidationError(f"Expected duration at position {token.pos}")
+        return parse_duration(token.value)
+
+    def parse_range(self, expr: Expr) -> Expr:
+        self.expect("[")
+        range_seconds = self.parse_duration_token()
+        if self.at(":"):
+            self.advance()
+            step = None if self.at("]") else self.parse_duration_token()
+            self.expect("]")
+            return Subquery(expr=expr, range_seconds=range_seconds, step_seconds=step)
+        self.expect("]")
+        if not isinstance(expr, VectorSelector) or expr.range_seconds is not None:
+            raise PromQLValidationError("Range selector is only allowed on an instant vector selector")
+        if range_seconds <= 0:
+            raise PromQLValidationError("Range selector duration must be positive")
+        return VectorSelector(expr.metric, expr.matchers, range_seconds, expr.offset_seconds)
+
+    def parse_label_list(self) -> Tuple[str, ...]:
+        self.expect("(")
+        labels: List[str] = []
+        while not self.at(")"):
+            token = self.advance()
+            if token.kind not in {"ident", "string"}:
+                raise PromQLValidationError(f"Expected label name at position {token.pos}")
+            labels.append(token.value)
+            if not self.at(")"):
+                self.expect(",")
+        self.expect(")")
+        return tuple(labels)
+
+    def parse_args(self) -> Tuple[Expr, ...]:
+        self.expect("(")
+        args: List[Expr] = []
+        while not self.at(")"):
+            args.append(self.parse_expr(1))
+            if not self.at(")"):
+                self.expect(",")
+        self.expect(")")
+        return tuple(args)
+
+    def parse_matchers(self) -> Tuple[Matcher, ...]:
+        self.expect("{")
+        matchers: List[Matcher] = []
+        while not self.at("}"):
+            label = self.advance()
+            if label.kind not in {"ident", "string"}:
+                raise PromQLValidationError(f"Expected label matcher at position {label.pos}")
+            if self.at("}") or self.at(","):
+                # Quoted metric name shorthand: {"metric_name"}
+                matchers.append(Matcher("__name__", "=", label.value))
+            else:
+                op = self.advance()
+                if op.kind != "op" or op.value not in MATCH_OPS:
+                    raise PromQLValidationError(f"Invalid matcher operator at position {op.pos}")
+                value = self.advance()
+                if value.kind != "string":
+                    raise PromQLValidationError(f"Matcher value must be a string at position {value.pos}")
+                if op.value in {"=~", "!~"}:
+                    try:
+                        re.compile(value.value)
+                    except re.error as exc:
+                        raise PromQLValidationError(f"Invalid regex '{value.value}': {exc}") from exc
+                matchers.append(Matcher(label.value, op.value, value.value))
+            if not self.at("}"):
+                self.expect(",")
+        self.expect("}")
+        return tuple(matchers)
+
+    def parse_primary(self) -> Expr:
+        token = self.peek()
+        if token.kind == "number":
+            self.advance()
+            return NumberLiteral(float(int(token.value, 16)) if token.value.lower().startswith("0x") else float(token.value))
+        if token.kind == "duration":
+            self.advance()
+            return NumberLiteral(parse_duration(token.value))
+        if token.kind == "string":
+            self.advance()
+            return StringLiteral(token.value)
+        if self.at("("):
+            self.advance()
+            expr = self.parse_expr(1)
+            self.expect(")")
+            return expr
+        if self.at("{"):
+            matchers = self.parse_matchers()
+            if not any(_matcher_is_selective(m) for m in matchers):
+                raise PromQLValidationError("Vector selector must contain at least one non-empty matcher")
+            return VectorSelector(metric=None, matchers=matchers)
+        if token.kind == "ident":
+            name = token.value
+            lowered = name.lower()
+            if lowered in {"inf", "nan"} and self.peek(1).value not in {"{", "("}:
+                self.advance()
+                return NumberLiteral(float(lowered))
+            if lowered in AGGREGATIONS and (self.peek(1).value in {"(", "by", "without"}):
+                return self.parse_aggregation()
+            if self.peek(1).value == "(" and self.peek(1).kind == "punct":
+                return self.parse_call()
+            self.advance()
+            matchers = self.parse_matchers() if self.at("{") else ()
+            return VectorSelector(metric=name, matchers=matchers)
+        raise PromQLValidationError(
+            f"Unexpected '{token.value or 'end of query'}' at position {token.pos}"
+        )
+
+    def parse_aggregation(self) -> Aggregation:
+        op = self.advance().value.lower()
+        grouping: Tuple[str, ...] = ()
+        without = False
+        if self.at("by") or self.at("without"):
+            without = self.advance().value == "without"
+            grouping = self.parse_label_list()
+        args = self.parse_args()
+        if self.at("by") or self.at("without"):
+            without = self.advance().value == "without"
+            grouping = self.parse_label_list()
+        expected = 2 if op in PARAM_AGGREGATIONS else 1
+        if len(args) != expected:
+            raise PromQLValidationError(f"{op} expects {expected} argument(s), got {len(args)}")
+        return Aggregation(op=op, args=args, grouping=grouping, without=without)
+
+    def parse_call(self) -> Call:
+        token = self.advance()
+        func = token.value
+        if func not in RANGE_FUNCTIONS and func not in INSTANT_FUNCTIONS:
+            raise PromQLValidationError(f"Unknown function '{func}' at position {token.pos}")
+        args = self.parse_args()
+        index = RANGE_FUNCTIONS.get(func)
+        if index is not None:
+            if len(args) <= index or not _is_range_vector(args[index]):
+                raise PromQLValidationError(f"{func} expects a range vector argument")
+        return Call(func=func, args=args)
+
+
+def _matcher_is_selective(matcher: Matcher) -> bool:
+    if matcher.op in {"=", "=~"}:
+        return not re.fullmatch(matcher.value, "") if matcher.op == "=~" else matcher.value != ""
+    return False
+
+
+def _is_range_vector(expr: Expr) -> bool:
+    return isinstance(expr, Subquery) or (
+        isinstance(expr, VectorSelector) and expr.range_seconds is not None
+    )
+
+
+@lru_cache(maxsize=4096)
+def _parse_cached(query: str) -> Tuple[Optional[Expr], Optional[str]]:
+    # Failures are cached too; the same bad query is usually retried verbatim.
+    try:
+        return _Parser(tokenize(query)).parse(), None
+    except PromQLValidationError as exc:
+        return None, str(exc)
+
+
+def parse_promql(query: str) -> Expr:
+    """Parse ``query`` into an immutable AST; results are memoized per query string."""
     if not query or len(query.strip()) < 3:
         raise PromQLValidationError("Query too short")
-    if not PROMQL_ALLOWED_RE.match(query):
-        raise PromQLValidationError("Query has illegal characters")
-    if query.count("(") != query.count(")"):
-        raise PromQLValidationError("Unbalanced parentheses")
-    if query.count("[") != query.count("]"):
-        raise PromQLValidationError("Unbalanced range selectors")
+    expr, error = _parse_cached(query)
+    if error is not None:
+        raise PromQLValidationError(error)
+    return expr
+
+
+def walk(expr: Expr) -> Iterator[Expr]:
+    yield expr
+    if isinstance(expr, (Call, Aggregation)):
+        for arg in expr.args:
+            yield from walk(arg)
+    elif isinstance(expr, BinaryOp):
+        yield from walk(expr.lhs)
+        yield from walk(expr.rhs)
+    elif isinstance(expr, (Unary, Subquery)):
+        yield from walk(expr.expr)
+
+
+def validate_promql_syntax(query: str) -> bool:
+    """PromQL syntax guardrail backed by the memoized parser."""
+    parse_promql(query)
     return True
 
 
+# ---------------------------------------------------------------------------
+# Cost estimation
+# ---------------------------------------------------------------------------
+
+
+def _parse_hints(spec: str) -> Dict[str, int]:
+    hints: Dict[str, int] = {}
+    for entry in spec.split(","):
+        name, sep, count = entry.strip().partition("=")
+        if sep and name and count.strip().isdigit():
+            hints[name.strip()] = int(count)
+    return hints
+
+
+@dataclass
+class QueryBudget:
+    """Limits applied before a query reaches Prometheus.
+
+    ``cardinality_hints`` maps metric names to their approximate series count;
+    unknown metrics fall back to ``default_series``.
+    """
+
+    max_samples: int = 5_000_000
+    max_series: int = 10_000
+    scrape_interval_s: float = 15.0
+    default_series: int = 100
+    cardinality_hints: Dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls) -> "QueryBudget":
+        return cls(
+            max_samples=int(os.getenv("PROMQL_MAX_SAMPLES", "5000000")),
+            max_series=int(os.getenv("PROMQL_MAX_SERIES", "10000")),
+            scrape_interval_s=float(os.getenv("PROMQL_SCRAPE_INTERVAL_S", "15")),
+            cardinality_hints=_parse_hints(os.getenv("PROMQL_CARDINALITY_HINTS", "")),
+        )
+
+
+@dataclass
+class QueryCost:
+    steps: int
+    series: int
+    samples: int
+    selectors: int
+    max_range_seconds: float
+
+
+def _selector_series(selector: VectorSelector, budget: QueryBudget) -> int:
+    series = budget.cardinality_hints.get(selector.metric or "", budget.default_series)
+    for matcher in selector.matchers:
+        if matcher.label == "__name__":
+            continue
+        # Heuristic narrowing: equality pins a label value, regexes keep more series.
+        if matcher.op == "=":
+            series = max(series // 10, 1)
+        elif matcher.op == "=~":
+            series = max(series // 2, 1)
+    return series
+
+
+def _samples_per_eval(expr: Expr, budget: QueryBudget, step_seconds: float) -> Tuple[float, int, float]:
+    """Return (samples, series, max_range) touched by one evaluation of ``expr``."""
+    if isinstance(expr, VectorSelector):
+        series = _selector_series(expr, budget)
+        range_s = expr.range_seconds or 0.0
+        per_series = max(range_s / budget.scrape_interval_s, 1.0)
+        return series * per_series, series, range_s
+    if isinstance(expr, Subquery):
+        inner_step = expr.step_seconds or step_seconds
+        inner_evals = max(expr.range_seconds / inner_step, 1.0)
+        samples, series, range_s = _samples_per_eval(expr.expr, budget, inner_step)
+        return samples * inner_evals, series, max(range_s, expr.range_seconds)
+    children: List[Expr] = []
+    if isinstance(expr, (Call, Aggregation)):
+        children = list(expr.args)
+    elif isinstance(expr, BinaryOp):
+        children = [expr.lhs, expr.rhs]
+    elif isinstance(expr, Unary):
+        children = [expr.expr]
+    total, series, range_s = 0.0, 0, 0.0
+    for child in children:
+        child_samples, child_series, child_range = _samples_per_eval(child, budget, step_seconds)
+        total += child_samples
+        series = max(series, child_series)
+        range_s = max(range_s, child_range)
+    return total, series, range_s
+
+
+def estimate_query_cost(call: PromQLQuery, budget: Optional[QueryBudget] = None) -> QueryCost:
+    budget = budget or QueryBudget.from_env()
+    expr = parse_promql(call.query)
+    window = (call.end - call.start).total_seconds()
+    steps = int(window // call.step_seconds) + 1
+    per_eval, series, max_range = _samples_per_eval(expr, budget, call.step_seconds)
+    selectors = sum(1 for node in walk(expr) if isinstance(node, VectorSelector))
+    return QueryCost(
+        steps=steps,
+        series=series,
+        samples=int(math.ceil(per_eval * steps)),
+        selectors=selectors,
+        max_range_seconds=max_range,
+    )
+
+
+def enforce_query_budget(
+    call: PromQLQuery, budget: Optional[QueryBudget] = None, rewrite: bool = True
+) -> PromQLQuery:
+    """Reject queries over budget, or widen ``step_seconds`` until they fit when ``rewrite``."""
+    budget = budget or QueryBudget.from_env()
+    cost = estimate_query_cost(call, budget)
+    if cost.series > budget.max_series:
+        raise PromQLCostError(
+            f"Query selects ~{cost.series} series, budget is {budget.max_series}"
+        )
+    if cost.samples <= budget.max_samples:
+        return call
+    if rewrite:
+        factor = math.ceil(cost.samples / budget.max_samples)
+        step = call.step_seconds * factor
+        window = (call.end - call.start).total_seconds()
+        if step < window:
+            rewritten = call.model_copy(update={"step_seconds": int(step)})
+            if estimate_query_cost(rewritten, budget).samples <= budget.max_samples:
+                return rewritten
+    raise PromQLCostError(
+        f"Query would scan ~{cost.samples} samples, budget is {budget.max_samples}"
+    )
+
+
 def validate_time_range(start: datetime, end: datetime, step_seconds: int, max_hours: int = 24) -> None:
     if end <= start:
         raise PromQLValidationError("End must be after start")
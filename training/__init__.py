@@ -0,0 +1 @@
+"""Training utilities for incident-copilot."""
@@ -0,0 +1,365 @@
+"""Parallel, CPU-only builder for the SFT dataset.
+
+    python training/build_dataset.py --incidents data/eval_set.jsonl \
+        --history artifacts/history/incidents.db --out-dir data/training
+
+Sources are streamed in batches: the incident history database and any
+number of incident JSONL files (eval sets, exports). Incidents keep their
+recorded chunk ids and response when they have them. Otherwise chunks come
+from the ingested runbook index and a teacher model client writes the
+response. Worker processes render each example as ChatML with serving's
+:class:`~serving.prompt_builder.PromptBuilder`, so the prompt is the one the
+model sees in production, and compute
+its dedup keys; each worker loads the runbook index once and retrieves
+chunks for its own batches. The parent process drops exact and near duplicates (see
+:mod:`training.dedup`) and writes the rest to fixed-size shards plus a
+``manifest.json``. Only a bounded number of batches is in flight, so memory
+does not grow with the input.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+import numpy as np
+import typer
+
+from eval.offline_eval import ensure_retriever
+from incident_copilot import DEFAULT_ARTIFACT_DIR
+from rag.chunking import Chunk
+from rag.retriever import INDEX_FILE, Retriever
+from serving.model_client import get_model_client
+from serving.prompt_builder import PromptBuilder
+from serving.schemas import IncidentRequest, TriageResponse
+from tools.promql_tool import PromQLTool
+from training.dedup import Deduplicator, MinHashConfig, MinHasher, dedup_keys
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_SHARD_SIZE = 50_000
+MANIFEST_FILE = "manifest.json"
+# Serving-only fields that the model should not learn to emit.
+RESPONSE_EXCLUDE = {"tool_executions", "alert_group", "similar_incidents"}
+
+# One raw example: source name, incident dict, response dict or None, chunk ids or None.
+Raw = Dict[str, Any]
+
+app = typer.Typer(help="Build deduplicated ChatML training shards from incidents and runbooks.")
+
+
+def iter_history(path: Path) -> Iterator[Raw]:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute("SELECT request, response, chunk_ids FROM incidents ORDER BY id")
+        for request, response, chunk_ids in cursor:
+            yield {
+                "source": "history",
+                "incident": json.loads(request),
+                "response": json.loads(response),
+                "chunk_ids": json.loads(chunk_ids),
+            }
+    finally:
+        conn.close()
+
+
+def iter_incident_file(path: Path) -> Iterator[Raw]:
+    """Incidents, one per line; optional ``response`` and ``chunk_ids`` keys supply the target."""
+    with path.open() as f:
+        for line in f:
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            yield {
+                "source": path.stem,
+                "response": obj.pop("response", None),
+                "chunk_ids": obj.pop("chunk_ids", None),
+                "incident": obj,
+            }
+
+
+def iter_batches(sources: Sequence[Iterator[Raw]], size: int) -> Iterator[List[Raw]]:
+    batch: List[Raw] = []
+    for source in sources:
+        for raw in source:
+            batch.append(raw)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def to_chatml(messages: Sequence[Dict[str, str]]) -> str:
+    return "".join(f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>\n" for m in messages)
+
+
+@lru_cache(maxsize=1)
+def _prompt_builder() -> PromptBuilder:
+    return PromptBuilder()
+
+
+def render_messages(
+    incident: IncidentRequest, chunks: Sequence[Tuple[Chunk, float]], response: TriageResponse
+) -> List[Dict[str, str]]:
+    """Serving's prompt for ``incident`` (system message with tools, same sections and budget) plus the answer."""
+    messages = list(_prompt_builder().build(incident, chunks).messages)
+    answer = response.model_dump_json(exclude=RESPONSE_EXCLUDE, exclude_none=True)
+    return messages + [{"role": "assistant", "content": answer}]
+
+
+class _ChunkResolver:
+    """Chunk texts for recorded ids, and retrieval for incidents without any; loads the index lazily."""
+
+    def __init__(self, artifact_dir: Path, k: int):
+        self.artifact_dir = artifact_dir
+        self.k = k
+        self._retriever: Optional[Retriever] = None
+        self._by_id: Dict[str, str] = {}
+
+    def _load(self) -> Retriever:
+        if self._retriever is None:
+            self._retriever = ensure_retriever(self.artifact_dir)
+            self._by_id = {chunk.id: chunk.text for chunk in self._retriever.chunks}
+        return self._retriever
+
+    def resolve(self, batch: List[Raw]) -> None:
+        missing = [raw for raw in batch if raw["chunk_ids"] is None]
+        if missing:
+            queries = [f"{r['incident']['alert_text']}\n{r['incident'].get('logs_text', '')}" for r in missing]
+            for raw, results in zip(missing, self._load().retrieve_batch(queries, k=self.k)):
+                raw["chunk_ids"] = [chunk.id for chunk, _ in results]
+        if any(raw["chunk_ids"] for raw in batch):
+            self._load()
+        for raw in batch:
+            # Chunks dropped by a later re-ingest are skipped rather than rendered empty.
+            raw["chunks"] = [(cid, self._by_id[cid]) for cid in raw["chunk_ids"] if cid in self._by_id]
+
+
+@lru_cache(maxsize=4)
+def _hasher(config: MinHashConfig) -> MinHasher:
+    return MinHasher(config)
+
+
+@lru_cache(maxsize=4)
+def _resolver(artifact_dir: Path, k: int) -> _ChunkResolver:
+    # One per worker process, so the index is loaded once rather than per batch.
+    return _ChunkResolver(artifact_dir, k)
+
+
+def dedup_text(incident: IncidentRequest) -> str:
+    """The incident content examples are deduplicated on.
+
+    The system prompt, runbook context and (templated) answers repeat across
+    genuinely different examples, and a re-fired alert differs only in its id
+    and timestamp, so both are left out.
+    """
+    env = incident.environment
+    metrics = "; ".join(f"{m.name}{json.dumps(m.labels, sort_keys=True)}={m.value}" for m in incident.metrics_snapshot)
+    return "\n".join(
+        [
+            incident.title,
+            incident.severity,
+            f"{env.service} {env.cluster} {env.region} {env.deploy_version}",
+            incident.alert_text,
+            metrics,
+            incident.logs_text,
+        ]
+    )
+
+
+def render_batch(
+    batch: List[Raw], teacher: str, config: MinHashConfig, artifact_dir: Path, k: int
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Worker stage: chunks, ChatML records and their exact and LSH band dedup keys."""
+    _resolver(artifact_dir, k).resolve(batch)
+    client = get_model_client(teacher)
+    tool = PromQLTool(mode="mock")
+    lines: List[str] = []
+    exact = np.zeros(len(batch), dtype=np.uint64)
+    bands = np.zeros((len(batch), config.bands), dtype=np.uint64)
+    for i, raw in enumerate(batch):
+        incident = IncidentRequest(**raw["incident"])
+        chunks = [(Chunk(id=cid, text=text, metadata={}), 1.0) for cid, text in raw["chunks"]]
+        if raw["response"] is not None:
+            response = TriageResponse(**raw["response"])
+        else:
+            response = client.generate(incident, chunks, tool)
+        messages = render_messages(incident, chunks, response)
+        exact[i], bands[i] = dedup_keys(dedup_text(incident), _hasher(config))
+        record = {
+            "id": f"{raw['source']}:{incident.incident_id}",
+            "source": raw["source"],
+            "messages": messages,
+            "text": to_chatml(messages),
+        }
+        lines.append(json.dumps(record))
+    return lines, exact, bands
+
+
+class ShardWriter:
+    def __init__(self, out_dir: Path, shard_size: int, prefix: str = "train"):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.prefix = prefix
+        self.shards: List[Dict[str, Any]] = []
+        self._file: Optional[TextIO] = None
+        self._digest = hashlib.sha256()
+        self._count = 0
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+    def write(self, line: str) -> None:
+        if self._file is None:
+            name = f"{self.prefix}-{len(self.shards):05d}.jsonl"
+            self._file = (self.out_dir / name).open("w", encoding="utf-8")
+            self.shards.append({"path": name})
+        data = line + "\n"
+        self._file.write(data)
+        self._digest.update(data.encode("utf-8"))
+        self._count += 1
+        if self._count >= self.shard_size:
+            self._finish()
+
+    def _finish(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        self.shards[-1].update(records=self._count, sha256=self._digest.hexdigest())
+        self._file = None
+        self._digest = hashlib.sha256()
+        self._count = 0
+
+    def close(self) -> List[Dict[str, Any]]:
+        self._finish()
+        return self.shards
+
+
+def build_dataset(
+    out_dir: Path,
+    incident_files: Sequence[Path] = (),
+    history: Optional[Path] = None,
+    artifact_dir: Path = Path(DEFAULT_ARTIFACT_DIR),
+    teacher: str = "mock",
+    workers: int = 0,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    k: int = 3,
+    config: Optional[MinHashConfig] = None,
+    error_rate: float = 1e-4,
+) -> Dict[str, Any]:
+    """Build shards under ``out_dir`` and return the manifest written next to them."""
+    start = time.perf_counter()
+    config = config or MinHashConfig()
+    workers = workers or os.cpu_count() or 1
+    sources: List[Iterator[Raw]] = []
+    if history is not None:
+        sources.append(iter_history(history))
+    sources += [iter_incident_file(path) for path in incident_files]
+
+    if not (artifact_dir / INDEX_FILE).exists():
+        # Build the mock index once here rather than racing to build it in every worker.
+        ensure_retriever(artifact_dir)
+    dedup = Deduplicator(bands=config.bands, error_rate=error_rate)
+    writer = ShardWriter(out_dir, shard_size)
+    stats: Dict[str, Dict[str, int]] = {}
+
+    def collect(batch: List[Raw], result: Tuple[List[str], np.ndarray, np.ndarray]) -> None:
+        lines, exact, bands = result
+        for raw, line, verdict in zip(batch, lines, dedup.check_batch(exact, bands)):
+            counts = stats.setdefault(str(raw["source"]), {"read": 0, "kept": 0, "exact_duplicates": 0, "near_duplicates": 0})
+            counts["read"] += 1
+            if verdict is None:
+                counts["kept"] += 1
+                writer.write(line)
+            else:
+                counts[f"{verdict}_duplicates"] += 1
+
+    batches = iter_batches(sources, batch_size)
+    if workers <= 1:
+        for batch in batches:
+            collect(batch, render_batch(batch, teacher, config, artifact_dir, k))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Results are consumed in submission order, so output is deterministic;
+            # the window bounds how many batches are held in memory.
+            in_flight: Deque[Tuple[List[Raw], Future]] = deque()
+            for batch in batches:
+                in_flight.append((batch, pool.submit(render_batch, batch, teacher, config, artifact_dir, k)))
+                if len(in_flight) >= workers * 2:
+                    done, future = in_flight.popleft()
+                    collect(done, future.result())
+            while in_flight:
+                done, future = in_flight.popleft()
+                collect(done, future.result())
+
+    shards = writer.close()
+    manifest = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "format": "chatml",
+        "text_field": "text",
+        "records": sum(int(s["records"]) for s in shards),
+        "shards": shards,
+        "sources": stats,
+        "teacher": teacher,
+        "dedup": {
+            **asdict(config),
+            "rows": config.rows,
+            "threshold": round(config.threshold, 4),
+            "error_rate": error_rate,
+            "filter_bytes": dedup.nbytes,
+        },
+        "elapsed_s": round(time.perf_counter() - start, 3),
+    }
+    (out_dir / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def shard_paths(path: Path) -> List[str]:
+    """Data files for a dataset path: the shards listed in a manifest directory, or the file itself."""
+    if path.is_dir():
+        manifest = json.loads((path / MANIFEST_FILE).read_text())
+        return [str(path / shard["path"]) for shard in manifest["shards"]]
+    return [str(path)]
+
+
+@app.command()
+def build(
+    out_dir: Path = typer.Option(Path("data/training"), help="Directory for shards and manifest.json."),
+    incidents: List[Path] = typer.Option([], help="Incident JSONL files (eval sets, exports); repeatable."),
+    history: Optional[Path] = typer.Option(None, help="Incident history SQLite database."),
+    artifact_dir: Path = typer.Option(Path(DEFAULT_ARTIFACT_DIR), help="Ingested runbook index."),
+    teacher: str = typer.Option("mock", help="Model mode that writes responses for unlabeled incidents."),
+    workers: int = typer.Option(0, help="Worker processes (0 = all CPUs)."),
+    batch_size: int = typer.Option(DEFAULT_BATCH_SIZE, help="Examples per worker task."),
+    shard_size: int = typer.Option(DEFAULT_SHARD_SIZE, help="Examples per output shard."),
+    num_perm: int = typer.Option(MinHashConfig.num_perm, help="MinHash permutations."),
+    bands: int = typer.Option(MinHashConfig.bands, help="LSH bands (num_perm must be a multiple)."),
+):
+    if history is None and not incidents:
+        typer.echo("Nothing to build: pass --history and/or --incidents.")
+        raise typer.Exit(code=1)
+    manifest = build_dataset(
+        out_dir,
+        incidents,
+        history=history,
+        artifact_dir=artifact_dir,
+        teacher=teacher,
+        workers=workers,
+        batch_size=batch_size,
+        shard_size=shard_size,
+        config=MinHashConfig(num_perm=num_perm, bands=bands),
+    )
+    typer.echo(json.dumps({k: manifest[k] for k in ("records", "sources", "elapsed_s")}, indent=2))
+    typer.echo(f"Wrote {len(manifest['shards'])} shards to {out_dir}")
+
+
+if __name__ == "__main__":
+    app()
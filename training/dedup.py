@@ -0,0 +1,200 @@
+"""Exact and near-duplicate detection for training examples in bounded memory.
+
+Workers turn each example into keys with :func:`dedup_keys`: a 64-bit hash
+of the normalized text, plus one 64-bit key per LSH band of a MinHash
+signature over word shingles. Two texts share a band key with probability
+``1 - (1 - J**r)**b`` for Jaccard similarity ``J``, ``b`` bands and ``r``
+rows per band, so near-duplicates almost always collide and unrelated
+texts almost never do. The coordinating process only keeps the keys, in
+scalable Bloom filters, so memory grows with the number of kept examples
+at about 20 bits per key instead of storing signatures. The cost is that a
+small, configurable fraction of unique examples is dropped as a false
+positive.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import re
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional, Set, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+")
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 16
+DEFAULT_SHINGLE = 5
+
+
+@dataclass(frozen=True)
+class MinHashConfig:
+    num_perm: int = DEFAULT_NUM_PERM
+    bands: int = DEFAULT_BANDS
+    shingle: int = DEFAULT_SHINGLE
+    seed: int = 0
+
+    @property
+    def rows(self) -> int:
+        return self.num_perm // self.bands
+
+    @property
+    def threshold(self) -> float:
+        """Jaccard similarity at which a pair collides in some band with probability ~0.5."""
+        return float((1 / self.bands) ** (1 / self.rows))
+
+
+def normalize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _shingle_hashes(tokens: List[str], size: int) -> np.ndarray:
+    grams = [" ".join(tokens[i : i + size]) for i in range(max(len(tokens) - size + 1, 1))]
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+class MinHasher:
+    def __init__(self, config: Optional[MinHashConfig] = None):
+        config = config or MinHashConfig()
+        if config.num_perm % config.bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.config = config
+        rng = np.random.default_rng(config.seed)
+        # a, b < 2**32 and crc32 values < 2**32, so a * x + b cannot overflow uint64.
+        self._a = rng.integers(1, 2**32, config.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2**32, config.num_perm, dtype=np.uint64)
+        self._band_mix = rng.integers(1, 2**63, config.rows, dtype=np.uint64) | np.uint64(1)
+
+    def signature(self, tokens: List[str]) -> np.ndarray:
+        hashes = _shingle_hashes(tokens, self.config.shingle)
+        signature: np.ndarray = ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % MERSENNE_PRIME).min(axis=1)
+        return signature
+
+    def band_keys(self, signature: np.ndarray) -> np.ndarray:
+        bands = signature.reshape(self.config.bands, self.config.rows)
+        with np.errstate(over="ignore"):
+            keys: np.ndarray = (bands * self._band_mix).sum(axis=1)
+            # Salt with the band index so equal rows in different bands never match.
+            salted: np.ndarray = keys ^ (np.arange(self.config.bands, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+        return salted
+
+
+def dedup_keys(text: str, hasher: MinHasher) -> Tuple[int, np.ndarray]:
+    """Exact-match key and LSH band keys for ``text``."""
+    tokens = normalize(text)
+    exact = int.from_bytes(hashlib.blake2b(" ".join(tokens).encode("utf-8"), digest_size=8).digest(), "little")
+    return exact, hasher.band_keys(hasher.signature(tokens))
+
+
+def _mix(keys: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: a second, independent hash for double hashing."""
+    with np.errstate(over="ignore"):
+        z = keys + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 64)
+        self.hashes = max(round(self.bits / capacity * math.log(2)), 1)
+        self.count = 0
+        self._array = np.zeros((self.bits + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, keys: np.ndarray) -> np.ndarray:
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            return (keys[:, None] + steps[None, :] * (_mix(keys)[:, None] | np.uint64(1))) % np.uint64(self.bits)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        pos = self._positions(keys)
+        found: np.ndarray = ((self._array[pos >> np.uint64(3)] >> (pos & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1)
+        return found
+
+    def add(self, keys: np.ndarray) -> None:
+        pos = np.sort(self._positions(keys).ravel())
+        byte = pos >> np.uint64(3)
+        masks = (1 << (pos & np.uint64(7))).astype(np.uint8)
+        # OR together masks landing on the same byte (ufunc.at is much slower).
+        starts = np.flatnonzero(np.r_[True, byte[1:] != byte[:-1]])
+        self._array[byte[starts]] |= np.bitwise_or.reduceat(masks, starts)
+        self.count += len(keys)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._array.nbytes)
+
+
+class ScalableBloomFilter:
+    """Bloom filters that double in capacity when full, tightening the error rate each time."""
+
+    def __init__(self, initial_capacity: int = 1_000_000, error_rate: float = 1e-4):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.filters: List[BloomFilter] = [BloomFilter(initial_capacity, error_rate / 2)]
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(keys), dtype=bool)
+        for bloom in self.filters:
+            found |= bloom.contains(keys)
+        return found
+
+    def add(self, keys: np.ndarray) -> None:
+        current = self.filters[-1]
+        if current.count + len(keys) > current.capacity:
+            # Geometric error rates keep the total false-positive rate under error_rate.
+            level = len(self.filters) + 1
+            current = BloomFilter(current.capacity * 2, self.error_rate / 2**level)
+            self.filters.append(current)
+        current.add(keys)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(bloom.nbytes for bloom in self.filters)
+
+
+class Deduplicator:
+    """Keeps the first example of every exact or near-duplicate cluster."""
+
+    def __init__(self, bands: int = DEFAULT_BANDS, initial_capacity: int = 1_000_000, error_rate: float = 1e-4):
+        self.exact = ScalableBloomFilter(initial_capacity, error_rate)
+        # Any of an example's band keys can collide, so split the error budget across them.
+        self.bands = ScalableBloomFilter(initial_capacity * bands, error_rate / bands)
+
+    def check(self, exact_key: int, band_keys: np.ndarray) -> Optional[str]:
+        """Returns "exact" or "near" for a duplicate; otherwise records the example and returns None."""
+        return self.check_batch(np.array([exact_key], dtype=np.uint64), band_keys[None, :])[0]
+
+    def check_batch(self, exact_keys: np.ndarray, band_keys: np.ndarray) -> List[Optional[str]]:
+        """:meth:`check` for ``n`` examples in order; ``band_keys`` has shape ``(n, bands)``.
+
+        Filter lookups are vectorized over the batch; only duplicates within
+        the batch itself need a per-example pass.
+        """
+        seen_exact = self.exact.contains(exact_keys)
+        seen_near = np.asarray(self.bands.contains(band_keys.ravel()).reshape(band_keys.shape).any(axis=1))
+        batch_exact: Set[int] = set()
+        batch_bands: Set[int] = set()
+        verdicts: List[Optional[str]] = []
+        for exact, bands, was_exact, was_near in zip(exact_keys.tolist(), band_keys.tolist(), seen_exact, seen_near):
+            if was_exact or exact in batch_exact:
+                verdicts.append("exact")
+            elif was_near or not batch_bands.isdisjoint(bands):
+                verdicts.append("near")
+            else:
+                verdicts.append(None)
+                batch_exact.add(exact)
+                batch_bands.update(bands)
+        kept = np.array([v is None for v in verdicts])
+        if kept.any():
+            self.exact.add(exact_keys[kept])
+            self.bands.add(band_keys[kept].ravel())
+        return verdicts
+
+    @property
+    def nbytes(self) -> int:
+        return self.exact.nbytes + self.bands.nbytes
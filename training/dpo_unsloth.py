@@ -1,25 +1,42 @@
 """
 Scaffold for DPO training with Unsloth + TRL.
-Fill in dataset loading and objective once preference data is available.
+Preference data is loaded and packed (see training/packing.py); fill in the
+objective once preference data is available.
 """
 
+import json
+from pathlib import Path
+from typing import Optional
+
 import typer
 
+from serving.tokenizer import get_tokenizer
+from training.packing import DEFAULT_MAX_SEQ_LENGTH, iter_records, pack_dpo_dataset
 
 app = typer.Typer(help="DPO training scaffold (placeholder).")
 
 
 @app.command()
 def train(
-    data_path: str = typer.Argument(..., help="Path to preference data (jsonl with chosen/rejected)."),
+    data_path: str = typer.Argument(..., help="Path to preference data (jsonl with prompt/chosen/rejected)."),
     base_model: str = typer.Option("unsloth/llama-3-8b-bnb-4bit"),
     output_dir: str = typer.Option("artifacts/adapters/dpo-run"),
+    tokenizer: Optional[str] = typer.Option(
+        None, help="Local tokenizer directory for packing (default PROMPT_TOKENIZER, else the approximation)."
+    ),
+    max_seq_length: int = typer.Option(DEFAULT_MAX_SEQ_LENGTH, help="Packed sequence length in tokens."),
 ):
+    rows, stats = pack_dpo_dataset(
+        iter_records(Path(data_path)),  # type: ignore[arg-type]
+        get_tokenizer(tokenizer).encode,
+        max_seq_length,
+    )
+    typer.echo(f"Packed {stats.examples // 2} pairs into {len(rows)} sequences: {json.dumps(stats.as_dict())}")
     typer.echo(
         "TODO: implement DPO training. Expected steps:\n"
-        "- Load pairwise preference dataset.\n"
         "- Initialize Unsloth FastLanguageModel with QLoRA adapters.\n"
-        "- Use TRL DPOTrainer to optimize on preferences.\n"
+        "- Batch packed rows with PackedCollator(return_segment_ids=True).\n"
+        "- Score chosen/rejected with segment_logps (segments 2i+1 and 2i+2 form pair i) for the DPO loss.\n"
         "- Save adapters to output_dir."
     )
 
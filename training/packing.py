@@ -0,0 +1,368 @@
+"""Length-sorted sequence packing for SFT and DPO training data.
+
+Unpacked, every triage example takes a whole ``max_seq_length`` row (or a
+whole training step at ``micro_batch_size=1``) although most are a fraction
+of that long. Here examples are tokenized once, sorted by length and packed
+best-fit-decreasing into rows of at most ``max_seq_length`` tokens. Each
+packed row keeps the boundaries of its examples:
+
+- ``position_ids`` restart at 0 for every example, so padding-free
+  attention kernels (flash-attention varlen, ``DataCollatorWithFlattening``)
+  see separate sequences; :func:`block_causal_mask` builds the equivalent
+  4D mask for eager/SDPA attention.
+- the first label of every example is ``-100``, so no token is trained to
+  predict the start of the next example from the end of the previous one.
+- SFT labels cover only assistant turns; DPO pairs are packed chosen then
+  rejected into the same row, and :func:`segment_logps` sums per-example
+  log-probabilities for the loss.
+
+The report command packs a dataset on CPU and prints the efficiency:
+
+    python training/packing.py data/training --tokenizer <tokenizer dir> --max-seq-length 4096
+"""
+from __future__ import annotations
+
+import bisect
+import json
+import random
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import typer
+
+from serving.tokenizer import get_tokenizer
+
+IGNORE_INDEX = -100
+DEFAULT_MAX_SEQ_LENGTH = 4096
+
+Encode = Callable[[str], List[int]]
+
+app = typer.Typer(help="Report sequence-packing efficiency for a training dataset.")
+
+
+@dataclass
+class Example:
+    input_ids: List[int]
+    labels: List[int]
+    truncated: bool = False
+
+    def __len__(self) -> int:
+        return len(self.input_ids)
+
+
+@dataclass
+class PackedSequence:
+    input_ids: List[int] = field(default_factory=list)
+    labels: List[int] = field(default_factory=list)
+    position_ids: List[int] = field(default_factory=list)
+    # 1-based example number within the row; the collator pads with 0.
+    segment_ids: List[int] = field(default_factory=list)
+
+    def add(self, example: Example) -> None:
+        if not example:
+            return
+        segment = (self.segment_ids[-1] if self.segment_ids else 0) + 1
+        self.input_ids.extend(example.input_ids)
+        self.labels.append(IGNORE_INDEX)
+        self.labels.extend(example.labels[1:])
+        self.position_ids.extend(range(len(example)))
+        self.segment_ids.extend([segment] * len(example))
+
+    def __len__(self) -> int:
+        return len(self.input_ids)
+
+
+@dataclass
+class PackingStats:
+    examples: int
+    sequences: int
+    tokens: int
+    max_seq_length: int
+    truncated: int = 0
+
+    @property
+    def efficiency(self) -> float:
+        """Share of packed row capacity holding real tokens."""
+        return self.tokens / max(self.sequences * self.max_seq_length, 1)
+
+    @property
+    def unpacked_efficiency(self) -> float:
+        """The same share with one example per row."""
+        return self.tokens / max(self.examples * self.max_seq_length, 1)
+
+    @property
+    def speedup(self) -> float:
+        """Fewer rows per epoch, so fewer steps at a fixed micro batch size."""
+        return self.examples / max(self.sequences, 1)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            **asdict(self),
+            "efficiency": round(self.efficiency, 4),
+            "unpacked_efficiency": round(self.unpacked_efficiency, 4),
+            "speedup": round(self.speedup, 2),
+        }
+
+
+def _chatml_turn(role: str, content: str) -> Tuple[str, str]:
+    """A ChatML turn split into its header and its trainable body."""
+    return f"<|im_start|>{role}\n", f"{content}<|im_end|>\n"
+
+
+def _truncate(input_ids: List[int], labels: List[int], max_len: int) -> Example:
+    if len(input_ids) <= max_len:
+        return Example(input_ids, labels)
+    return Example(input_ids[:max_len], labels[:max_len], truncated=True)
+
+
+def _bos(bos_token_id: Optional[int]) -> List[int]:
+    # Packing bypasses the tokenizer's special tokens, so BOS is added per example,
+    # as the unpacked trainer and inference do.
+    return [] if bos_token_id is None else [bos_token_id]
+
+
+def tokenize_messages(
+    messages: Sequence[Dict[str, str]], encode: Encode, max_len: int, bos_token_id: Optional[int] = None
+) -> Example:
+    """Token ids for a ChatML conversation; only assistant turns carry labels."""
+    input_ids: List[int] = _bos(bos_token_id)
+    labels: List[int] = [IGNORE_INDEX] * len(input_ids)
+    for message in messages:
+        header, body = _chatml_turn(message["role"], message["content"])
+        head_ids, body_ids = encode(header), encode(body)
+        input_ids.extend(head_ids + body_ids)
+        labels.extend([IGNORE_INDEX] * len(head_ids))
+        labels.extend(body_ids if message["role"] == "assistant" else [IGNORE_INDEX] * len(body_ids))
+    return _truncate(input_ids, labels, max_len)
+
+
+def tokenize_record(
+    record: Dict[str, object], encode: Encode, max_len: int, bos_token_id: Optional[int] = None
+) -> Example:
+    """SFT example from a ``messages`` record, else trains on the whole ``text``."""
+    if record.get("messages"):
+        return tokenize_messages(record["messages"], encode, max_len, bos_token_id)  # type: ignore[arg-type]
+    bos = _bos(bos_token_id)
+    ids = encode(str(record["text"]))
+    return _truncate(bos + ids, [IGNORE_INDEX] * len(bos) + ids, max_len)
+
+
+def tokenize_preference(
+    record: Dict[str, str], encode: Encode, max_len: int, bos_token_id: Optional[int] = None
+) -> Tuple[Example, Example]:
+    """Chosen and rejected examples for a ``prompt``/``chosen``/``rejected`` record.
+
+    The prompt is used as-is (ChatML text or plain), and the labels cover
+    only the completion. Each side is truncated to ``max_len // 2`` so a pair
+    always fits in one packed row.
+    """
+    prompt_ids = _bos(bos_token_id) + encode(record["prompt"])
+    pair = []
+    for key in ("chosen", "rejected"):
+        completion = encode(record[key])
+        pair.append(
+            _truncate(prompt_ids + completion, [IGNORE_INDEX] * len(prompt_ids) + completion, max_len // 2)
+        )
+    return pair[0], pair[1]
+
+
+def pack(lengths: Sequence[int], max_len: int) -> List[List[int]]:
+    """Best-fit-decreasing bins of item indices, each summing to at most ``max_len``.
+
+    Items are placed longest first into the fullest row that still has
+    room, which keeps rows near full while staying O(n log n) in practice.
+    """
+    if any(n > max_len for n in lengths):
+        raise ValueError("every item must fit in max_len; truncate first")
+    bins: List[List[int]] = []
+    # Parallel sorted lists of (remaining capacity, bin index).
+    free: List[int] = []
+    owners: List[int] = []
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True):
+        size = lengths[index]
+        slot = bisect.bisect_left(free, size)
+        if slot == len(free):
+            bins.append([index])
+            remaining, owner = max_len - size, len(bins) - 1
+        else:
+            remaining, owner = free.pop(slot) - size, owners.pop(slot)
+            bins[owner].append(index)
+        if remaining > 0:
+            slot = bisect.bisect_left(free, remaining)
+            free.insert(slot, remaining)
+            owners.insert(slot, owner)
+    return bins
+
+
+def pack_examples(examples: Sequence[Example], max_len: int) -> Tuple[List[PackedSequence], PackingStats]:
+    rows: List[PackedSequence] = []
+    for bin_ in pack([len(e) for e in examples], max_len):
+        row = PackedSequence()
+        for index in bin_:
+            row.add(examples[index])
+        rows.append(row)
+    stats = PackingStats(
+        examples=len(examples),
+        sequences=len(rows),
+        tokens=sum(len(e) for e in examples),
+        max_seq_length=max_len,
+        truncated=sum(e.truncated for e in examples),
+    )
+    return rows, stats
+
+
+def pack_preferences(
+    pairs: Sequence[Tuple[Example, Example]], max_len: int
+) -> Tuple[List[PackedSequence], PackingStats]:
+    """Packs whole pairs, chosen then rejected: segments ``2i+1``/``2i+2`` of a row are pair ``i``."""
+    rows: List[PackedSequence] = []
+    for bin_ in pack([len(c) + len(r) for c, r in pairs], max_len):
+        row = PackedSequence()
+        for index in bin_:
+            row.add(pairs[index][0])
+            row.add(pairs[index][1])
+        rows.append(row)
+    stats = PackingStats(
+        examples=2 * len(pairs),
+        sequences=len(rows),
+        tokens=sum(len(c) + len(r) for c, r in pairs),
+        max_seq_length=max_len,
+        truncated=sum(c.truncated or r.truncated for c, r in pairs),
+    )
+    return rows, stats
+
+
+def length_batches(lengths: Sequence[int], batch_size: int, seed: int = 0) -> List[List[int]]:
+    """Indices grouped into batches of similar length, in shuffled batch order.
+
+    For unpacked training: padding to the longest item of a batch wastes
+    little when the batch is length-sorted, and shuffling the batches keeps
+    the step order from running short to long.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+    random.Random(seed).shuffle(batches)
+    return batches
+
+
+def block_causal_mask(segment_ids):
+    """``(batch, 1, seq, seq)`` boolean mask: causal, and only within an example.
+
+    Padding (segment 0) attends only to itself so no row is fully masked.
+    """
+    import torch
+
+    seq_len = segment_ids.shape[-1]
+    causal = torch.ones(seq_len, seq_len, dtype=torch.bool, device=segment_ids.device).tril()
+    same = segment_ids[:, :, None] == segment_ids[:, None, :]
+    eye = torch.eye(seq_len, dtype=torch.bool, device=segment_ids.device)
+    padding = (segment_ids == 0)[:, :, None]
+    return ((same & causal & ~padding) | (eye & padding))[:, None]
+
+
+class PackedCollator:
+    """Pads packed rows to the longest in the micro batch and builds tensors.
+
+    With ``four_d_mask`` the batch carries :func:`block_causal_mask` as an
+    additive float ``attention_mask`` (the form transformers takes for
+    custom 4D masks); otherwise only ``position_ids`` mark the example
+    boundaries, as padding-free flash-attention expects. DPO trainers set
+    ``return_segment_ids`` to get the ids :func:`segment_logps` needs.
+    """
+
+    def __init__(self, pad_token_id: int = 0, four_d_mask: bool = False, return_segment_ids: bool = False):
+        self.pad_token_id = pad_token_id
+        self.four_d_mask = four_d_mask
+        self.return_segment_ids = return_segment_ids
+
+    def __call__(self, rows: Sequence[Dict[str, List[int]]]) -> Dict[str, object]:
+        import torch
+
+        width = max(len(row["input_ids"]) for row in rows)
+
+        def padded(key: str, value: int) -> "torch.Tensor":
+            return torch.tensor([row[key] + [value] * (width - len(row[key])) for row in rows])
+
+        batch: Dict[str, object] = {
+            "input_ids": padded("input_ids", self.pad_token_id),
+            "labels": padded("labels", IGNORE_INDEX),
+            "position_ids": torch.tensor(
+                [row["position_ids"] + list(range(width - len(row["position_ids"]))) for row in rows]
+            ),
+        }
+        segment_ids = padded("segment_ids", 0)
+        if self.four_d_mask:
+            allowed = block_causal_mask(segment_ids)
+            batch["attention_mask"] = torch.zeros(allowed.shape).masked_fill(
+                ~allowed, torch.finfo(torch.float32).min
+            )
+        if self.return_segment_ids:
+            batch["segment_ids"] = segment_ids
+        return batch
+
+
+def segment_logps(logits, labels, segment_ids, num_segments: int):
+    """Summed log-probability of the labelled tokens of each example in a packed batch.
+
+    Returns ``(batch, num_segments)``; column ``j`` is segment ``j + 1``.
+    Uses the causal shift (logits at ``t`` predict the label at ``t + 1``),
+    and first-token labels are ignored, so nothing crosses an example boundary.
+    """
+    import torch
+
+    logits, labels, segment_ids = logits[:, :-1], labels[:, 1:], segment_ids[:, 1:]
+    mask = labels != IGNORE_INDEX
+    token_logps = torch.gather(
+        logits.log_softmax(-1), 2, labels.clamp(min=0).unsqueeze(-1)
+    ).squeeze(-1) * mask
+    out = torch.zeros(labels.shape[0], num_segments + 1, dtype=token_logps.dtype, device=logits.device)
+    out.scatter_add_(1, segment_ids * mask, token_logps)
+    return out[:, 1:]
+
+
+def iter_records(path: Path) -> Iterator[Dict[str, object]]:
+    """Records from a jsonl file or a shard directory written by ``build_dataset.py``."""
+    from training.build_dataset import shard_paths
+
+    for shard in shard_paths(path):
+        with open(shard, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def pack_sft_dataset(
+    records: Iterable[Dict[str, object]], encode: Encode, max_len: int, bos_token_id: Optional[int] = None
+) -> Tuple[List[Dict[str, List[int]]], PackingStats]:
+    rows, stats = pack_examples([tokenize_record(r, encode, max_len, bos_token_id) for r in records], max_len)
+    return [asdict(row) for row in rows], stats
+
+
+def pack_dpo_dataset(
+    records: Iterable[Dict[str, str]], encode: Encode, max_len: int, bos_token_id: Optional[int] = None
+) -> Tuple[List[Dict[str, List[int]]], PackingStats]:
+    rows, stats = pack_preferences(
+        [tokenize_preference(r, encode, max_len, bos_token_id) for r in records], max_len
+    )
+    return [asdict(row) for row in rows], stats
+
+
+@app.command()
+def report(
+    data_path: Path = typer.Argument(..., help="ChatML jsonl file or shard directory."),
+    tokenizer: Optional[str] = typer.Option(
+        None, help="Local tokenizer directory (default PROMPT_TOKENIZER, else the approximation)."
+    ),
+    max_seq_length: int = typer.Option(DEFAULT_MAX_SEQ_LENGTH, help="Packed row length in tokens."),
+    preferences: bool = typer.Option(False, help="Data is prompt/chosen/rejected pairs."),
+):
+    """Packs the dataset on CPU and prints packing efficiency."""
+    encode = get_tokenizer(tokenizer).encode
+    pack_fn = pack_dpo_dataset if preferences else pack_sft_dataset
+    _, stats = pack_fn(iter_records(data_path), encode, max_seq_length)  # type: ignore[arg-type]
+    typer.echo(json.dumps(stats.as_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    app()
@@ -1,56 +1,90 @@
 from __future__ import annotations
 
+import importlib.util
 import json
 import os
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 import typer
 
+from training.packing import DEFAULT_MAX_SEQ_LENGTH, PackedCollator, iter_records, pack_sft_dataset
+
 DEFAULT_BASE_MODEL = os.getenv("BASE_MODEL_NAME", "unsloth/llama-3-8b-bnb-4bit")
 
 
 app = typer.Typer(help="Unsloth QLoRA SFT trainer for incident-copilot.")
 
 
+def packed_attention(four_d_mask: bool) -> Tuple[str, bool]:
+    """Attention implementation and mask mode that keep packed examples apart.
+
+    Without a 4D mask only ``position_ids`` mark the boundaries, which only
+    varlen flash-attention honours; any other kernel would attend across
+    examples. When ``flash_attn`` is missing this falls back to SDPA with
+    the block-diagonal 4D mask rather than failing the default invocation.
+    """
+    if four_d_mask:
+        return "sdpa", True
+    if importlib.util.find_spec("flash_attn") is None:
+        typer.echo("flash-attn is not installed; packing with a 4D attention mask (SDPA) instead.", err=True)
+        return "sdpa", True
+    return "flash_attention_2", False
+
+
 def _load_dataset(path: Path):
     from datasets import load_dataset  # type: ignore
 
-    return load_dataset("json", data_files=str(path), split="train")
+    from training.build_dataset import shard_paths
+
+    return load_dataset("json", data_files=shard_paths(path), split="train")
 
 
 @app.command()
 def train(
-    data_path: Path = typer.Argument(..., help="Path to ChatML/ShareGPT-like jsonl training data."),
+    data_path: Path = typer.Argument(
+        ..., help="ChatML jsonl file, or a directory of shards written by training/build_dataset.py."
+    ),
     output_dir: Path = typer.Option(Path("artifacts/adapters"), help="Where to store adapters."),
     base_model: str = typer.Option(DEFAULT_BASE_MODEL, help="Base model to fine-tune."),
     run_id: Optional[str] = typer.Option(None, help="Run identifier for output folder."),
     max_steps: int = typer.Option(100, help="Max training steps."),
     lr: float = typer.Option(2e-4, help="Learning rate."),
     micro_batch_size: int = typer.Option(1, help="Micro batch size."),
+    max_seq_length: int = typer.Option(DEFAULT_MAX_SEQ_LENGTH, help="Sequence length in tokens."),
+    pack: bool = typer.Option(True, help="Pack several examples per sequence (see training/packing.py)."),
+    four_d_mask: bool = typer.Option(
+        False,
+        help="Pass a block-diagonal 4D attention mask (SDPA) instead of position_ids; automatic without flash-attn.",
+    ),
 ):
     """
     Fine-tune a base model with QLoRA adapters using Unsloth's FastLanguageModel helper.
     Requires GPU with sufficient VRAM; defaults to 4-bit loading for efficiency.
     """
+    # Packed rows need an attention kernel that respects example boundaries.
+    attention: Dict[str, str] = {}
+    if pack:
+        attn_implementation, four_d_mask = packed_attention(four_d_mask)
+        attention = {"attn_implementation": attn_implementation}
     try:
         from unsloth import FastLanguageModel  # type: ignore
         from trl import SFTTrainer  # type: ignore
-        from transformers import TrainingArguments  # type: ignore
+        from transformers import Trainer, TrainingArguments  # type: ignore
     except Exception as exc:  # pragma: no cover - runtime dependency
         typer.echo(f"Unsloth/TRL not installed or GPU unavailable: {exc}")
         raise typer.Exit(code=1)
 
-    ds = _load_dataset(data_path)
     run_folder = output_dir / (run_id or datetime.utcnow().strftime("%Y%m%d-%H%M%S"))
     run_folder.mkdir(parents=True, exist_ok=True)
 
     model, tokenizer = FastLanguageModel.from_pretrained(
         model_name=base_model,
-        max_seq_length=4096,
+        max_seq_length=max_seq_length,
         dtype=None,
         load_in_4bit=True,
+        **attention,
     )
     model = FastLanguageModel.get_peft_model(model, r=16, target_modules=["q_proj", "v_proj"])
 
@@ -64,15 +98,36 @@ def train(
         logging_steps=10,
         save_strategy="no",
         report_to=[],
+        # Packed rows carry segment_ids for the collator, which the model does not take.
+        remove_unused_columns=not pack,
     )
 
-    trainer = SFTTrainer(
-        model=model,
-        tokenizer=tokenizer,
-        train_dataset=ds,
-        dataset_text_field="text",
-        args=training_args,
-    )
+    if pack:
+        from datasets import Dataset  # type: ignore
+
+        rows, stats = pack_sft_dataset(
+            iter_records(data_path),
+            lambda text: tokenizer(text, add_special_tokens=False)["input_ids"],
+            max_seq_length,
+            bos_token_id=tokenizer.bos_token_id,
+        )
+        (run_folder / "packing.json").write_text(json.dumps(stats.as_dict(), indent=2))
+        typer.echo(f"Packing: {json.dumps(stats.as_dict())}")
+        trainer = Trainer(
+            model=model,
+            args=training_args,
+            train_dataset=Dataset.from_list(rows),
+            data_collator=PackedCollator(pad_token_id=tokenizer.pad_token_id or 0, four_d_mask=four_d_mask),
+        )
+    else:
+        trainer = SFTTrainer(
+            model=model,
+            tokenizer=tokenizer,
+            train_dataset=_load_dataset(data_path),
+            dataset_text_field="text",
+            max_seq_length=max_seq_length,
+            args=training_args,
+        )
     trainer.train()
     model.save_pretrained(run_folder)
     tokenizer.save_pretrained(run_folder)